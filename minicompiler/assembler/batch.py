@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+from itertools import chain
+import numpy as np
+from minicompiler.assembler.tokens import Token, Instruction, registers, conditions, opcodes, _mem, _pageoff, PAIR_POST, PAIR_OFFSET, PAIR_PRE
+from minicompiler.assembler.tokens import MOV, MOVZ, MOVN, MOVK, ADR, ADRP, B, BL, ADD, SUB, MUL, SDIV, NEG, STR, LDR, STP, LDP, SVC, RET
+from minicompiler.assembler.tokens import BCOND, CBZ, CBNZ, CMP, CSET
+
+
+# encoding forms, every instruction is base | fields
+R3 = 0     # rm << 16 | rn << 5 | rd
+I12 = 1    # imm12 << 10 | rn << 5 | rd
+WIDE = 2   # hw:imm16 << 5 | rd
+PCREL = 3  # immlo << 29 | immhi << 5 | rd
+EXC = 4    # imm16 << 5
+FIXED = 5  # no operands
+BRANCH = 6 # imm26 (in instructions)
+PAIR = 7   # imm7 << 15 | rm (second register) << 10 | rn << 5 | rd
+CBRANCH = 8  # imm19 (in instructions) << 5 | rd (condition or tested register)
+CSEL = 9   # rm << 16 | cond << 12 | rn << 5 | rd
+
+# op -> (form, base), the op column indexes into this table
+OPS: list[tuple[str, int, int]] = [
+    ('MOVZ', WIDE, 1 << 31 | 0b10 << 29 | opcodes['movz'] << 23),
+    ('MOVN', WIDE, 1 << 31 | 0b00 << 29 | opcodes['movz'] << 23),
+    ('MOVK', WIDE, 1 << 31 | 0b11 << 29 | opcodes['movz'] << 23),
+    ('ORR', R3, 0b101010100 << 23),
+    ('ADD', R3, opcodes['add'] << 21),
+    ('SUB', R3, opcodes['sub'] << 21),
+    ('MADD', R3, opcodes['madd'] << 21 | 0b11111 << 10),
+    ('SDIV', R3, opcodes['sdiv'] << 21 | 0b000011 << 10),
+    ('ADDI', I12, opcodes['addi'] << 22),
+    ('SUBI', I12, opcodes['subi'] << 22),
+    ('STR', I12, opcodes['str'] << 22),
+    ('LDR', I12, opcodes['ldr'] << 22),
+    ('ADR', PCREL, opcodes['adr'] << 24),
+    ('SVC', EXC, 0b11010100000 << 21 | 0b00001),
+    ('RET', FIXED, 0b11010110 << 24 | 0b10 << 21 | 0b11111 << 16 | registers['X30'] << 5),
+    ('ADRP', PCREL, 1 << 31 | opcodes['adr'] << 24),
+    ('B', BRANCH, opcodes['b'] << 26),
+    ('BL', BRANCH, opcodes['bl'] << 26),
+    ('STP', PAIR, opcodes['stp'] << 25 | PAIR_OFFSET << 23),
+    ('LDP', PAIR, opcodes['stp'] << 25 | PAIR_OFFSET << 23 | 1 << 22),
+    ('STP_PRE', PAIR, opcodes['stp'] << 25 | PAIR_PRE << 23),
+    ('LDP_PRE', PAIR, opcodes['stp'] << 25 | PAIR_PRE << 23 | 1 << 22),
+    ('STP_POST', PAIR, opcodes['stp'] << 25 | PAIR_POST << 23),
+    ('LDP_POST', PAIR, opcodes['stp'] << 25 | PAIR_POST << 23 | 1 << 22),
+    ('BCOND', CBRANCH, opcodes['bcond'] << 24),
+    ('CBZ', CBRANCH, 1 << 31 | opcodes['cbz'] << 25),
+    ('CBNZ', CBRANCH, 1 << 31 | opcodes['cbz'] << 25 | 1 << 24),
+    ('SUBS', R3, opcodes['subs'] << 21),
+    ('SUBSI', I12, opcodes['subsi'] << 22),
+    ('CSINC', CSEL, opcodes['csinc'] << 21 | 0b01 << 10),
+]
+
+# pair addressing mode -> op name suffix
+PAIR_MODES = {PAIR_OFFSET: '', PAIR_PRE: '_PRE', PAIR_POST: '_POST'}
+
+OP = {name: i for i, (name, _, _) in enumerate(OPS)}
+FORMS = np.array([x[1] for x in OPS], dtype=np.uint8)
+BASES = np.array([x[2] for x in OPS], dtype=np.uint32)
+
+ZR = registers['XZR']
+
+
+# ***************************** columns *****************************
+
+
+def _imm(s: str) -> int:
+    return int(s[1:], 0)
+
+
+def _wide(op: str, tok) -> tuple:
+    hw = int(tok.s3.split('#')[1], 0) // 16
+    return OP[op], registers[tok.s1], 0, 0, (_imm(tok.s2) & 0xFFFF) | hw << 16
+
+
+def _mov(tok: MOV) -> tuple:
+    if tok.s2[0] == '#': return OP['MOVZ'], registers[tok.s1], 0, 0, int(tok.s2[1:])
+    return OP['ORR'], registers[tok.s1], ZR, registers[tok.s2], 0
+
+
+def _arith(op: str):
+    def f(tok) -> tuple:
+        if tok.s2[0] == '#': return OP[op + 'I'], registers[tok.dst], registers[tok.s1], 0, _imm(tok.s2)
+        if _pageoff(tok.s2): return OP[op + 'I'], registers[tok.dst], registers[tok.s1], 0, 0
+        return OP[op], registers[tok.dst], registers[tok.s1], registers[tok.s2], 0
+    return f
+
+
+def _mem_op(op: str):
+    def f(tok) -> tuple:
+        base, off = _mem(tok.s2)
+        return OP[op], registers[tok.s1], registers[base], 0, off >> 3
+    return f
+
+
+def _cmp(tok: CMP) -> tuple:
+    if tok.s2[0] == '#': return OP['SUBSI'], ZR, registers[tok.s1], 0, _imm(tok.s2)
+    return OP['SUBS'], ZR, registers[tok.s1], registers[tok.s2], 0
+
+
+def _pair(op: str):
+    def f(tok) -> tuple:
+        mode, base, off = tok.mode()
+        return OP[op + PAIR_MODES[mode]], registers[tok.s1], registers[base], registers[tok.s2], off >> 3
+    return f
+
+
+# token class -> (op, rd, rn, rm, imm)
+COLUMNS = {
+    MOV: _mov,
+    MOVZ: lambda x: _wide('MOVZ', x),
+    MOVN: lambda x: _wide('MOVN', x),
+    MOVK: lambda x: _wide('MOVK', x),
+    ADD: _arith('ADD'),
+    SUB: _arith('SUB'),
+    MUL: lambda x: (OP['MADD'], registers[x.dst], registers[x.s1], registers[x.s2], 0),
+    SDIV: lambda x: (OP['SDIV'], registers[x.dst], registers[x.s1], registers[x.s2], 0),
+    NEG: lambda x: (OP['SUB'], registers[x.dst], ZR, registers[x.s1], 0),
+    STR: _mem_op('STR'),
+    LDR: _mem_op('LDR'),
+    STP: _pair('STP'),
+    LDP: _pair('LDP'),
+    ADR: lambda x: (OP['ADR'], registers[x.s1], 0, 0, x.imm),
+    ADRP: lambda x: (OP['ADRP'], registers[x.s1], 0, 0, x.imm),
+    B: lambda x: (OP['B'], 0, 0, 0, x.imm),
+    BL: lambda x: (OP['BL'], 0, 0, 0, x.imm),
+    BCOND: lambda x: (OP['BCOND'], conditions[x.name[2:].upper()], 0, 0, x.imm),
+    CBZ: lambda x: (OP['CBZ'], registers[x.s1], 0, 0, x.imm),
+    CBNZ: lambda x: (OP['CBNZ'], registers[x.s1], 0, 0, x.imm),
+    CMP: _cmp,
+    CSET: lambda x: (OP['CSINC'], registers[x.s1], ZR, ZR, conditions[x.s2.upper()] ^ 1),
+    SVC: lambda x: (OP['SVC'], 0, 0, 0, int(x.s1[1:], 16)),
+    RET: lambda x: (OP['RET'], 0, 0, 0, 0),
+}
+
+
+def columns(tokens: list[Instruction]) -> tuple[np.ndarray, ...]:
+    # instructions -> op, rd, rn, rm, imm columns
+    rows = chain.from_iterable(COLUMNS[type(x)](x) for x in tokens)
+    cols = np.fromiter(rows, dtype=np.int64, count=5 * len(tokens)).reshape(-1, 5).T
+    return tuple(cols)
+
+
+# ***************************** encoding *****************************
+
+
+def encode(op: np.ndarray, rd: np.ndarray, rn: np.ndarray, rm: np.ndarray, imm: np.ndarray) -> np.ndarray:
+    # one uint32 word per row, each form is a handful of vectorized shifts and masks
+    form = FORMS[op]
+    rd, rn, rm = (x.astype(np.uint32) & 0x1F for x in (rd, rn, rm))
+    u = imm.astype(np.int64).astype(np.uint32)
+
+    fields = np.select(
+        [form == R3, form == I12, form == WIDE, form == PCREL, form == EXC, form == BRANCH, form == PAIR, form == CBRANCH,
+         form == CSEL],
+        [
+            rm << 16 | rn << 5 | rd,
+            (u & 0xFFF) << 10 | rn << 5 | rd,
+            (u & 0x3FFFF) << 5 | rd,
+            (u & 0x3) << 29 | ((u >> 2) & 0x7FFFF) << 5 | rd,
+            (u & 0x7FFF) << 5,
+            (u >> 2) & 0x3FFFFFF,
+            (u & 0x7F) << 15 | rm << 10 | rn << 5 | rd,
+            ((u >> 2) & 0x7FFFF) << 5 | rd,
+            rm << 16 | (u & 0xF) << 12 | rn << 5 | rd,
+        ],
+        default=0,
+    ).astype(np.uint32)
+
+    return BASES[op] | fields
+
+
+def encode_tokens(tokens: list[Instruction]) -> bytes:
+    # __text for a run of instructions, in one shot
+    return encode(*columns(tokens)).astype('<u4').tobytes()
+
+
+def encode_into(buf: bytearray, offsets: list[int], tokens: list[Instruction]):
+    # writes each instruction at its offset, offsets need not be word aligned
+    if not tokens: return
+    words = encode(*columns(tokens)).astype('<u4').view(np.uint8).reshape(-1, 4)
+    out = np.frombuffer(buf, dtype=np.uint8)
+    out[np.asarray(offsets)[:, None] + np.arange(4)] = words
+
+
+# ***************************** self-check *****************************
+
+
+def sample(rng: np.random.Generator, n: int) -> list[Token]:
+    # n random instructions covering every encoding form
+    def r() -> str: return f'X{rng.integers(0, 31)}'
+    def imm(k: int) -> str: return f'#{rng.integers(0, 1 << k)}'
+    def off7() -> int: return 8 * int(rng.integers(-64, 64))
+    def off19() -> int: return 4 * int(rng.integers(-(1 << 18), 1 << 18))
+    def cond() -> str: return str(rng.choice(list(conditions)[:14]))
+
+    make = [
+        lambda: MOV('MOV', r(), imm(16)),
+        lambda: MOV('MOV', r(), r()),
+        lambda: MOVZ('MOVZ', r(), imm(16), f'LSL #{16 * rng.integers(0, 4)}'),
+        lambda: MOVN('MOVN', r(), imm(16), f'LSL #{16 * rng.integers(0, 4)}'),
+        lambda: MOVK('MOVK', r(), imm(16), f'LSL #{16 * rng.integers(0, 4)}'),
+        lambda: ADD('ADD', r(), r(), r()),
+        lambda: ADD('ADD', r(), r(), imm(12)),
+        lambda: SUB('SUB', r(), r(), r()),
+        lambda: SUB('SUB', 'SP', 'SP', imm(12)),
+        lambda: MUL('MUL', r(), r(), r()),
+        lambda: SDIV('SDIV', r(), r(), r()),
+        lambda: NEG('NEG', r(), r()),
+        lambda: STR('STR', r(), f'[SP, #{8 * rng.integers(0, 4096)}]'),
+        lambda: LDR('LDR', r(), f'[{r()}, #{8 * rng.integers(0, 4096)}]'),
+        lambda: ADR('ADR', r(), 'x', int(rng.integers(-(1 << 20), 1 << 20))),
+        lambda: ADRP('ADRP', r(), 'x@PAGE', int(rng.integers(-(1 << 20), 1 << 20))),
+        lambda: B('B', 'x', 4 * int(rng.integers(-(1 << 25), 1 << 25))),
+        lambda: BL('BL', 'x', 4 * int(rng.integers(-(1 << 25), 1 << 25))),
+        lambda: STP('STP', r(), r(), f'[SP, #{off7()}]'),
+        lambda: LDP('LDP', r(), r(), f'[{r()}, #{off7()}]!'),
+        lambda: STP('STP', r(), r(), f'[{r()}, #{off7()}]!'),
+        lambda: LDP('LDP', r(), r(), '[SP]', f'#{off7()}'),
+        lambda: BCOND(f'B.{cond()}', 'x', off19()),
+        lambda: CBZ('CBZ', r(), 'x', off19()),
+        lambda: CBNZ('CBNZ', r(), 'x', off19()),
+        lambda: CMP('CMP', r(), r()),
+        lambda: CMP('CMP', r(), imm(12)),
+        lambda: CSET('CSET', r(), cond()),
+        lambda: SVC('SVC', f'#0x{rng.integers(0, 1 << 15):x}'),
+        lambda: RET('RET'),
+    ]
+    return [make[i]() for i in rng.integers(0, len(make), n)]
+
+
+if __name__ == '__main__':
+    import time
+    import struct
+
+    tokens: list = sample(np.random.default_rng(0), 200_000)
+
+    t = time.perf_counter()
+    want = b''.join(struct.pack('<I', x.decode(b=False)) for x in tokens)
+    scalar = time.perf_counter() - t
+
+    t = time.perf_counter()
+    got = encode_tokens(tokens)
+    batch = time.perf_counter() - t
+
+    # the vectorized part alone, for producers that fill the columns directly
+    cols = columns(tokens)
+    t = time.perf_counter()
+    encode(*cols)
+    kernel = time.perf_counter() - t
+
+    bad = [i for i in range(len(tokens)) if got[4 * i:4 * i + 4] != want[4 * i:4 * i + 4]]
+    for i in bad[:10]: print(f'mismatch: {tokens[i]!r} -> {got[4 * i:4 * i + 4].hex()}')
+    print(f'{len(tokens)} instructions, scalar {scalar:.3f}s, batch {batch:.3f}s (encode {kernel:.3f}s), {len(bad)} mismatches')
+    assert not bad
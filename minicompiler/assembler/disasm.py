@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+import struct
+from typing import Callable
+import numpy as np
+from minicompiler.assembler.tokens import Token, Directive, Instruction, conditions
+from dataclasses import replace
+from minicompiler.assembler.tokens import MOV, MOVZ, MOVN, MOVK, ADR, ADRP, B, BL, ADD, SUB, MUL, SDIV, NEG, STR, LDR, STP, LDP, SVC, RET
+from minicompiler.assembler.tokens import BCOND, CBZ, CBNZ, CMP, CSET
+from minicompiler.assembler.batch import OP, FORMS, R3, I12, WIDE, PCREL, EXC, BRANCH, PAIR, CBRANCH, CSEL, columns, sample
+
+
+Buffer = bytes | bytearray | memoryview | np.ndarray
+
+# condition code -> name, 0b1111 (NV) has none
+COND_NAMES = {v: k for k, v in conditions.items()}
+
+
+def _x(r: int, sp: bool = False) -> str:
+    # register 31 is SP in immediate/memory forms and XZR in register forms
+    if r == 31: return 'SP' if sp else 'XZR'
+    return f'X{r}'
+
+
+def _rd(w: int) -> int: return w & 0x1F
+def _rn(w: int) -> int: return (w >> 5) & 0x1F
+def _rm(w: int) -> int: return (w >> 16) & 0x1F
+def _imm12(w: int) -> int: return (w >> 10) & 0xFFF
+def _imm16(w: int) -> int: return (w >> 5) & 0xFFFF
+def _hw(w: int) -> str: return f'LSL #{16 * ((w >> 21) & 0x3)}'
+
+
+def _adr_imm(w: int) -> int:
+    imm = ((w >> 5) & 0x7FFFF) << 2 | (w >> 29) & 0x3
+    return imm - (1 << 21) if imm >> 20 else imm
+
+
+def _b_imm(w: int) -> int:
+    imm = (w & 0x3FFFFFF) << 2
+    return imm - (1 << 28) if imm >> 27 else imm
+
+
+def _cb_imm(w: int) -> int:
+    imm = ((w >> 5) & 0x7FFFF) << 2
+    return imm - (1 << 21) if imm >> 20 else imm
+
+
+def _bcond(w: int) -> Token:
+    if w & 0xF not in COND_NAMES: return Directive('.inst', f'0x{w:08x}')
+    return BCOND(f'B.{COND_NAMES[w & 0xF]}', f'#{_cb_imm(w)}', _cb_imm(w))
+
+
+def _cset(w: int) -> Token:
+    # CSINC Xd, XZR, XZR, cond is CSET with the inverse condition, AL/NV have no inverse
+    if (w >> 13) & 0x7 == 0x7: return Directive('.inst', f'0x{w:08x}')
+    return CSET('CSET', _x(_rd(w)), COND_NAMES[((w >> 12) & 0xF) ^ 1])
+
+
+def _imm7(w: int) -> int:
+    imm = (w >> 15) & 0x7F
+    return 8 * (imm - (1 << 7) if imm >> 6 else imm)
+
+
+def _pair(cls: type[STP], mode: str) -> Callable[[int], Token]:
+    # mode: '' signed offset, '!' pre-index, 'post' post-index
+    def f(w: int) -> Token:
+        rt, rt2, base = _x(_rd(w)), _x((w >> 10) & 0x1F), _x(_rn(w), True)
+        if mode == 'post': return cls(cls.__name__, rt, rt2, f'[{base}]', f'#{_imm7(w)}')
+        return cls(cls.__name__, rt, rt2, f'[{base}, #{_imm7(w)}]{mode}')
+    return f
+
+
+def _movz(w: int) -> Token:
+    # the compiler writes unshifted MOVZ as MOV
+    if (w >> 21) & 0x3: return MOVZ('MOVZ', _x(_rd(w)), f'#{_imm16(w)}', _hw(w))
+    return MOV('MOV', _x(_rd(w)), f'#{_imm16(w)}')
+
+
+def _sub(w: int) -> Token:
+    if _rn(w) == 31: return NEG('NEG', _x(_rd(w)), _x(_rm(w)))
+    return SUB('SUB', _x(_rd(w)), _x(_rn(w)), _x(_rm(w)))
+
+
+# (mask, match, op in the batch encoder's table, word -> token), checked in order
+TABLE: list[tuple[int, int, str, Callable[[int], Token]]] = [
+    (0xFFE0FFE0, 0xAA0003E0, 'ORR', lambda w: MOV('MOV', _x(_rd(w)), _x(_rm(w)))),
+    (0xFF800000, 0xD2800000, 'MOVZ', _movz),
+    (0xFF800000, 0x92800000, 'MOVN', lambda w: MOVN('MOVN', _x(_rd(w)), f'#{_imm16(w)}', _hw(w))),
+    (0xFF800000, 0xF2800000, 'MOVK', lambda w: MOVK('MOVK', _x(_rd(w)), f'#{_imm16(w)}', _hw(w))),
+    (0xFFE0FC00, 0x8B000000, 'ADD', lambda w: ADD('ADD', _x(_rd(w)), _x(_rn(w)), _x(_rm(w)))),
+    (0xFFE0FC00, 0xCB000000, 'SUB', _sub),
+    (0xFFE0FC00, 0x9B007C00, 'MADD', lambda w: MUL('MUL', _x(_rd(w)), _x(_rn(w)), _x(_rm(w)))),
+    (0xFFE0FC00, 0x9AC00C00, 'SDIV', lambda w: SDIV('SDIV', _x(_rd(w)), _x(_rn(w)), _x(_rm(w)))),
+    (0xFFC00000, 0x91000000, 'ADDI', lambda w: ADD('ADD', _x(_rd(w), True), _x(_rn(w), True), f'#{_imm12(w)}')),
+    (0xFFC00000, 0xD1000000, 'SUBI', lambda w: SUB('SUB', _x(_rd(w), True), _x(_rn(w), True), f'#{_imm12(w)}')),
+    (0xFFC00000, 0xF9000000, 'STR', lambda w: STR('STR', _x(_rd(w)), f'[{_x(_rn(w), True)}, #{8 * _imm12(w)}]')),
+    (0xFFC00000, 0xF9400000, 'LDR', lambda w: LDR('LDR', _x(_rd(w)), f'[{_x(_rn(w), True)}, #{8 * _imm12(w)}]')),
+    (0x9F000000, 0x10000000, 'ADR', lambda w: ADR('ADR', _x(_rd(w)), f'#{_adr_imm(w)}', _adr_imm(w))),
+    (0x9F000000, 0x90000000, 'ADRP', lambda w: ADRP('ADRP', _x(_rd(w)), f'#{_adr_imm(w)}', _adr_imm(w))),
+    (0xFC000000, 0x14000000, 'B', lambda w: B('B', f'#{_b_imm(w)}', _b_imm(w))),
+    (0xFC000000, 0x94000000, 'BL', lambda w: BL('BL', f'#{_b_imm(w)}', _b_imm(w))),
+    (0xFFC00000, 0xA9000000, 'STP', _pair(STP, '')),
+    (0xFFC00000, 0xA9400000, 'LDP', _pair(LDP, '')),
+    (0xFFC00000, 0xA9800000, 'STP_PRE', _pair(STP, '!')),
+    (0xFFC00000, 0xA9C00000, 'LDP_PRE', _pair(LDP, '!')),
+    (0xFFC00000, 0xA8800000, 'STP_POST', _pair(STP, 'post')),
+    (0xFFC00000, 0xA8C00000, 'LDP_POST', _pair(LDP, 'post')),
+    (0xFF000010, 0x54000000, 'BCOND', _bcond),
+    (0xFF000000, 0xB4000000, 'CBZ', lambda w: CBZ('CBZ', _x(_rd(w)), f'#{_cb_imm(w)}', _cb_imm(w))),
+    (0xFF000000, 0xB5000000, 'CBNZ', lambda w: CBNZ('CBNZ', _x(_rd(w)), f'#{_cb_imm(w)}', _cb_imm(w))),
+    (0xFFE0FC1F, 0xEB00001F, 'SUBS', lambda w: CMP('CMP', _x(_rn(w)), _x(_rm(w)))),
+    (0xFFC0001F, 0xF100001F, 'SUBSI', lambda w: CMP('CMP', _x(_rn(w), True), f'#{_imm12(w)}')),
+    (0xFFFF0FE0, 0x9A9F07E0, 'CSINC', _cset),
+    (0xFFE0001F, 0xD4000001, 'SVC', lambda w: SVC('SVC', f'#0x{_imm16(w):x}')),
+    (0xFFFFFFFF, 0xD65F03C0, 'RET', lambda w: RET('RET')),
+]
+
+# candidates per top byte, so each word is only tested against a couple of entries
+BUCKETS: list[list[tuple[int, int, str, Callable[[int], Token]]]] = [
+    [e for e in TABLE if (b & (e[0] >> 24)) == e[1] >> 24] for b in range(256)
+]
+
+
+def decode(w: int) -> Token:
+    for mask, match, _, f in BUCKETS[w >> 24]:
+        if w & mask == match: return f(w)
+    return Directive('.inst', f'0x{w:08x}')
+
+
+def words(buf: Buffer) -> np.ndarray:
+    if isinstance(buf, np.ndarray): return buf.astype(np.uint32, copy=False)
+    return np.frombuffer(buf, dtype='<u4').astype(np.uint32)
+
+
+def disassemble(buf: Buffer) -> list[Token]:
+    # __text -> tokens, words that aren't recognized come back as .inst directives
+    if isinstance(buf, np.ndarray): return [decode(int(w)) for w in buf]
+    return [decode(w) for w, in struct.iter_unpack('<I', buf)]
+
+
+# ***************************** bulk *****************************
+
+
+def decode_columns(buf: Buffer) -> tuple[np.ndarray, ...]:
+    # words -> the batch encoder's (op, rd, rn, rm, imm) columns, op is -1 for unknown words
+    w = words(buf)
+    op = np.full(len(w), -1, dtype=np.int64)
+    for mask, match, name, _ in reversed(TABLE):
+        op[(w & mask) == match] = OP[name]
+    # same condition checks as _bcond and _cset: B.NV, and CSINC with AL/NV, aren't instructions we know
+    op[(op == OP['BCOND']) & ((w & 0xF) == 0xF)] = -1
+    op[(op == OP['CSINC']) & ((w >> 13) & 0x7 == 0x7)] = -1
+
+    w64 = w.astype(np.int64)
+    rd, rn, rm = w64 & 0x1F, (w64 >> 5) & 0x1F, (w64 >> 16) & 0x1F
+    form = FORMS[np.maximum(op, 0)]
+
+    adr = ((w64 >> 5) & 0x7FFFF) << 2 | (w64 >> 29) & 0x3
+    b = (w64 & 0x3FFFFFF) << 2
+    p = (w64 >> 15) & 0x7F
+    c = ((w64 >> 5) & 0x7FFFF) << 2
+    imm = np.select(
+        [form == I12, form == WIDE, form == PCREL, form == EXC, form == BRANCH, form == PAIR, form == CBRANCH, form == CSEL],
+        [(w64 >> 10) & 0xFFF, (w64 >> 5) & 0x3FFFF, np.where(adr >> 20 != 0, adr - (1 << 21), adr), (w64 >> 5) & 0xFFFF,
+         np.where(b >> 27 != 0, b - (1 << 28), b), np.where(p >> 6 != 0, p - (1 << 7), p),
+         np.where(c >> 20 != 0, c - (1 << 21), c), (w64 >> 12) & 0xF],
+        default=0,
+    )
+
+    # unused register fields are zero in the encoder's columns, pairs keep their second register in rm
+    r3, pair, csel = form == R3, form == PAIR, form == CSEL
+    rn = np.where(r3 | (form == I12) | pair | csel, rn, 0)
+    rm = np.where(r3 | csel, rm, np.where(pair, (w64 >> 10) & 0x1F, 0))
+    rd = np.where((form == EXC) | (form == BRANCH), 0, rd)
+    rd = np.where(op == OP['RET'], 0, rd)
+    return op, rd, rn, rm, imm
+
+
+def verify(tokens: list[Instruction], buf: Buffer) -> np.ndarray:
+    # indices of instructions whose encoding doesn't decode back to the same operation and operands
+    want = np.stack(columns(tokens))
+    got = np.stack(decode_columns(buf))
+    return np.flatnonzero((want != got).any(axis=0))
+
+
+def verify_text(tokens: list[Token], text: bytes | bytearray) -> np.ndarray:
+    # same, for an assembled __text that mixes instructions and data
+    lc, offsets, ins, labels, exported = 0, [], [], {}, set()
+    for x in tokens:
+        if isinstance(x, Instruction):
+            offsets.append(lc)
+            ins.append(x)
+            lc += 4
+        elif isinstance(x, Directive) and x.name == '.ascii':
+            lc += len((x.subject + '\0').encode())
+        elif isinstance(x, Directive) and x.name == '.global':
+            exported.add(x.subject)
+        elif not isinstance(x, Directive):
+            labels[x.name] = lc
+
+    # label references hold their resolved offset in the output only, branches to other symbols are left to the linker
+    def resolved(o: int, x: Instruction) -> Instruction:
+        s = x.symbol()
+        if s is not None and s in labels and (isinstance(x, (ADR, BCOND, CBZ)) or isinstance(x, B) and s not in exported):
+            return replace(x, imm=labels[s] - o)  # type: ignore[call-arg]
+        return x
+
+    ins = [resolved(o, x) for o, x in zip(offsets, ins)]
+
+    b = np.frombuffer(text, dtype=np.uint8)
+    w = b[np.asarray(offsets, dtype=np.int64)[:, None] + np.arange(4)].copy().view('<u4').ravel()
+    return verify(ins, w)
+
+
+if __name__ == '__main__':
+    import time
+
+    tokens: list = sample(np.random.default_rng(1), 1_000_000)
+    text = b''.join(struct.pack('<I', x.decode(b=False)) for x in tokens)
+
+    t = time.perf_counter()
+    got = decode_columns(text)
+    bulk = time.perf_counter() - t
+
+    bad = verify(tokens, text)
+    for i in bad[:10]: print(f'mismatch: {tokens[i]!r} -> {disassemble(text[4 * i:4 * i + 4])}')
+
+    t = time.perf_counter()
+    out = disassemble(text[:400_000])
+    scalar = time.perf_counter() - t
+
+    assert all(a.decode(b=False) == b.decode(b=False) for a, b in zip(out, tokens))  # type: ignore[attr-defined]
+    print(f'bulk decode {len(tokens) / bulk / 1e6:.1f}M ins/s, disassemble {len(out) / scalar / 1e6:.2f}M ins/s, {len(bad)} mismatches')
+    assert not len(bad)
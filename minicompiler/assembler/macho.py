@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import struct
 from dataclasses import dataclass, field
+from typing import ClassVar, Iterable
+from itertools import starmap
+from operator import attrgetter
 from pprint import pprint
 from enum import Enum
 from collections import defaultdict
@@ -19,7 +22,7 @@ VM_PROT_READ = 0x01
 VM_PROT_EXECUTE = 0x04
 S_REGULAR = 0x0
 S_ATTR_PURE_INSTRUCTIONS = 0x80000000
-S_ATTR_SOME_INSTRUCTIONS = 0x40000000
+S_ATTR_SOME_INSTRUCTIONS = 0x00000400
 LC_SYMTAB = 0x2
 N_TYPE = 0x0e
 N_SECT = 0x0e
@@ -30,6 +33,21 @@ REFERENCE_FLAG_DEFINED = 0x000F
 REFERENCE_FLAG_UNDEFINED_NON_LAZY = 0x000E
 LC_DYSYMTAB = 0xB
 GENERIC_RELOC_SECTDIFF = 0x0005
+MH_EXECUTE = 0x2                        # File type: executable
+MH_NOUNDEFS = 0x1
+MH_DYLDLINK = 0x4
+MH_TWOLEVEL = 0x80
+MH_PIE = 0x200000
+VM_PROT_NONE = 0x00
+LC_LOAD_DYLIB = 0xC
+LC_LOAD_DYLINKER = 0xE
+LC_CODE_SIGNATURE = 0x1D
+LC_MAIN = 0x80000028
+ARM64_RELOC_UNSIGNED = 0
+ARM64_RELOC_BRANCH26 = 2
+ARM64_RELOC_PAGE21 = 3
+ARM64_RELOC_PAGEOFF12 = 4
+ARM64_RELOC_ADDEND = 10
 
 
 class DTYPE(Enum):
@@ -41,17 +59,58 @@ class DTYPE(Enum):
 
 
 class Component:
-    def pack(self):
-        s, vals = '', []
-        for k, v in self.__annotations__.items():
-            s += v.value
-            x = vars(self)[k]
-            vals.append(x.encode('utf-8') if isinstance(x, str) else x)
-        return struct.pack(s, *vals)
+    # layout compiled once per subclass from its DTYPE annotations (little-endian, no padding)
+    STRUCT: ClassVar[struct.Struct]
+    SIZE: ClassVar[int] = 0
+    FIELDS: ClassVar[tuple[str, ...]] = ()
+    GET: ClassVar[attrgetter]
+    TEXT: ClassVar[bool] = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ann = {k: v for k, v in cls.__dict__.get('__annotations__', {}).items() if isinstance(v, DTYPE)}
+        if not ann: return
+        cls.STRUCT = struct.Struct('<' + ''.join(v.value for v in ann.values()))
+        cls.SIZE = cls.STRUCT.size
+        cls.FIELDS = tuple(ann)
+        cls.GET = attrgetter(*ann) if len(ann) > 1 else lambda x: (getattr(x, next(iter(ann))),)
+        cls.TEXT = DTYPE.char_16b in ann.values()
+
+    def values(self) -> tuple:
+        vals = self.GET(self)
+        if not self.TEXT: return vals
+        return tuple(x.encode('utf-8') if isinstance(x, str) else x for x in vals)
+
+    def pack(self) -> bytes:
+        return self.STRUCT.pack(*self.values())
+
+    def pack_into(self, buf: bytearray, offset: int):
+        self.STRUCT.pack_into(buf, offset, *self.values())
 
     def bsize(self) -> int:
-        s = ''.join(x.value for x in self.__annotations__.values())
-        return struct.calcsize(s)
+        return self.SIZE
+
+    @classmethod
+    def unpack_from(cls, buf: bytes | bytearray | memoryview, offset: int = 0):
+        vals = cls.STRUCT.unpack_from(buf, offset)
+        return cls(*(v.rstrip(b'\0').decode() if isinstance(v, bytes) else v for v in vals))
+
+    @classmethod
+    def pack_array(cls, items: Iterable['Component'], buf: bytearray, offset: int) -> int:
+        # packs items back to back, returns the offset past the last one
+        vals = map(cls.values if cls.TEXT else cls.GET, items)
+        b = b''.join(starmap(cls.STRUCT.pack, vals))
+        buf[offset:offset + len(b)] = b
+        return offset + len(b)
+
+    @classmethod
+    def unpack_array(cls, buf: bytes | bytearray | memoryview) -> list:
+        if not cls.TEXT: return list(starmap(cls, cls.STRUCT.iter_unpack(buf)))
+        res = []
+        for vals in cls.STRUCT.iter_unpack(buf):
+            x = cls(*(v.rstrip(b'\0').decode() if isinstance(v, bytes) else v for v in vals))
+            res.append(x)
+        return res
 
     def __repr__(self):
         hex_attrs = {k: (f'0x{v:x}' if isinstance(v, int) else v) for k, v in vars(self).items()}
@@ -154,6 +213,41 @@ class DysymtabCmd(Component):
     nlocrel: DTYPE.uint32_t = 0
 
 
+@dataclass(repr=False)
+class DylinkerCmd(Component):
+    # followed by the path, padded to 8 bytes
+    cmd: DTYPE.uint32_t = LC_LOAD_DYLINKER
+    cmdsize: DTYPE.uint32_t = 0
+    name: DTYPE.uint32_t = 12
+
+
+@dataclass(repr=False)
+class DylibCmd(Component):
+    # followed by the path, padded to 8 bytes
+    cmd: DTYPE.uint32_t = LC_LOAD_DYLIB
+    cmdsize: DTYPE.uint32_t = 0
+    name: DTYPE.uint32_t = 24
+    timestamp: DTYPE.uint32_t = 2
+    current_version: DTYPE.uint32_t = 0x10000
+    compatibility_version: DTYPE.uint32_t = 0x10000
+
+
+@dataclass(repr=False)
+class EntryPointCmd(Component):
+    cmd: DTYPE.uint32_t = LC_MAIN
+    cmdsize: DTYPE.uint32_t = 24
+    entryoff: DTYPE.uint64_t = 0
+    stacksize: DTYPE.uint64_t = 0
+
+
+@dataclass(repr=False)
+class LinkeditDataCmd(Component):
+    cmd: DTYPE.uint32_t = LC_CODE_SIGNATURE
+    cmdsize: DTYPE.uint32_t = 16
+    dataoff: DTYPE.uint32_t = 0
+    datasize: DTYPE.uint32_t = 0
+
+
 @dataclass(repr=False)
 class Nlist64(Component):
     n_strx: DTYPE.uint32_t = 0
@@ -165,11 +259,14 @@ class Nlist64(Component):
 
 @dataclass(repr=False)
 class GenericDataSegment(Component):
-    dat: bytes = bytes()
+    dat: bytes | bytearray = bytes()
 
     def pack(self):
         return self.dat
 
+    def pack_into(self, buf: bytearray, offset: int):
+        buf[offset:offset + len(self.dat)] = self.dat
+
     def bsize(self) -> int:
         return len(self.dat)
 
@@ -183,6 +280,10 @@ class StringTableSegment(Component):
         if t: t = '\0' + t
         return t.encode()
 
+    def pack_into(self, buf: bytearray, offset: int):
+        t = self.pack()
+        buf[offset:offset + len(t)] = t
+
     def bsize(self) -> int:
         return len(self.pack())
 
@@ -193,11 +294,34 @@ class RelocInfo(Component):
     r_info: DTYPE.uint32_t = 0
 
 
+@dataclass(repr=False)
+class ComponentArray(Component):
+    # table of fixed-size records (symbols, relocations) packed in one go
+    items: list[Component] = field(default_factory=list)
+
+    def pack(self) -> bytes:
+        buf = bytearray(self.bsize())
+        self.pack_into(buf, 0)
+        return bytes(buf)
+
+    def pack_into(self, buf: bytearray, offset: int):
+        if self.items: type(self.items[0]).pack_array(self.items, buf, offset)
+
+    def bsize(self) -> int:
+        return len(self.items) * self.items[0].SIZE if self.items else 0
+
+
 def build_reloc_info(r_address: int, r_symbolnum: int, r_pcrel: int, r_length: int, r_extern: int, r_type: int) -> RelocInfo:
     r_info = (r_symbolnum & 0xFFFFFF) | (r_pcrel << 24) | (r_length << 25) | (r_extern << 27) | (r_type << 28)
     return RelocInfo(r_address, r_info)
 
 
+def parse_reloc_info(r: RelocInfo) -> tuple[int, int, int, int, int]:
+    # (r_symbolnum, r_pcrel, r_length, r_extern, r_type)
+    x = r.r_info
+    return x & 0xFFFFFF, (x >> 24) & 0x1, (x >> 25) & 0x3, (x >> 27) & 0x1, x >> 28
+
+
 class MachoObjectBuilder:
     def __init__(self):
         self.header: Header | None = None
@@ -209,7 +333,9 @@ class MachoObjectBuilder:
         self.data_segments: list[Component] = []
         self.symbols: list[Nlist64] = []
         self.str_table: bytes = bytes()
-        self.code: bytes = bytes()
+        self.code: bytes | bytearray = bytes()
+        self.relocs: list[RelocInfo] = []
+        self.reloc_pad = 0
 
     def add_header(self, flags: int = 0):
         assert self.header is None
@@ -258,14 +384,22 @@ class MachoObjectBuilder:
         lc = DysymtabCmd(**kwargs)
         self.load_commands.append(lc)
 
-    def add_code(self, dat: bytes):
+    def add_code(self, dat: bytes | bytearray):
         ds = GenericDataSegment(dat=dat)
         self.code = dat
         self.data_segments.append(ds)
 
+    def add_relocations(self, relocs: list[RelocInfo]):
+        # right after the code of the (single) section, 8-byte aligned
+        if not relocs: return
+        self.relocs = relocs
+        self.reloc_pad = -len(self.code) % 8
+        self.data_segments.append(GenericDataSegment(dat=bytes(self.reloc_pad)))
+        self.data_segments.append(ComponentArray(list(relocs)))
+
     def add_symbol_table(self, symbols: list[Nlist64] | None = None):
         self.symbols.extend(symbols or [])
-        self.data_segments.extend(symbols or [])
+        self.data_segments.append(ComponentArray(list(symbols or [])))
 
     def add_string_table(self, table: list[str]):
         ds = StringTableSegment(table)
@@ -274,7 +408,7 @@ class MachoObjectBuilder:
 
     def build(self) -> bytes:
 
-        res = bytes()
+        # the layout is computed first, then everything is packed into a single buffer
         components: list[Component] = []
 
         # **************************** write header ****************************
@@ -284,7 +418,6 @@ class MachoObjectBuilder:
         self.header.sizeofcmds += sum(x.bsize() for x in self.load_commands)
         # Add associated sections.
         self.header.sizeofcmds += sum([s.bsize() for lc in self.load_commands if hasattr(lc, 'segname') for s in self.sections_by_segname[lc.segname]])
-        res += self.header.pack()
 
         # **************************** write load commands ****************************
         for lc in self.load_commands:
@@ -304,11 +437,13 @@ class MachoObjectBuilder:
                     for sec in secs:
                         sec.size = len(self.code)  # TODO: make this better
                         sec.offset = offset
-                        sec.reloff = offset + lc.filesize
-                        sec.nreloc = 0  # TODO
+                        sec.reloff = offset + lc.filesize + self.reloc_pad
+                        sec.nreloc = len(self.relocs)
                         offset += sec.size
                         components.append(sec)
-                        self.header.sizeofcmds += sec.bsize()
+
+                    # relocation entries sit between the code and the symbol table
+                    if self.relocs: offset += self.reloc_pad + len(self.relocs) * RelocInfo.SIZE
 
                 case BuildCmd():
                     lc.cmdsize = lc.bsize()
@@ -318,7 +453,7 @@ class MachoObjectBuilder:
                     lc.cmdsize = lc.bsize()
                     lc.symoff = offset
                     lc.nsyms = len(self.symbols)
-                    lc.stroff = lc.symoff + sum(x.bsize() for x in self.symbols)
+                    lc.stroff = lc.symoff + len(self.symbols) * Nlist64.SIZE
                     lc.strsize = len(self.str_table)
                     components.append(lc)
 
@@ -326,13 +461,16 @@ class MachoObjectBuilder:
                     lc.cmdsize = lc.bsize()
                     components.append(lc)
 
-        for lc in components: res += lc.pack()
-
-        # **************************** write data ****************************
-        for ds in self.data_segments:
-            res += ds.pack()
+        # **************************** write everything ****************************
+        parts = [self.header] + components + self.data_segments
+        sizes = [x.bsize() for x in parts]
+        res = bytearray(sum(sizes))
+        offset = 0
+        for x, n in zip(parts, sizes):
+            x.pack_into(res, offset)
+            offset += n
 
-        return res
+        return bytes(res)
 
 
 if __name__ == '__main__':
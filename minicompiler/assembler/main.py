@@ -1,83 +1,175 @@
 #!/usr/bin/env python3
 import os
 import sys
+import struct
+import argparse
+from dataclasses import dataclass, replace
 from minicompiler.assembler.tokenizer import tokenize
-from minicompiler.assembler.tokens import Directive, Label, Instruction, ADR
-from minicompiler.assembler.macho import MachoObjectBuilder, Nlist64, N_TYPE, N_EXT
+from minicompiler.assembler.peephole import optimize
+from minicompiler.assembler.tokens import Directive, Label, Instruction, ADR, ADRP, B, BL, BCOND, CBZ, CBNZ, ADD, LDR, STR
+from minicompiler.assembler.macho import MachoObjectBuilder, Nlist64, RelocInfo, build_reloc_info, N_TYPE, N_EXT, N_UNDF, NO_SECT
+from minicompiler.assembler.macho import ARM64_RELOC_BRANCH26, ARM64_RELOC_PAGE21, ARM64_RELOC_PAGEOFF12
+from minicompiler.stats import Stats, stage, add_arguments, from_args, report
+from minicompiler.source import mapped
+
+
+# instructions referencing a label: class -> signed range of the pc-relative offset in bytes, resolved here for local labels
+PCREL: dict[type, int] = {
+    ADR: 1 << 20,
+    B: 1 << 27,
+    BL: 1 << 27,
+    BCOND: 1 << 20,
+    CBZ: 1 << 20,
+    CBNZ: 1 << 20,
+}
+
+# class -> relocation left to the linker, for external and undefined symbols (and pages, which only the linker knows)
+RELOC: dict[type, int] = {
+    B: ARM64_RELOC_BRANCH26,
+    BL: ARM64_RELOC_BRANCH26,
+    ADRP: ARM64_RELOC_PAGE21,
+    ADD: ARM64_RELOC_PAGEOFF12,
+    LDR: ARM64_RELOC_PAGEOFF12,
+    STR: ARM64_RELOC_PAGEOFF12,
+}
+
+# instructions that may name a symbol
+REFS = set(PCREL) | set(RELOC)
+
+
+class AssemblerError(Exception): pass
+
+
+@dataclass(slots=True)
+class Fixup:
+    # instruction at offset in __text waiting for the address of symbol
+    offset: int
+    token: Instruction
+    symbol: str
 
 
 class Assembler:
-    def __init__(self, tokens, verbose: bool = False):
+    def __init__(self, tokens, verbose: bool = False, backend: str = 'scalar'):
         # input
         self.tokens = tokens
 
-        # output
-        self.dat: bytes = bytes()
+        # 'scalar' encodes each instruction as it is reached, 'batch' encodes them all at once with NumPy
+        assert backend in ('scalar', 'batch')
+        self.backend = backend
+
+        # util
+        self.is_immediate = lambda x: x[0] == '#'
+        self.is_register = lambda x: x[0] == 'X'
+        self.is_label = lambda x: x.isalpha() and not self.is_immediate(x) and not self.is_register(x)
+
+        self.verbose = verbose
+        self._reset()
+
+    def _reset(self, size: int = 0):
+        # output, preallocated and written at the location counter
+        self.dat = bytearray(size)
 
         # tables
         self.symbol_table: dict[str, int] = {}
-        self.loc_symbols: set[str] = set()
-        self.ext_symbols: set[str] = set()
+        # insertion ordered so the symbol table (and the whole object) is deterministic
+        self.loc_symbols: dict[str, None] = {}
+        self.ext_symbols: dict[str, None] = {}
+        self.und_symbols: dict[str, None] = {}
         self.string_table: dict[str, int] = {}
+        self.fixups: list[Fixup] = []
+        self.relocs: list[Fixup] = []
+        self.pending: list[tuple[int, Instruction]] = []
 
         # misc. metadata
         self.lc = 0
         self.stidx = 1
         self.align = 4
 
-        # util
-        self.is_immediate = lambda x: x[0] == '#'
-        self.is_register = lambda x: x[0] == 'X'
-        self.is_label = lambda x: x.isalpha() and not self.is_immediate(x) and not self.is_register(x)
-
-        self.first_pass = True
-        self.verbose = verbose
-
     def _process_directive(self, token: Directive):
         match token.name:
             case '.global':
-                self.loc_symbols.discard(token.subject)
-                self.ext_symbols.add(token.subject)
+                self.loc_symbols.pop(token.subject, None)
+                self.ext_symbols[token.subject] = None
             case '.align':
                 self.align = int(token.subject)
                 # TODO: update location counter to conform to specified boundary
             case '.ascii':
                 s = (token.subject + '\0').encode()
+                self.dat[self.lc:self.lc + len(s)] = s
                 self.lc += len(s)
-                if self.first_pass: return
                 p = ' '.join(f'0x{b:02X}' for b in s)
                 if self.verbose: print(f'{p:<{10}}')
-                self.dat += s
+
+    def _add_string(self, name: str):
+        self.string_table[name] = self.stidx
+        # string + separator
+        self.stidx += len(name.encode()) + 1
 
     def _process_label(self, token: Label):
-        if not self.first_pass: return
+        if token.name in self.symbol_table:
+            raise AssemblerError(f'.text+0x{self.lc:x}: duplicate label {token.name!r}')
         self.symbol_table[token.name] = self.lc
-        self.string_table[token.name] = self.stidx
-        # string + separator
-        self.stidx += len(token.name.encode()) + 1
-        self.loc_symbols.add(token.name)
+        self._add_string(token.name)
+        # .global may come before the label it exports
+        if token.name not in self.ext_symbols: self.loc_symbols[token.name] = None
 
-    # TODO
     def _process_instruction(self, token: Instruction):
 
-        # preprocessing
-        match token:
-            case ADR():
-                # first pass
-                if token.s2 not in self.symbol_table: return
+        # symbol references are encoded with a zero offset and patched (or relocated) once every label is known
+        if type(token) in REFS and (symbol := token.symbol()) is not None:
+            self.fixups.append(Fixup(self.lc, token, symbol))
+            if type(token) in PCREL: token = replace(token, imm=0)  # type: ignore[call-arg]
 
-                # calculate offset
-                addr = self.symbol_table[token.s2]
-                imm = addr - self.lc + 4
-                token.imm = imm  # type: ignore
+        if self.backend == 'batch':
+            self.pending.append((self.lc, token))
+            self.lc += 4
+            return
 
-        out: bytes = token.decode()  # type: ignore[assignment]
+        struct.pack_into('<I', self.dat, self.lc, token.decode(b=False))
         self.lc += 4
 
-        if not self.first_pass:
-            p = ' '.join(f'0x{b:02X}' for b in out)
-            if self.verbose: print(f'{p:<{10}} ---- {token}')
-            self.dat += out
+        if self.verbose:
+            p = ' '.join(f'0x{b:02X}' for b in self.dat[self.lc - 4:self.lc])
+            print(f'{p:<{10}} ---- {token}')
+
+    def _size(self) -> int:
+        # bytes of __text, counted without encoding anything
+        n = 0
+        for x in self.tokens:
+            if isinstance(x, Instruction): n += 4
+            elif isinstance(x, Directive) and x.name == '.ascii': n += len((x.subject + '\0').encode())
+        return n
+
+    def _encode_pending(self):
+        # numpy is only needed for the batch backend
+        from minicompiler.assembler.batch import encode_into  # pylint: disable=import-outside-toplevel
+        offsets, tokens = zip(*self.pending)
+        encode_into(self.dat, list(offsets), list(tokens))
+
+    def _resolve(self):
+        errors = []
+        for x in self.fixups:
+            loc = f'.text+0x{x.offset:x}: {x.token.__class__.__name__} {x.symbol}'
+            kind = type(x.token)
+            local = x.symbol in self.symbol_table and (x.symbol not in self.ext_symbols or kind not in RELOC)
+            if not (local and kind in PCREL):
+                if kind in RELOC: self.relocs.append(x)
+                else: errors.append(f'{loc}: undefined symbol')
+                continue
+            # relative to the referencing instruction
+            imm = self.symbol_table[x.symbol] - x.offset
+            if not -PCREL[type(x.token)] <= imm < PCREL[type(x.token)]:
+                errors.append(f'{loc}: offset {imm} out of range')
+                continue
+            struct.pack_into('<I', self.dat, x.offset, replace(x.token, imm=imm).decode(b=False))  # type: ignore[call-arg]
+        if errors: raise AssemblerError('\n'.join(errors))
+
+        # .global names without a label and relocation targets that aren't defined here are left to the linker
+        for s in [s for s in self.ext_symbols if s not in self.symbol_table] + [x.symbol for x in self.relocs]:
+            if s in self.symbol_table or s in self.und_symbols: continue
+            self.ext_symbols.pop(s, None)
+            self.und_symbols[s] = None
+            self._add_string(s)
 
     def process(self, token):
         match token:
@@ -108,22 +200,34 @@ class Assembler:
 
             res.append(x)
 
+        # undefined symbols last
+        for symbol in self.und_symbols:
+            res.append(Nlist64(n_strx=self.string_table[symbol], n_type=N_UNDF | N_EXT, n_sect=NO_SECT, n_desc=0, n_value=0))
+
+        return res
+
+    def _get_relocations(self) -> list[RelocInfo]:
+        # symbol numbers follow the order of _get_symbols
+        index = {s: i for i, s in enumerate(list(self.loc_symbols) + list(self.ext_symbols) + list(self.und_symbols))}
+        res = []
+        for x in self.relocs:
+            kind = RELOC[type(x.token)]
+            res.append(build_reloc_info(x.offset, index[x.symbol], int(kind != ARM64_RELOC_PAGEOFF12), 2, 1, kind))
         return res
 
     def _get_string_table(self) -> list[str]:
         return list(self.string_table.keys())
 
-    def dump(self, path: str):
-
-        # first pass
+    def encode(self) -> bytearray:
+        # single pass into a buffer sized up front, then patch forward references
+        self._reset(self._size())
         for x in self.tokens: self.process(x)
-        self.first_pass = False
-        self.lc = 0
+        if self.pending: self._encode_pending()
+        self._resolve()
+        return self.dat
 
-        # second pass
-        for x in self.tokens: self.process(x)
-
-        # create executable
+    def builder(self) -> MachoObjectBuilder:
+        # object file around the encoded __text
         b = MachoObjectBuilder()
         b.add_header()
         # ****************** load commands ******************
@@ -139,29 +243,55 @@ class Assembler:
             iextdefsym=len(self.loc_symbols),
             nextdefsym=len(self.ext_symbols),
             iundefsym=len(self.loc_symbols) + len(self.ext_symbols),
+            nundefsym=len(self.und_symbols),
         )
         # ****************** data segments ******************
         b.add_code(dat=self.dat)
+        b.add_relocations(self._get_relocations())
         b.add_symbol_table(symbols=self._get_symbols())
         b.add_string_table(table=self._get_string_table())
-        o = b.build()
-
-        with open(path, 'wb') as fp: fp.write(o)
+        return b
+
+    def assemble(self, stats: Stats | None = None) -> bytes:
+        with stage(stats, 'encode'): self.encode()
+        with stage(stats, 'macho'): o = self.builder().build()
+        if stats:
+            stats.count('encoded', sum(isinstance(x, Instruction) for x in self.tokens))
+            stats.count('text_bytes', len(self.dat))
+            stats.count('symbols', len(self.symbol_table) + len(self.und_symbols))
+            stats.count('relocations', len(self.relocs))
+            stats.count('object_bytes', len(o))
+        return o
+
+    def dump(self, path: str, stats: Stats | None = None):
+        o = self.assemble(stats)
+        with stage(stats, 'write'):
+            with open(path, 'wb') as fp: fp.write(o)
+        if stats: stats.count('bytes_written', len(o))
 
 
 if __name__ == '__main__':
 
-    assert len(sys.argv) == 3
+    ap = argparse.ArgumentParser()
+    ap.add_argument('src')
+    ap.add_argument('out')
+    ap.add_argument('-O', dest='opt', action='store_true', help='run the peephole optimizer before assembling')
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    assert args.src.endswith('.s')
+    assert os.path.isfile(args.src)
 
-    p, o = sys.argv[1], sys.argv[2]
+    st = from_args(args)
 
-    assert p.endswith('.s')
-    assert os.path.isfile(p)
+    with mapped(args.src) as s:
 
-    with open(p, 'r') as fp:
+        with stage(st, 'tokenize'): tokens = tokenize(s)
 
-        s = fp.read().strip()
+        if args.opt:
+            with stage(st, 'peephole'): tokens, hits = optimize(tokens)
+            for k, v in hits.items(): print(f'{k}: {v}', file=sys.stderr)
 
-        tokens = tokenize(s)
+        Assembler(tokens).dump(args.out, st)
 
-        Assembler(tokens).dump(o)
+    report(st, args)
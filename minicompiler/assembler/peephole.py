@@ -0,0 +1,173 @@
+from collections import Counter
+from dataclasses import replace
+from minicompiler.assembler.tokens import Token, Instruction, MOV, MOVZ, MOVN, MOVK, ADD, SUB, STR, STP, LDP, SVC, RET, B, PAIR_OFFSET
+from minicompiler.assembler.tokens import BCOND, CBZ, CMP
+
+
+# general purpose registers tracked by the optimizer, SP/XZR are never renamed
+GPRS = {f'X{i}' for i in range(31)}
+
+# registers that may be read after a RET: result, callee-saved, frame and link registers
+RET_LIVE = {'X0', 'X29', 'X30'} | {f'X{i}' for i in range(19, 29)}
+
+# instructions that only read their register operands, and ones that also read their destination
+NO_DEF = (STR, SVC, RET, CMP)
+READ_DEF = (MOVK,)
+
+# a MOV immediate fits the 12-bit ADD/SUB immediate field
+MAX_IMM12 = 0xFFF
+
+MAX_PASSES = 8
+
+
+def _fields(tok: Instruction) -> list[tuple[str, str]]:
+    return [(k, v) for k, v in vars(tok).items() if k != 'name' and isinstance(v, str)]
+
+
+def _reg(x: str) -> str | None:
+    # register named by a plain or memory ('[Xn, #imm]') operand
+    r = x.strip('[]!').split(',')[0].strip()
+    return r if r in GPRS else None
+
+
+def operands(tok: Token) -> tuple[set[str], set[str]]:
+    # (defs, uses) of general purpose registers, anything that isn't a plain instruction (or leaves the block) reads everything
+    if isinstance(tok, RET): return set(), set(RET_LIVE)
+    if not isinstance(tok, Instruction) or isinstance(tok, (SVC, B, BCOND, CBZ)): return set(), set(GPRS)
+    regs = [_reg(v) for _, v in _fields(tok)]
+    if isinstance(tok, STP):
+        # LDP writes both registers, pre/post-index forms also write the base back
+        mode, base, _ = tok.mode()
+        load = isinstance(tok, LDP)
+        defs = {r for r in regs[:2] if r} if load else set()
+        if mode != PAIR_OFFSET and base in GPRS: defs.add(base)
+        return defs, {r for r in (regs[2:] if load else regs) if r}
+    if isinstance(tok, NO_DEF): return set(), {r for r in regs if r}
+    defs = {regs[0]} if regs and regs[0] else set()
+    uses = {r for r in (regs if isinstance(tok, READ_DEF) else regs[1:]) if r}
+    return defs, uses
+
+
+def _live_after(tokens: list[Token]) -> list[set[str]]:
+    # backward scan, anything past a label or directive is assumed live, nothing past a RET is
+    res: list[set[str]] = [set()] * len(tokens)
+    live = set(GPRS)
+    for i in reversed(range(len(tokens))):
+        tok = tokens[i]
+        if isinstance(tok, RET): live = set()
+        elif not isinstance(tok, Instruction): live = set(GPRS)
+        res[i] = live
+        defs, uses = operands(tok)
+        live = (live - defs) | uses
+    return res
+
+
+def _is_imm(x: str) -> bool:
+    return x[0] == '#'
+
+
+def _rename_uses(tok: Instruction, old: str, new: str) -> Instruction:
+    args = {}
+    for i, (k, v) in enumerate(_fields(tok)):
+        if i == 0 and not isinstance(tok, NO_DEF): continue
+        if v == old: args[k] = new
+        elif v.startswith('[') and _reg(v) == old: args[k] = v.replace(old, new, 1)
+    return replace(tok, **args)  # type: ignore[type-var]
+
+
+# ***************************** rules *****************************
+# each rule looks at a window of two instructions and returns a replacement, or None
+
+
+def _self_move(a, b, live_a, live_b):
+    if isinstance(a, MOV) and a.s1 == a.s2: return [b]
+    return None
+
+
+def _dead_move(a, b, live_a, live_b):
+    if isinstance(a, (MOV, MOVZ, MOVN, MOVK)) and a.s1 in GPRS and a.s1 not in live_a: return [b]
+    return None
+
+
+def _dead_after(reg: str, b: Token, live_b: set[str]) -> bool:
+    # value in reg is not needed once b has run
+    return reg not in live_b or reg in operands(b)[0] - operands(b)[1]
+
+
+def _forward_copy(a, b, live_a, live_b):
+    # MOV Xa, Xb; OP ..., Xa  ->  OP ..., Xb
+    if not isinstance(a, MOV) or _is_imm(a.s2) or a.s2 not in GPRS: return None
+    if not isinstance(b, Instruction) or isinstance(b, READ_DEF + (STP,)) or a.s1 not in operands(b)[1]: return None
+    if not _dead_after(a.s1, b, live_b): return None
+    new = _rename_uses(b, a.s1, a.s2)
+    # implicit reads (RET, SVC) can't be renamed
+    return [new] if new != b else None
+
+
+def _coalesce_copy(a, b, live_a, live_b):
+    # OP Xt, ...; MOV Xd, Xt  ->  OP Xd, ...
+    if not isinstance(b, MOV) or _is_imm(b.s2) or b.s1 not in GPRS: return None
+    if not isinstance(a, Instruction) or isinstance(a, NO_DEF + READ_DEF): return None
+    defs, _ = operands(a)
+    if defs != {b.s2} or b.s2 in live_b: return None
+    k = _fields(a)[0][0]
+    return [replace(a, **{k: b.s1})]  # type: ignore[type-var]
+
+
+def _fold_imm(a, b, live_a, live_b):
+    # MOV Xa, #imm; ADD Xd, Xn, Xa  ->  ADD Xd, Xn, #imm  (and MOV Xd, Xa  ->  MOV Xd, #imm, CMP Xn, Xa  ->  CMP Xn, #imm)
+    if not isinstance(a, MOV) or not _is_imm(a.s2) or not _dead_after(a.s1, b, live_b): return None
+    if isinstance(b, MOV) and b.s2 == a.s1:
+        return [replace(b, s2=a.s2)]
+    if isinstance(b, (ADD, SUB, CMP)) and b.s2 == a.s1 and b.s1 != a.s1 and b.s1 != 'XZR':
+        if 0 <= int(a.s2[1:], 0) <= MAX_IMM12: return [replace(b, s2=a.s2)]
+    if isinstance(b, ADD) and b.s1 == a.s1 and b.s2 != a.s1 and b.s2 in GPRS:
+        if 0 <= int(a.s2[1:], 0) <= MAX_IMM12: return [replace(b, s1=b.s2, s2=a.s2)]
+    return None
+
+
+RULES = {
+    'self-move': _self_move,
+    'dead-move': _dead_move,
+    'forward-copy': _forward_copy,
+    'coalesce-copy': _coalesce_copy,
+    'fold-imm': _fold_imm,
+}
+
+
+def optimize(tokens: list[Token]) -> tuple[list[Token], Counter[str]]:
+    # slide a two-instruction window over the stream until no rule fires, input tokens are not modified
+    hits: Counter[str] = Counter()
+    out = list(tokens)
+
+    for _ in range(MAX_PASSES):
+        live = _live_after(out)
+        res: list[Token] = []
+        changed = False
+        i = 0
+        while i < len(out):
+            a = out[i]
+            b = out[i + 1] if i + 1 < len(out) else Token('')
+            la, lb = live[i], live[i + 1] if i + 1 < len(out) else set(GPRS)
+            for name, rule in RULES.items():
+                new = rule(a, b, la, lb)
+                if new is None: continue
+                hits[name] += 1
+                res += new
+                i += 2
+                changed = True
+                break
+            else:
+                res.append(a)
+                i += 1
+        # the sentinel past the end is never kept
+        out = [x for x in res if type(x) is not Token]
+        if not changed: break
+
+    return out, hits
+
+
+def size(tokens: list[Token]) -> int:
+    # bytes of __text taken by the instructions
+    return 4 * sum(isinstance(x, Instruction) for x in tokens)
+
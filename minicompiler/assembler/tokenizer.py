@@ -1,19 +1,93 @@
 import re
 from collections import deque
-from minicompiler.assembler.tokens import Token, Directive, Label, MOV, ADR, SVC, RET, ADD
+from typing import Any, Iterable, Iterator
+from minicompiler.assembler.tokens import Token, Directive, Label, MOV, MOVZ, MOVN, MOVK, ADR, ADRP, B, BL, SVC, RET, ADD, SUB, MUL, SDIV, NEG, STR, LDR, STP, LDP
+from minicompiler.assembler.tokens import BCOND, CBZ, CBNZ, CMP, CSET, conditions
+from minicompiler.source import Text
 
 
-def lex(s: str) -> list[list[str]]:
-    def tokenize(line):
-        pattern = r'"[^"]*"|[^,\s]+'
-        return re.findall(pattern, line)
-    lines = re.sub(r'//.*', '', s).split('\n')
-    return [tokenize(line) for line in lines if line.strip()]
+# lines are cut out one at a time, operands split with one findall (strings and [..] may hold commas and spaces)
+LINE = re.compile(r'[^\n]+')
+BLINE = re.compile(rb'[^\n]+')
+OPERAND = re.compile(r'"[^"]*"|\[[^\]]*\]!?|(?:LSL|lsl) #\w+|[^,\s]+')
+
+
+def lex(s: Text) -> Iterator[list[str]]:
+    # operands per line, lines without any are skipped, bytes (a mapped file) are decoded a line at a time
+    buf: Any = s
+    for m in (LINE if isinstance(s, str) else BLINE).finditer(buf):
+        x = m.group()
+        line = x if isinstance(x, str) else x.decode()
+        if (i := line.find('//')) >= 0: line = line[:i]
+        if ops := OPERAND.findall(line): yield ops
+
+
+OPS = {
+    'mov': MOV,
+    'MOV': MOV,
+    'movz': MOVZ,
+    'MOVZ': MOVZ,
+    'movn': MOVN,
+    'MOVN': MOVN,
+    'movk': MOVK,
+    'MOVK': MOVK,
+    'adr': ADR,
+    'ADR': ADR,
+    'adrp': ADRP,
+    'ADRP': ADRP,
+    'b': B,
+    'B': B,
+    'bl': BL,
+    'BL': BL,
+    'add': ADD,
+    'ADD': ADD,
+    'svc': SVC,
+    'SVC': SVC,
+    'sub': SUB,
+    'SUB': SUB,
+    'mul': MUL,
+    'MUL': MUL,
+    'sdiv': SDIV,
+    'SDIV': SDIV,
+    'neg': NEG,
+    'NEG': NEG,
+    'str': STR,
+    'STR': STR,
+    'ldr': LDR,
+    'LDR': LDR,
+    'stp': STP,
+    'STP': STP,
+    'ldp': LDP,
+    'LDP': LDP,
+    'ret': RET,
+    'RET': RET,
+    'cbz': CBZ,
+    'CBZ': CBZ,
+    'cbnz': CBNZ,
+    'CBNZ': CBNZ,
+    'cmp': CMP,
+    'CMP': CMP,
+    'cset': CSET,
+    'CSET': CSET,
+}
+
+# B.EQ, b.eq, ...
+OPS |= {f'B.{c}': BCOND for c in conditions} | {f'b.{c.lower()}': BCOND for c in conditions}
+
+
+def instruction(line: list[str]) -> Token:
+    return OPS[line[0]](*line)
+
+
+def token(line: list[str]) -> Token:
+    # one lexed line -> token, lets codegen skip the text round trip
+    if line[0].startswith('.'): return Directive(*line)
+    if line[0].endswith(':'): return Label(line[0][:-1])
+    return instruction(line)
 
 
 class Parser:
-    def __init__(self, tokens: list[list[str]]):
-        self.tokens: list[list[str]] = tokens
+    def __init__(self, tokens: Iterable[list[str]]):
         self.q: deque[list[str]] = deque(tokens)
         self.out: list[Token] = []
 
@@ -33,17 +107,7 @@ class Parser:
         self.out.append(Label(name))
 
     def _statement(self):
-        ops = {
-            'mov': MOV,
-            'MOV': MOV,
-            'adr': ADR,
-            'add': ADD,
-            'svc': SVC,
-            'ADD': ADD,
-            'RET': RET
-        }
-        op = self._consume()
-        self.out.append(ops[op[0]](*op))
+        self.out.append(instruction(self._consume()))
 
     def _line(self):
         if self._test(lambda x: x[0].startswith('.')):
@@ -57,7 +121,7 @@ class Parser:
         return self.out
 
 
-def tokenize(asm: str) -> list[Token]:
+def tokenize(asm: Text) -> list[Token]:
 
     a = lex(asm)
 
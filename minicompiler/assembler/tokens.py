@@ -1,5 +1,6 @@
 import struct
 from dataclasses import dataclass, field
+from typing import ClassVar
 from abc import abstractmethod
 
 
@@ -26,6 +27,10 @@ class Instruction(Token):
     def decode(self, b: bool = True) -> int | bytes:
         raise NotImplementedError()
 
+    def symbol(self) -> str | None:
+        # symbol whose address goes into the instruction, if any
+        return None
+
     def __repr__(self):
         r = _fmt_int(self.decode(b=False))
         b = _fmt_bytes(self.decode(b=True))
@@ -41,7 +46,22 @@ opcodes = {
     'movz': 0b100101,
     'mov': 0b0101010,
     'adr': 0b10000,
+    'b': 0b000101,
+    'bl': 0b100101,
     'add': 0b10001011000,
+    'addi': 0b1001000100,
+    'sub': 0b11001011000,
+    'subi': 0b1101000100,
+    'subs': 0b11101011000,
+    'subsi': 0b1111000100,
+    'csinc': 0b10011010100,
+    'bcond': 0b01010100,
+    'cbz': 0b011010,
+    'str': 0b1111100100,
+    'ldr': 0b1111100101,
+    'stp': 0b1010100,
+    'madd': 0b10011011000,
+    'sdiv': 0b10011010110,
 }
 
 registers = {
@@ -75,7 +95,28 @@ registers = {
     'X27': 0b11011,
     'X28': 0b11100,
     'X29': 0b11101,
-    'X30': 0b11110
+    'X30': 0b11110,
+    'SP': 0b11111,
+    'XZR': 0b11111,
+}
+
+# condition codes (B.cond, CSET), each odd code is the inverse of the even one before it
+conditions = {
+    'EQ': 0b0000,
+    'NE': 0b0001,
+    'HS': 0b0010,
+    'LO': 0b0011,
+    'MI': 0b0100,
+    'PL': 0b0101,
+    'VS': 0b0110,
+    'VC': 0b0111,
+    'HI': 0b1000,
+    'LS': 0b1001,
+    'GE': 0b1010,
+    'LT': 0b1011,
+    'GT': 0b1100,
+    'LE': 0b1101,
+    'AL': 0b1110,
 }
 
 
@@ -108,6 +149,38 @@ class MOV(Instruction):
         raise ValueError()
 
 
+@dataclass(repr=False)
+class MOVZ(Instruction):
+    s1: str
+    s2: str
+    s3: str = 'LSL #0'
+
+    opc: ClassVar[int] = 0b10
+
+    # ISA page 1801, 1797, 1799 (MOVZ, MOVN, MOVK)
+    def decode(self, b: bool = True) -> int | bytes:
+        shift = int(self.s3.split('#')[1], 0)
+        out = 0
+        out |= 1 << 31                              # [31] sf -- 64-bit variant
+        out |= self.opc << 29                       # [29-30] MOVN/MOVZ/MOVK identifier
+        out |= opcodes['movz'] << 23                # [23-28] opcode
+        out |= (shift // 16) << 21                  # [21-22] hw -- shift in 16-bit steps
+        out |= (int(self.s2[1:], 0) & 0xFFFF) << 5  # [5-20] immediate value
+        out |= registers[self.s1]                   # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class MOVN(MOVZ):
+    opc: ClassVar[int] = 0b00
+
+
+@dataclass(repr=False)
+class MOVK(MOVZ):
+    opc: ClassVar[int] = 0b11
+
+
 @dataclass(repr=False)
 class ADR(Instruction):
     s1: str
@@ -125,6 +198,126 @@ class ADR(Instruction):
         if not b: return out
         return struct.pack('<I', out)
 
+    def symbol(self) -> str | None:
+        return self.s2
+
+
+@dataclass(repr=False)
+class ADRP(Instruction):
+    s1: str
+    s2: str
+    # in 4K pages, filled in by the linker
+    imm: int = 0
+
+    # as ADR, in 4K pages relative to the page of the instruction
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= 1 << 31                           # [31] op -- page variant
+        out |= (self.imm & 0x3) << 29            # [29-30] 2-bit lower immediate
+        out |= opcodes['adr'] << 24              # [24-28] opcode
+        out |= ((self.imm >> 2) & 0x7FFFF) << 5  # [5-23] 19-bit upper immediate
+        out |= registers[self.s1]                # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return self.s2.removesuffix('@PAGE')
+
+
+@dataclass(repr=False)
+class B(Instruction):
+    s1: str
+    imm: int = 0
+
+    op: ClassVar[str] = 'b'
+
+    # B, BL: 26-bit offset in instructions, BL also writes the return address to X30
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes[self.op] << 26            # [26-31] opcode
+        out |= (self.imm >> 2) & 0x3FFFFFF       # [0-25] offset in instructions
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return self.s1
+
+
+@dataclass(repr=False)
+class BL(B):
+    op: ClassVar[str] = 'bl'
+
+
+@dataclass(repr=False)
+class BCOND(Instruction):
+    s1: str
+    imm: int = 0
+
+    # B.cond: 19-bit offset in instructions, the condition comes from the mnemonic ('B.LT')
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes['bcond'] << 24             # [24-31] opcode
+        out |= ((self.imm >> 2) & 0x7FFFF) << 5   # [5-23] offset in instructions
+        out |= conditions[self.name[2:].upper()]  # [0-3] condition
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return self.s1
+
+
+@dataclass(repr=False)
+class CBZ(Instruction):
+    s1: str
+    s2: str
+    imm: int = 0
+
+    op: ClassVar[int] = 0
+
+    # CBZ, CBNZ: branch if the register is (not) zero, 19-bit offset in instructions
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= 1 << 31                            # [31] sf -- 64-bit variant
+        out |= opcodes['cbz'] << 25               # [25-30] opcode
+        out |= self.op << 24                      # [24] op -- CBNZ
+        out |= ((self.imm >> 2) & 0x7FFFF) << 5   # [5-23] offset in instructions
+        out |= registers[self.s1]                 # [0-4] tested register
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return self.s2
+
+
+@dataclass(repr=False)
+class CBNZ(CBZ):
+    op: ClassVar[int] = 1
+
+
+def _pageoff(s: str) -> str | None:
+    # 'sym@PAGEOFF' -> 'sym', the low 12 bits of its address are filled in by the linker
+    return s.removesuffix('@PAGEOFF') if s.endswith('@PAGEOFF') else None
+
+
+def _imm12(opcode: int, dst: str, src: str, imm: str) -> int:
+    out = 0
+    out |= opcode << 22                       # [22-31] opcode
+    out |= (int(imm[1:], 0) & 0xFFF) << 10  # [10-21] 12-bit unsigned immediate
+    out |= registers[src] << 5              # [5-9] src register
+    out |= registers[dst]                   # [0-4] destination register
+    return out
+
+
+def _mem(s: str) -> tuple[str, int]:
+    # '[Xn, #imm]', '[Xn, #imm]!', '[Xn]' or '[Xn, sym@PAGEOFF]' (offset 0 until linked)
+    base, *off = s.rstrip('!').strip('[]').replace(' ', '').split(',')
+    return base, int(off[0][1:], 0) if off and off[0][0] == '#' else 0
+
+
+def _mem_symbol(s: str) -> str | None:
+    _, *off = s.strip('[]').replace(' ', '').split(',')
+    return _pageoff(off[0]) if off else None
+
 
 def _fmt_bytes(b: bytes) -> str:
     return " ".join(f"0x{x:02X}" for x in b)
@@ -140,8 +333,13 @@ class ADD(Instruction):
     s1: str
     s2: str
 
-    # ISA page 1254
+    # ISA page 1254, 1250
     def decode(self, b: bool = True) -> int | bytes:
+        # immediate, or the page offset of a symbol
+        if self.s2[0] == '#' or _pageoff(self.s2):
+            out = _imm12(opcodes['addi'], self.dst, self.s1, '#0' if _pageoff(self.s2) else self.s2)
+            if not b: return out
+            return struct.pack('<I', out)
         out = 0
         out |= opcodes['add'] << 21      # [21-31] opcode
         out |= registers[self.s2] << 16  # [16-20] src register 2
@@ -150,9 +348,207 @@ class ADD(Instruction):
         if not b: return out
         return struct.pack('<I', out)
 
+    def symbol(self) -> str | None:
+        return _pageoff(self.s2)
+
+
+@dataclass(repr=False)
+class SUB(Instruction):
+    dst: str
+    s1: str
+    s2: str
+
+    # ISA page 2150, 2146
+    def decode(self, b: bool = True) -> int | bytes:
+        # immediate
+        if self.s2[0] == '#':
+            out = _imm12(opcodes['subi'], self.dst, self.s1, self.s2)
+            if not b: return out
+            return struct.pack('<I', out)
+        out = 0
+        out |= opcodes['sub'] << 21      # [21-31] opcode
+        out |= registers[self.s2] << 16  # [16-20] src register 2
+        out |= registers[self.s1] << 5   # [5-9] src register 1
+        out |= registers[self.dst]       # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class CMP(Instruction):
+    s1: str
+    s2: str
+
+    # alias of SUBS into XZR, only the flags are kept
+    def decode(self, b: bool = True) -> int | bytes:
+        if self.s2[0] == '#':
+            out = _imm12(opcodes['subsi'], 'XZR', self.s1, self.s2)
+            if not b: return out
+            return struct.pack('<I', out)
+        out = 0
+        out |= opcodes['subs'] << 21     # [21-31] opcode
+        out |= registers[self.s2] << 16  # [16-20] src register 2
+        out |= registers[self.s1] << 5   # [5-9] src register 1
+        out |= registers['XZR']          # [0-4] zero register (XZR)
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class CSET(Instruction):
+    s1: str
+    s2: str
+
+    # alias of CSINC Xd, XZR, XZR with the inverted condition: 1 if the condition holds, else 0
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes['csinc'] << 21                     # [21-31] opcode
+        out |= registers['XZR'] << 16                     # [16-20] zero register (XZR)
+        out |= (conditions[self.s2.upper()] ^ 1) << 12    # [12-15] inverted condition
+        out |= 0b01 << 10                                 # [10-11] o2 -- increment
+        out |= registers['XZR'] << 5                      # [5-9] zero register (XZR)
+        out |= registers[self.s1]                         # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class MUL(Instruction):
+    dst: str
+    s1: str
+    s2: str
+
+    # ISA page 1720 (alias of MADD with XZR addend)
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes['madd'] << 21     # [21-31] opcode
+        out |= registers[self.s2] << 16  # [16-20] src register 2
+        out |= 0b11111 << 10             # [10-14] addend register (XZR)
+        out |= registers[self.s1] << 5   # [5-9] src register 1
+        out |= registers[self.dst]       # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class SDIV(Instruction):
+    dst: str
+    s1: str
+    s2: str
+
+    # ISA page 1926
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes['sdiv'] << 21     # [21-31] opcode
+        out |= registers[self.s2] << 16  # [16-20] src register 2
+        out |= 0b000011 << 10            # [10-15] opcode2
+        out |= registers[self.s1] << 5   # [5-9] src register 1
+        out |= registers[self.dst]       # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+# ***************************** memory ops *****************************
+
+
+@dataclass(repr=False)
+class STR(Instruction):
+    s1: str
+    s2: str
+
+    # ISA page 2044 (unsigned offset)
+    def decode(self, b: bool = True) -> int | bytes:
+        base, off = _mem(self.s2)
+        out = 0
+        out |= opcodes['str'] << 22               # [22-31] opcode
+        out |= ((off >> 3) & 0xFFF) << 10         # [10-21] 12-bit offset, scaled by 8
+        out |= registers[base] << 5               # [5-9] base register
+        out |= registers[self.s1]                 # [0-4] source register
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return _mem_symbol(self.s2)
+
+
+@dataclass(repr=False)
+class LDR(Instruction):
+    s1: str
+    s2: str
+
+    # ISA page 1631 (unsigned offset)
+    def decode(self, b: bool = True) -> int | bytes:
+        base, off = _mem(self.s2)
+        out = 0
+        out |= opcodes['ldr'] << 22               # [22-31] opcode
+        out |= ((off >> 3) & 0xFFF) << 10         # [10-21] 12-bit offset, scaled by 8
+        out |= registers[base] << 5               # [5-9] base register
+        out |= registers[self.s1]                 # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+    def symbol(self) -> str | None:
+        return _mem_symbol(self.s2)
+
+# pair addressing modes, bits [23-24]
+PAIR_POST = 0b01
+PAIR_OFFSET = 0b10
+PAIR_PRE = 0b11
+
+
+@dataclass(repr=False)
+class STP(Instruction):
+    s1: str
+    s2: str
+    s3: str
+    # post-index: 'STP Xa, Xb, [Xn], #imm'
+    s4: str | None = None
+
+    load: ClassVar[int] = 0
+
+    def mode(self) -> tuple[int, str, int]:
+        # (addressing mode, base register, offset in bytes)
+        base, off = _mem(self.s3)
+        if self.s4 is not None: return PAIR_POST, base, int(self.s4[1:], 0)
+        return (PAIR_PRE if self.s3.endswith('!') else PAIR_OFFSET), base, off
+
+    # STP/LDP (64-bit): post-index, signed offset or pre-index, L selects the load
+    def decode(self, b: bool = True) -> int | bytes:
+        mode, base, off = self.mode()
+        out = 0
+        out |= opcodes['stp'] << 25               # [25-31] opcode (64-bit, integer)
+        out |= mode << 23                         # [23-24] addressing mode
+        out |= self.load << 22                    # [22] L -- load
+        out |= ((off >> 3) & 0x7F) << 15          # [15-21] 7-bit signed offset, scaled by 8
+        out |= registers[self.s2] << 10           # [10-14] second register
+        out |= registers[base] << 5               # [5-9] base register
+        out |= registers[self.s1]                 # [0-4] first register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
+@dataclass(repr=False)
+class LDP(STP):
+    load: ClassVar[int] = 1
+
 # ***************************** unary ops *****************************
 
 
+@dataclass(repr=False)
+class NEG(Instruction):
+    dst: str
+    s1: str
+
+    # ISA page 1744 (alias of SUB from XZR)
+    def decode(self, b: bool = True) -> int | bytes:
+        out = 0
+        out |= opcodes['sub'] << 21      # [21-31] opcode
+        out |= registers[self.s1] << 16  # [16-20] src register
+        out |= 0b11111 << 5              # [5-9] zero register (XZR)
+        out |= registers[self.dst]       # [0-4] destination register
+        if not b: return out
+        return struct.pack('<I', out)
+
+
 @dataclass(repr=False)
 class SVC(Instruction):
     s1: str
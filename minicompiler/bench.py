@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import gc
+import sys
+import json
+import math
+import time
+import random
+import platform
+import argparse
+from typing import Callable, Any
+from minicompiler import __version__
+from minicompiler.compiler.lexer import lex
+from minicompiler.compiler.parser import Parser  # pylint: disable=deprecated-module
+from minicompiler.compiler.tree import fold, gen_ir
+from minicompiler.compiler.passes import optimize
+from minicompiler.compiler.codegen import gen_asm
+from minicompiler.assembler.tokenizer import tokenize
+from minicompiler.assembler.main import Assembler
+from minicompiler.linker.main import link
+
+
+# scaling axes and their starting point, each run grows one axis and keeps the others here
+BASE = {
+    'functions': 8,   # functions per program
+    'decls': 32,      # declarations per function
+    'chain': 8,       # operands per expression
+    'idents': 8,      # how many of the latest variables an expression may refer to
+}
+SCALES = [1, 2, 4, 8]
+
+# comparison: slower by more than threshold x, or a steeper fit by more than slack, is a regression
+# (a quadratic path shows up as about +1), stages under MIN_TIME are too noisy to judge
+THRESHOLD = 1.5
+EXPONENT_SLACK = 0.5
+MIN_TIME = 1e-3
+
+
+# ***************************** programs *****************************
+
+
+def generate(seed: int = 0, functions: int = 8, decls: int = 32, chain: int = 8, idents: int = 8, params: int = 4) -> str:
+    # valid program whose size follows the arguments, parameters keep the folder from computing everything
+    rng = random.Random(seed)
+
+    def expr(names: list[str]) -> str:
+        window = names[-idents:]
+        terms = [rng.choice(window) if rng.random() < 0.8 else str(rng.randint(1, 1000)) for _ in range(chain)]
+        s = terms[0]
+        for t in terms[1:]:
+            op = rng.choice('+-*+-')
+            s = f'({s} {op} {t})' if rng.random() < 0.2 else f'{s} {op} {t}'
+        # division by a non-zero constant only
+        return f'{s} / {rng.randint(1, 9)}' if rng.random() < 0.1 else s
+
+    res = []
+    for i in range(functions):
+        args = [f'a{j}' for j in range(params)]
+        names = list(args)
+        lines = []
+        for j in range(decls):
+            lines.append(f'    int v{j} = {expr(names)};')
+            names.append(f'v{j}')
+        lines.append(f'    return {expr(names)};')
+        sig = ', '.join(f'int {x}' for x in args)
+        res.append(f'int f{i}({sig}) {{\n' + '\n'.join(lines) + '\n}')
+    res.append('int _start() {\n    return 0;\n}')
+    return '\n\n'.join(res)
+
+
+# ***************************** stages *****************************
+
+
+def stages(s: str, opt: int) -> list[tuple[str, Callable[[Any], Any]]]:
+    # (name, input -> output), each stage feeds the next
+    # pylint: disable=unnecessary-lambda
+    return [
+        ('lex', lambda _: list(lex(s))),
+        ('parse', lambda toks: Parser(toks).build()),
+        ('fold', lambda ast: fold(ast) if opt else ast),
+        ('gen_ir', lambda ast: gen_ir(ast)),
+        ('optimize', lambda ir: (optimize(ir, opt), ir)[1]),
+        ('gen_asm', lambda ir: gen_asm(ir)),
+        ('tokenize', lambda asm: tokenize(asm)),
+        ('encode', lambda tokens: (a := Assembler(tokens), a.encode())[0]),
+        ('macho', lambda a: a.builder().build()),
+        ('link', lambda o: link([o])),
+    ]
+
+
+def measure(s: str, opt: int = 0, repeat: int = 5) -> dict[str, float]:
+    # best time per stage, every repeat runs the whole chain on fresh inputs, collections happen between runs (as in timeit)
+    best: dict[str, float] = {}
+    for _ in range(repeat):
+        x: Any = None
+        gc.collect()
+        gc.disable()
+        try:
+            for name, f in stages(s, opt):
+                t = time.perf_counter()
+                x = f(x)
+                dt = time.perf_counter() - t
+                best[name] = min(best.get(name, dt), dt)
+        finally:
+            gc.enable()
+    return best
+
+
+def exponent(sizes: list[int], times: list[float]) -> float:
+    # least squares slope of log(time) against log(size), t ~ size^k
+    xs = [math.log(x) for x in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in times]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    var = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else 0.0
+
+
+def run(axes: list[str], scales: list[int], opt: int = 0, repeat: int = 5, seed: int = 0, log=sys.stderr) -> dict:
+    res: dict[str, Any] = {
+        'meta': {'version': __version__, 'python': platform.python_version(), 'machine': platform.machine(),
+                 'opt': opt, 'seed': seed, 'repeat': repeat, 'base': BASE},
+        'axes': {},
+    }
+    for axis in axes:
+        sizes = [BASE[axis] * k for k in scales]
+        times: dict[str, list[float]] = {}
+        for n in sizes:
+            cfg = dict(BASE, **{axis: n})
+            # enough variables for the widest window, the same number at every size
+            if axis == 'idents': cfg['decls'] = max(cfg['decls'], sizes[-1])
+            s = generate(seed, **cfg)
+            for k, v in measure(s, opt, repeat).items(): times.setdefault(k, []).append(v)
+            print(f'{axis}={n}: {len(s)} bytes, {sum(t[-1] for t in times.values()):.3f}s', file=log)
+        res['axes'][axis] = {
+            'sizes': sizes,
+            'stages': {k: {'times': v, 'exponent': exponent(sizes, v)} for k, v in times.items()},
+        }
+    return res
+
+
+def compare(base: dict, new: dict, threshold: float = THRESHOLD, slack: float = EXPONENT_SLACK) -> list[str]:
+    # regressions of new against base, per axis and stage, at the largest common size
+    res = []
+    for axis, a in new['axes'].items():
+        if axis not in base['axes']: continue
+        b = base['axes'][axis]
+        common = [n for n in a['sizes'] if n in b['sizes']]
+        if not common: continue
+        i, j = a['sizes'].index(common[-1]), b['sizes'].index(common[-1])
+        for stage, x in a['stages'].items():
+            if stage not in b['stages']: continue
+            y = b['stages'][stage]
+            t, u = x['times'][i], y['times'][j]
+            if u >= MIN_TIME and t > threshold * u:
+                res.append(f'{axis}/{stage}: {1e3 * u:.2f}ms -> {1e3 * t:.2f}ms at {common[-1]} ({t / u:.2f}x)')
+            if max(t, u) >= MIN_TIME and x['exponent'] > y['exponent'] + slack:
+                res.append(f'{axis}/{stage}: exponent {y["exponent"]:.2f} -> {x["exponent"]:.2f}')
+    return res
+
+
+def table(res: dict) -> list[str]:
+    lines = []
+    for axis, a in res['axes'].items():
+        lines.append(f'{axis} {a["sizes"]}')
+        for stage, x in a['stages'].items():
+            ms = ' '.join(f'{1e3 * t:9.2f}' for t in x['times'])
+            lines.append(f'  {stage:<10} {ms}   k={x["exponent"]:.2f}')
+    return lines
+
+
+if __name__ == '__main__':
+    '''
+    per-stage compile times over growing programs, t ~ size^k fitted per axis
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-a', dest='axes', nargs='+', choices=list(BASE), default=list(BASE))
+    ap.add_argument('-s', dest='scales', nargs='+', type=int, default=SCALES, help='multiples of the base size')
+    ap.add_argument('-O', dest='opt', type=int, default=0)
+    ap.add_argument('-r', dest='repeat', type=int, default=5)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('-o', dest='out', default=None, help='write results as JSON')
+    ap.add_argument('--compare', default=None, help='baseline JSON, exit 1 on regressions')
+    ap.add_argument('--threshold', type=float, default=THRESHOLD, help='allowed slowdown factor')
+    ap.add_argument('--slack', type=float, default=EXPONENT_SLACK, help='allowed increase of a fitted exponent')
+    args = ap.parse_args()
+
+    r = run(args.axes, args.scales, args.opt, args.repeat, args.seed)
+    print('\n'.join(table(r)))
+
+    if args.out:
+        with open(args.out, 'w') as fp: json.dump(r, fp, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as fp: bad = compare(json.load(fp), r, args.threshold, args.slack)
+        for x in bad: print(f'regression: {x}', file=sys.stderr)
+        sys.exit(1 if bad else 0)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from minicompiler.pipeline import build
+from minicompiler.source import mapped
+from minicompiler.cache import Cache, CACHE_DIR, MAX_BYTES
+from minicompiler.linker.main import Linker, LinkerError
+
+
+# per-worker state, set up once by the pool initializer
+_cache: Cache | None = None
+
+
+def _init(cache_dir: str | None, cache_size: int):
+    # imports are already done by the time this runs, one tiny build warms up the rest
+    global _cache  # pylint: disable=global-statement
+    _cache = Cache(cache_dir, cache_size) if cache_dir else None
+    build('int _start() { return 0; }')
+
+
+def compile_unit(path: str, opt: int = 1, peephole: bool = False) -> bytes:
+    # one translation unit: lex -> parse -> codegen -> assemble
+    with mapped(path) as s: return build(s, opt, peephole=peephole, cache=_cache)
+
+
+def build_all(paths: list[str], jobs: int = 0, opt: int = 1, peephole: bool = False,
+              cache_dir: str | None = None, cache_size: int = MAX_BYTES) -> tuple[dict[str, bytes], dict[str, Exception]]:
+    # source path -> object bytes, and source path -> error for units that failed
+    res: dict[str, bytes] = {}
+    errors: dict[str, Exception] = {}
+    jobs = jobs or os.cpu_count() or 1
+
+    if jobs == 1 or len(paths) == 1:
+        _init(cache_dir, cache_size)
+        for p in paths:
+            try: res[p] = compile_unit(p, opt, peephole)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors[p] = e
+        return res, errors
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(paths)), initializer=_init, initargs=(cache_dir, cache_size)) as ex:
+        futures = {ex.submit(compile_unit, p, opt, peephole): p for p in paths}
+        for f in as_completed(futures):
+            p = futures[f]
+            try: res[p] = f.result()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors[p] = e
+
+    return res, errors
+
+
+def object_path(src: str, outdir: str | None) -> str:
+    base = os.path.splitext(src)[0] + '.o'
+    return os.path.join(outdir, os.path.basename(base)) if outdir else base
+
+
+if __name__ == '__main__':
+    '''
+    many .c -> many .o, one process per core
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('src', nargs='+')
+    ap.add_argument('-j', dest='jobs', type=int, default=0, help='worker processes (default: one per core)')
+    ap.add_argument('-O', dest='opt', type=int, default=1)
+    ap.add_argument('-P', dest='peephole', action='store_true', help='run the peephole optimizer')
+    ap.add_argument('-o', dest='outdir', default=None, help='directory for the objects (default: next to the sources)')
+    ap.add_argument('-x', dest='exe', default=None, help='also link the objects into this executable')
+    ap.add_argument('--cache', nargs='?', const=CACHE_DIR, default=None, help='reuse artifacts from this directory')
+    ap.add_argument('--cache-size', type=int, default=MAX_BYTES, help='cache size cap in bytes')
+    args = ap.parse_args()
+
+    if args.outdir: os.makedirs(args.outdir, exist_ok=True)
+
+    objs, errs = build_all(args.src, args.jobs, args.opt, args.peephole, args.cache, args.cache_size)
+
+    for src, o in objs.items():
+        with open(object_path(src, args.outdir), 'wb') as fp: fp.write(o)
+    for src, e in errs.items():
+        print(f'{src}: {e}', file=sys.stderr)
+
+    # objects go to the linker in command line order
+    if args.exe and not errs:
+        try: exe = Linker([objs[x] for x in args.src], name=os.path.basename(args.exe), names=args.src).link()
+        except LinkerError as e:
+            print(f'{args.exe}: {e}', file=sys.stderr)
+            sys.exit(1)
+        with open(args.exe, 'wb') as fp: fp.write(exe)
+        os.chmod(args.exe, 0o755)
+
+    sys.exit(1 if errs else 0)
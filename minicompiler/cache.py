@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from minicompiler import __version__
+from minicompiler.source import Text
+
+
+# default location and size cap, both overridable from the environment
+CACHE_DIR = os.environ.get('MINICOMPILER_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'minicompiler'))
+MAX_BYTES = int(os.environ.get('MINICOMPILER_CACHE_SIZE', 256 << 20))
+
+
+def fingerprint(root: str) -> str:
+    # hash of the .py sources under root, nobody bumps __version__ on every codegen change
+    h = hashlib.sha256()
+    for d, dirs, files in os.walk(root):
+        dirs.sort()
+        for f in sorted(files):
+            if not f.endswith('.py'): continue
+            p = os.path.join(d, f)
+            h.update(os.path.relpath(p, root).encode() + b'\0')
+            with open(p, 'rb') as fp: h.update(fp.read())
+    return h.hexdigest()
+
+
+# the compiler that produced an artifact, computed once at import
+VERSION = f'{__version__}+{fingerprint(os.path.dirname(os.path.abspath(__file__)))}'
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    def __str__(self):
+        n = self.hits + self.misses
+        rate = f'{100 * self.hits / n:.1f}%' if n else '-'
+        return f'cache: {self.hits} hits, {self.misses} misses ({rate}), {self.writes} writes, {self.evictions} evictions'
+
+
+class Cache:
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        # artifacts live at root/ab/abcdef....<kind>, mtime doubles as the LRU clock
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+
+        # total size on disk, counted on first write
+        self.size: int | None = None
+
+    @staticmethod
+    def key(source: Text, **options) -> str:
+        # same source, compiler and options -> same key
+        h = hashlib.sha256()
+        h.update(VERSION.encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        h.update(source.encode() if isinstance(source, str) else source)
+        return h.hexdigest()
+
+    def _path(self, key: str, kind: str) -> str:
+        return os.path.join(self.root, key[:2], f'{key}.{kind}')
+
+    def get(self, key: str, kind: str, count: bool = True) -> bytes | None:
+        # count=False for secondary lookups, so hits and misses stay one per build
+        path = self._path(key, kind)
+        try:
+            with open(path, 'rb') as fp: data = fp.read()
+            os.utime(path)
+        except FileNotFoundError:
+            if count: self.stats.misses += 1
+            return None
+        if count: self.stats.hits += 1
+        return data
+
+    def put(self, key: str, kind: str, data: bytes):
+        # written to a temp file next to the target and renamed, readers never see partial artifacts
+        path = self._path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # an overwritten artifact no longer counts towards the size
+        try: old = os.stat(path).st_size
+        except FileNotFoundError: old = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp: fp.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.stats.writes += 1
+
+        if self.size is None: self.size = sum(n for _, n, _ in self._entries())
+        else: self.size += len(data) - old
+        if self.size > self.max_bytes: self.evict()
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        # (path, size, mtime) of every artifact
+        res = []
+        for d, _, files in os.walk(self.root):
+            for f in files:
+                if f.startswith('.tmp'): continue
+                p = os.path.join(d, f)
+                try: st = os.stat(p)
+                except FileNotFoundError: continue
+                res.append((p, st.st_size, st.st_mtime))
+        return res
+
+    def evict(self, max_bytes: int | None = None):
+        # drop least recently used artifacts until the cache fits
+        cap = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries(), key=lambda x: x[2])
+        size = sum(n for _, n, _ in entries)
+        for p, n, _ in entries:
+            if size <= cap: break
+            try: os.unlink(p)
+            except FileNotFoundError: pass
+            size -= n
+            self.stats.evictions += 1
+        self.size = size
+
+    def clear(self):
+        self.evict(0)
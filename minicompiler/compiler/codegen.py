@@ -0,0 +1,146 @@
+from typing import TextIO
+from collections import Counter
+from minicompiler.compiler.ir import Module, Function, Ins, COMPARE
+from minicompiler.compiler.emitter import Emitter
+from minicompiler.compiler.regalloc import RegisterAllocator
+from minicompiler.assembler.tokens import Token
+from minicompiler.stats import Stats
+
+
+# IR op -> AArch64 mnemonic for ops that map one to one
+OPCODES = {
+    'copy': 'MOV',
+    'add': 'ADD',
+    'sub': 'SUB',
+    'mul': 'MUL',
+    'div': 'SDIV',
+    'neg': 'NEG',
+}
+
+# IR comparison -> condition code (signed), and each condition's inverse
+CONDITIONS = {'lt': 'LT', 'le': 'LE', 'gt': 'GT', 'ge': 'GE', 'eq': 'EQ', 'ne': 'NE'}
+INVERSE = {'LT': 'GE', 'GE': 'LT', 'LE': 'GT', 'GT': 'LE', 'EQ': 'NE', 'NE': 'EQ'}
+
+# AAPCS64: the first eight integer arguments and the result go in X0-X7/X0, no stack arguments yet
+ARG_REGS = [f'X{i}' for i in range(8)]
+
+
+def mov_imm(em: Emitter, dst: str | None, val: int):
+    # materialize a 64-bit constant 16 bits at a time (MOVZ/MOVN + MOVK)
+    chunks = [(val >> (16 * i)) & 0xFFFF for i in range(4)]
+    inverted = chunks.count(0xFFFF) > chunks.count(0)
+    skip = 0xFFFF if inverted else 0
+    parts = [i for i, c in enumerate(chunks) if c != skip] or [0]
+
+    first = parts[0]
+    if not inverted and first == 0:
+        em.ins('MOV', dst, f'#{chunks[0]}')
+    elif inverted:
+        em.ins('MOVN', dst, f'#{~chunks[first] & 0xFFFF}', f'LSL #{16 * first}')
+    else:
+        em.ins('MOVZ', dst, f'#{chunks[first]}', f'LSL #{16 * first}')
+
+    for i in parts[1:]:
+        em.ins('MOVK', dst, f'#{chunks[i]}', f'LSL #{16 * i}')
+
+
+def fused(fn: Function) -> dict[str, Ins]:
+    # comparisons only read by the branch right after them: CMP + B.cond instead of CSET + CBNZ
+    uses = Counter(a for b in fn.blocks for x in b.ins for a in x.uses())
+    res = {}
+    for b in fn.blocks:
+        if len(b.ins) < 2: continue
+        cmp, br = b.ins[-2:]
+        if br.op == 'br' and cmp.op in COMPARE and cmp.dst and cmp.dst == br.args[0] and uses[cmp.dst] == 1:
+            res[cmp.dst] = cmp
+    return res
+
+
+def branch_targets(fn: Function) -> set[str]:
+    # labels the emitted branches refer to, a block reached by falling through needs none
+    res: set[str] = set()
+    for k, b in enumerate(fn.blocks):
+        nxt = fn.blocks[k + 1].label if k + 1 < len(fn.blocks) else None
+        if t := b.terminator(): res.update(x for x in t.targets() if x != nxt)
+    return res
+
+
+def gen_branch(em: Emitter, x: Ins, cmp: Ins | None, nxt: str | None):
+    # falls through to the next block where it can
+    c, t, f = x.args
+    if cmp is not None:
+        cond = CONDITIONS[cmp.op]
+        em.ins('CMP', *cmp.args)
+        if t == nxt: em.ins(f'B.{INVERSE[cond]}', f)
+        else: em.ins(f'B.{cond}', t)
+    elif t == nxt: em.ins('CBZ', c, f)
+    else: em.ins('CBNZ', c, t)
+    if nxt not in (t, f): em.ins('B', f)
+
+
+def gen_function(fn: Function, em: Emitter, stats: Stats | None = None):
+    if len(fn.params) > len(ARG_REGS): raise ValueError(f'{fn.name}: more than {len(ARG_REGS)} parameters')
+
+    em.directive('.global', fn.name)
+    em.label(fn.name)
+
+    targets, cmps = branch_targets(fn), fused(fn)
+
+    # buffer the body so registers are allocated over the whole function
+    body = Emitter()
+    for k, b in enumerate(fn.blocks):
+        nxt = fn.blocks[k + 1].label if k + 1 < len(fn.blocks) else None
+        if b.label in targets: body.label(b.label)
+        for x in b.ins:
+            if x.dst in cmps: continue
+            match x.op:
+                case 'const':
+                    mov_imm(body, x.dst, x.args[0])
+                case 'arg':
+                    body.ins('MOV', x.dst, ARG_REGS[x.args[0]])
+                case 'ret':
+                    body.ins('MOV', 'X0', x.args[0])
+                    body.ins('RET')
+                case 'call':
+                    name, args = x.args[0], x.args[1:]
+                    if len(args) > len(ARG_REGS): raise ValueError(f'{fn.name}: call to {name} with more than {len(ARG_REGS)} arguments')
+                    for r, a in zip(ARG_REGS, args): body.ins('MOV', r, a)
+                    # the argument registers ride along so the allocator sees them read, they're dropped on rewrite
+                    body.ins('BL', name, *ARG_REGS[:len(args)])
+                    body.ins('MOV', x.dst, 'X0')
+                case 'jmp':
+                    if x.args[0] != nxt: body.ins('B', x.args[0])
+                case 'br':
+                    gen_branch(body, x, cmps.get(x.args[0]), nxt)
+                case op if op in COMPARE:
+                    body.ins('CMP', *x.args)
+                    body.ins('CSET', x.dst, CONDITIONS[op])
+                case _:
+                    body.ins(OPCODES[x.op], x.dst, *x.args)
+
+    ra = RegisterAllocator(fn.ntemps)
+    code = ra.allocate(body.lines)
+    for line in code: em.emit(line)
+
+    if stats:
+        a = ra.allocation
+        stats.count('instructions', len(code))
+        stats.count('vregs', len(a.assigned) + len(a.spilled))
+        stats.count('registers', len(set(a.assigned.values())))
+        stats.count('spills', len(a.spilled))
+
+
+def gen_asm(module: Module, out: TextIO | None = None, stats: Stats | None = None) -> str:
+    # streams to out if given, otherwise returns the assembly text
+    em = Emitter(out)
+    for fn in module.functions:
+        gen_function(fn, em, stats)
+    return em.getvalue()
+
+
+def gen_tokens(module: Module, out: TextIO | None = None, stats: Stats | None = None) -> list[Token]:
+    # lowers straight to assembler tokens, out optionally gets the assembly text too
+    em = Emitter(out, tokens=[])
+    for fn in module.functions:
+        gen_function(fn, em, stats)
+    return em.tokens or []
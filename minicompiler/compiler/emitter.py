@@ -0,0 +1,34 @@
+from typing import TextIO
+from minicompiler.assembler.tokens import Token
+from minicompiler.assembler.tokenizer import token
+
+
+def fmt(line: list[str]) -> str:
+    # lines use the assembler's lexed form: [op, *operands], [name, subject] or [label:]
+    if line[0].startswith('.') or len(line) == 1: return ' '.join(line)
+    return f"{line[0]} {', '.join(line[1:])}"
+
+
+class Emitter:
+    def __init__(self, sink: TextIO | None = None, tokens: list[Token] | None = None):
+        # output: assembler tokens and/or text written to sink if given, otherwise buffered
+        self.sink = sink
+        self.tokens = tokens
+        self.lines: list[list[str]] = []
+
+    def emit(self, line: list[str]):
+        if self.tokens is not None: self.tokens.append(token(line))
+        if self.sink is not None: self.sink.write(fmt(line) + '\n')
+        elif self.tokens is None: self.lines.append(line)
+
+    def ins(self, op: str, *operands: str | None):
+        self.emit([op, *map(str, operands)])
+
+    def label(self, name: str):
+        self.emit([f'{name}:'])
+
+    def directive(self, name: str, subject: str):
+        self.emit([name, subject])
+
+    def getvalue(self) -> str:
+        return '\n'.join(map(fmt, self.lines))
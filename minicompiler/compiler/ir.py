@@ -0,0 +1,150 @@
+from dataclasses import dataclass, field
+
+
+# three-address ops: dst = op args ('call' is dst = call name, args...)
+COMPARE = {'lt', 'le', 'gt', 'ge', 'eq', 'ne'}
+PURE = {'const', 'copy', 'arg', 'add', 'sub', 'mul', 'div', 'neg'} | COMPARE
+
+# block terminators: ret value, jmp label, br cond, label if nonzero, label if zero
+TERMINATORS = {'ret', 'jmp', 'br'}
+
+
+@dataclass(slots=True)
+class Ins:
+    op: str
+    dst: str | None = None
+    args: list = field(default_factory=list)
+
+    def uses(self) -> list[str]:
+        # temps read by this instruction ('const'/'arg' carry plain ints)
+        if self.op in ('const', 'arg', 'jmp'): return []
+        if self.op == 'call': return self.args[1:]
+        if self.op == 'br': return self.args[:1]
+        return self.args
+
+    def targets(self) -> list[str]:
+        # labels a terminator branches to
+        if self.op == 'jmp': return self.args
+        if self.op == 'br': return self.args[1:]
+        return []
+
+    def __str__(self):
+        a = ', '.join(map(str, self.args))
+        return f'{self.dst} = {self.op} {a}' if self.dst else f'{self.op} {a}'
+
+
+@dataclass
+class Block:
+    label: str
+    ins: list[Ins] = field(default_factory=list)
+
+    def terminator(self) -> Ins | None:
+        return self.ins[-1] if self.ins and self.ins[-1].op in TERMINATORS else None
+
+
+@dataclass
+class Function:
+    name: str
+    params: list[str] = field(default_factory=list)
+    blocks: list[Block] = field(default_factory=list)
+    ntemps: int = 0
+
+    def new_temp(self) -> str:
+        self.ntemps += 1
+        return f'%{self.ntemps - 1}'
+
+    def successors(self, i: int) -> list[int]:
+        return self.cfg()[i]
+
+    def cfg(self) -> list[list[int]]:
+        # successors per block: branch targets, or the next block for blocks that aren't terminated
+        index = {b.label: i for i, b in enumerate(self.blocks)}
+        res = []
+        for i, b in enumerate(self.blocks):
+            t = b.terminator()
+            if t is not None: res.append(list(dict.fromkeys(index[x] for x in t.targets())))
+            else: res.append([i + 1] if i + 1 < len(self.blocks) else [])
+        return res
+
+    def predecessors(self) -> list[list[int]]:
+        res: list[list[int]] = [[] for _ in self.blocks]
+        for i, succ in enumerate(self.cfg()):
+            for s in succ: res[s].append(i)
+        return res
+
+    def __str__(self):
+        s = [f'function {self.name}({", ".join(self.params)})']
+        for b in self.blocks:
+            s.append(f'{b.label}:')
+            s += [f'    {x}' for x in b.ins]
+        return '\n'.join(s)
+
+
+@dataclass
+class Module:
+    functions: list[Function] = field(default_factory=list)
+
+    def __str__(self):
+        return '\n\n'.join(map(str, self.functions))
+
+
+class IRBuilder:
+    def __init__(self):
+        self.module = Module()
+        self.fn = Function('')
+        self.block = Block('')
+
+        # variable name -> temp holding its current value
+        self.vars: dict[str, str] = {}
+
+        # blocks made so far in this function, for unique labels
+        self.nblocks = 0
+
+    def function(self, name: str, params: list[str]):
+        self.fn = Function(name)
+        self.module.functions.append(self.fn)
+        self.vars = {}
+        self.nblocks = 0
+        self.new_block()
+        for i, p in enumerate(params):
+            self.vars[p] = self.emit('arg', i)
+            self.fn.params.append(p)
+
+    def make_block(self) -> Block:
+        # a block that can be branched to before it is placed
+        self.nblocks += 1
+        return Block(f'{self.fn.name}.{self.nblocks - 1}')
+
+    def place(self, block: Block) -> Block:
+        # blocks are laid out in placement order, unterminated ones fall through to the next
+        self.block = block
+        self.fn.blocks.append(block)
+        return block
+
+    def new_block(self) -> Block:
+        return self.place(self.make_block())
+
+    def _append(self, x: Ins):
+        # code after a terminator (a return in the middle of a block) goes into a new, unreachable block
+        if self.block.terminator(): self.new_block()
+        self.block.ins.append(x)
+
+    def emit(self, op: str, *args) -> str:
+        dst = self.fn.new_temp()
+        self._append(Ins(op, dst, list(args)))
+        return dst
+
+    def emit_void(self, op: str, *args):
+        self._append(Ins(op, None, list(args)))
+
+    def bind(self, var: str, val: str):
+        # every declaration gets its own temp, copied from the value
+        self.vars[var] = self.emit('copy', val)
+
+    def assign(self, var: str, val: str):
+        # assignments redefine the declaration's temp, so the IR isn't SSA
+        self._append(Ins('copy', self.lookup(var), [val]))
+
+    def lookup(self, var: str) -> str:
+        if var not in self.vars: raise NameError(f'undeclared identifier {var!r} in {self.fn.name}')
+        return self.vars[var]
@@ -1,22 +1,43 @@
 #!/usr/bin/env python3
 import re
+from typing import Any, Iterator
 from minicompiler.compiler.tokens import Tok, TokType
+from minicompiler.source import Text
 
 
-def lex(s: str) -> list[Tok]:
+# keywords are lexed as identifiers and reclassified with a single lookup
+KEYWORDS = {x.value.r: x for x in TokType if x.value.r.isidentifier()}
 
-    h = {x.value.r: x for x in TokType}
+# one master pattern with a named group per token type, compiled once at import
+GROUPS = {x.name: x for x in TokType if x not in KEYWORDS.values()}
+PATTERN = re.compile('|'.join(f'(?P<{k}>{v.value.r})' for k, v in GROUPS.items()) + r'|(?P<NEWLINE>\n)')
 
-    pt = re.compile('|'.join(h.keys()))
+# the same over bytes, so mapped files are lexed in place
+BPATTERN = re.compile(PATTERN.pattern.encode())
+BKEYWORDS = {k.encode(): v for k, v in KEYWORDS.items()}
 
-    res = []
-    for m in re.finditer(pt, s):
-        ms = m.group()
 
-        for p, tok_type in h.items():
-            if re.fullmatch(p, ms):
-                tok = Tok(type=tok_type, data=ms)
-                res.append(tok)
-                break
+def lex(s: Text) -> Iterator[Tok]:
 
-    return res
+    line, line_start = 1, 0
+
+    # str or bytes throughout, whichever the input is
+    buf: Any = s
+    pattern, keywords, nl = (PATTERN, KEYWORDS, '\n') if isinstance(s, str) else (BPATTERN, BKEYWORDS, b'\n')
+
+    for m in pattern.finditer(buf):
+        kind, (pos, end) = m.lastgroup, m.span()
+
+        if kind == 'NEWLINE':
+            line, line_start = line + 1, pos + 1
+            continue
+
+        tok_type = GROUPS[kind]  # type: ignore[index]
+        if tok_type is TokType.IDENT: tok_type = keywords.get(buf[pos:end], tok_type)
+
+        yield Tok(tok_type, s, pos, end, line, pos - line_start + 1)
+
+        # string literals may span lines
+        if tok_type is TokType.STR:
+            ms = buf[pos:end]
+            if nl in ms: line, line_start = line + ms.count(nl), pos + ms.rindex(nl) + 1
@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+from minicompiler.compiler.ir import Function
+
+
+@dataclass
+class Loop:
+    # natural loop: header dominates every block in it, back edges come from inside
+    header: int
+    blocks: set[int] = field(default_factory=set)
+    # the only block entering the loop from outside, if it branches nowhere else
+    preheader: int | None = None
+
+
+def reachable(fn: Function) -> set[int]:
+    succ, seen, stack = fn.cfg(), {0}, [0]
+    while stack:
+        for s in succ[stack.pop()]:
+            if s not in seen:
+                seen.add(s)
+                stack.append(s)
+    return seen
+
+
+def dominators(fn: Function) -> list[set[int]]:
+    # iterative, blocks not reachable from the entry dominate nothing and are dominated by everything
+    n = len(fn.blocks)
+    preds = fn.predecessors()
+    dom = [{0}] + [set(range(n)) for _ in range(n - 1)]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(1, n):
+            d = set.intersection(*(dom[p] for p in preds[i])) if preds[i] else set()
+            d = d | {i}
+            if d != dom[i]:
+                dom[i] = d
+                changed = True
+    return dom
+
+
+def find_loops(fn: Function) -> list[Loop]:
+    # one loop per header (back edges into it are merged), innermost first
+    if not fn.blocks: return []
+    succ, preds, dom = fn.cfg(), fn.predecessors(), dominators(fn)
+
+    loops: dict[int, Loop] = {}
+    live = reachable(fn)
+    for t, ss in enumerate(succ):
+        for h in ss:
+            if t not in live or h not in dom[t]: continue
+            lp = loops.setdefault(h, Loop(h, {h}))
+            # everything reaching the back edge without passing the header
+            stack = [t]
+            while stack:
+                x = stack.pop()
+                if x in lp.blocks: continue
+                lp.blocks.add(x)
+                stack.extend(preds[x])
+
+    for lp in loops.values():
+        outside = [p for p in preds[lp.header] if p not in lp.blocks]
+        if len(outside) == 1 and succ[outside[0]] == [lp.header]: lp.preheader = outside[0]
+
+    return sorted(loops.values(), key=lambda x: len(x.blocks))
@@ -1,49 +1,86 @@
 #!/usr/bin/env python3
+import argparse
+from typing import TextIO
+from minicompiler.source import Text, mapped
 from minicompiler.compiler.lexer import lex
 from minicompiler.compiler.parser import Parser  # pylint: disable=deprecated-module
-from minicompiler.compiler.tree import gen_asm
+from minicompiler.compiler.tree import fold, gen_ir
+from minicompiler.compiler.passes import optimize
+from minicompiler.compiler.codegen import gen_asm
+from minicompiler.compiler.ir import Module
+from minicompiler.stats import Stats, stage, add_arguments, from_args, report
 
 
 def read(path: str) -> str:
-    fp = open(path, 'r')
-    return fp.read().strip()
+    with open(path, 'r') as fp: return fp.read().strip()
 
 
-def compile(s: str, verbose: bool = False) -> str:  # pylint: disable=redefined-builtin
+def lower(s: Text, verbose: bool = False, opt: int = 0, stats: Stats | None = None) -> Module:
 
-    # lex: str -> list[Tok]
-    a = lex(s)
+    # lex: str | bytes -> tuple[Tok]
+    with stage(stats, 'lex'): a = tuple(lex(s))
+    if stats: stats.count('tokens', len(a))
 
     #if verbose:
     #    for x in a: print(x)
     #    print('*' * 80)
 
     # parse: list[Tok] -> AST
-    ast = Parser(a).build()
+    with stage(stats, 'parse'): ast = Parser(a).build()
+    if stats: stats.count('ast_nodes', sum(1 for _ in ast.walk()))
 
     if verbose:
         ast.print()
         print('*' * 80)
 
-    # AST -> asm
-    asm = gen_asm(ast)
+    # AST -> AST (constant folding)
+    if opt:
+        with stage(stats, 'fold'): fold(ast)
 
-    return asm
+    # AST -> IR
+    with stage(stats, 'gen_ir'): ir = gen_ir(ast)
+
+    # IR -> IR
+    with stage(stats, 'optimize'): optimize(ir, opt)
+    if stats: stats.count('ir_instructions', sum(len(b.ins) for f in ir.functions for b in f.blocks))
+
+    return ir
+
+
+def compile(s: Text, verbose: bool = False, out: TextIO | None = None, opt: int = 0,  # pylint: disable=redefined-builtin
+            stats: Stats | None = None) -> str:
+
+    # IR -> asm (streamed to out if given)
+    ir = lower(s, verbose, opt, stats)
+    with stage(stats, 'codegen'): return gen_asm(ir, out, stats)
 
 
 if __name__ == '__main__':
     '''
     str       -> list[Tok] (lex)
     list[Tok] -> AST       (parse)
-    AST       -> ASM       (skip IR for now, otherwise AST -> IR -> ASM)
+    AST       -> AST       (fold)
+    AST       -> IR        (lower)
+    IR        -> IR        (optimize)
+    IR        -> ASM       (codegen)
     '''
 
-    fn = 'eval/test.c'
-
-    s = read(fn)
-
-    print(s)
-    print('*' * 80)
+    ap = argparse.ArgumentParser()
+    ap.add_argument('src', nargs='?', default='eval/test.c')
+    ap.add_argument('out', nargs='?', default=None)
+    ap.add_argument('-O', dest='opt', type=int, default=0)
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    st = from_args(args)
+
+    # stream assembly straight to disk for large translation units, the source is lexed straight from the mapping
+    if args.out:
+        with mapped(args.src) as m, open(args.out, 'w') as fp: compile(m, out=fp, opt=args.opt, stats=st)
+    else:
+        s = read(args.src)
+        print(s)
+        print('*' * 80)
+        print(compile(s, opt=args.opt, stats=st))
 
-    asm = compile(s)
-    print(asm)
+    report(st, args)
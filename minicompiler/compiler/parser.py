@@ -1,34 +1,108 @@
 #!/usr/bin/env python3
-from copy import deepcopy
-from collections import deque
+import sys
+from functools import wraps
+from typing import Iterable, NoReturn
 from minicompiler.compiler.tokens import Tok, TokType
-from minicompiler.compiler.tree import ASTNode, Root, Decl, NumExpr, DeclRefExpr, ParenExpr, Expr, ReturnStmt, VarDecl, BinOp, FunctionDecl, AddOp, DeclStmt
+from minicompiler.compiler.tree import ASTNode, Root, Decl, NumExpr, DeclRefExpr, ParenExpr, Expr, ReturnStmt, VarDecl, FunctionDecl, DeclStmt, Stmt
+from minicompiler.compiler.tree import CallExpr, CompoundStmt, AssignStmt, WhileStmt, ForStmt
+from minicompiler.compiler.tree import AddOp, SubOp, MulOp, DivOp, NegOp, LtOp, LeOp, GtOp, GeOp, EqOp, NeOp
 from contextlib import contextmanager
 
 
+# binary operators: token -> (precedence, right associative, node)
+BINOPS = {
+    TokType.EQEQ: (4, False, EqOp),
+    TokType.NE: (4, False, NeOp),
+    TokType.LT: (6, False, LtOp),
+    TokType.LE: (6, False, LeOp),
+    TokType.GT: (6, False, GtOp),
+    TokType.GE: (6, False, GeOp),
+    TokType.PLUS: (10, False, AddOp),
+    TokType.MINUS: (10, False, SubOp),
+    TokType.STAR: (20, False, MulOp),
+    TokType.SLASH: (20, False, DivOp),
+}
+
+# prefix operators: token -> (precedence, node)
+UNOPS = {
+    TokType.MINUS: (30, NegOp),
+}
+
+
+class ParseError(Exception):
+    # plain values copied out of the token, its source may be a mapped file that is closed by the time
+    # the error is read, or in another process (build_all)
+    def __init__(self, pos: int, line: int = 0, col: int = 0, text: str | None = None):
+        super().__init__(pos, line, col, text)
+        # source offset, the failure that got furthest is reported
+        self.pos = pos
+        self.line = line
+        self.col = col
+        # None at end of input
+        self.text = text
+
+    @classmethod
+    def at(cls, tok: Tok) -> 'ParseError':
+        return cls(tok.pos, tok.line, tok.col, tok.data)
+
+    def __str__(self):
+        if self.text is None: return 'unexpected end of input'
+        return f'{self.line}:{self.col}: unexpected token {self.text!r}'
+
+
+def memoize(f):
+    # packrat: each (rule, position) is parsed at most once
+    @wraps(f)
+    def wrapper(self):
+        key = (f.__name__, self.pos)
+        if key not in self.memo:
+            start = self.pos
+            try:
+                self.memo[key] = (f(self), self.pos)
+            except ParseError as e:
+                self.memo[key] = (e, start)
+        res, self.pos = self.memo[key]
+        if isinstance(res, ParseError): raise res
+        return res
+    return wrapper
+
+
 class Parser:
-    def __init__(self, tokens: list[Tok]):
-        self.tokens = deque(tokens)
+    def __init__(self, tokens: Iterable[Tok]):
+        self.tokens = tuple(tokens)
+        self.pos = 0
+
+        self.memo: dict[tuple[str, int], tuple[ASTNode | ParseError, int]] = {}
+        self.err: ParseError | None = None
 
         self.dtypes = {TokType.INT, TokType.BOOL}
 
     @contextmanager
     def _preserving_state(self):
-        q = deepcopy(self.tokens)
+        pos = self.pos
         try:
             yield
-        except ValueError:
-            self.tokens = q
-        except Exception as e:
-            print(e)
-            raise
+        except ParseError as e:
+            self.pos = pos
+            # keep the failure that got furthest for error reporting
+            if self.err is None or e.pos > self.err.pos: self.err = e
 
     def _test(self, f=lambda _: True, i: int = 0):
-        return self.tokens and len(self.tokens) >= i + 1 and f(self.tokens[i])
+        return self.pos + i < len(self.tokens) and f(self.tokens[self.pos + i])
+
+    def _fail(self) -> NoReturn:
+        if self.pos < len(self.tokens): raise ParseError.at(self.tokens[self.pos])
+        # end of input sorts after every token
+        raise ParseError(self.tokens[-1].end if self.tokens else 0)
 
     def _consume(self, f=lambda _: True):
-        assert self._test(f)
-        return self.tokens.popleft()
+        if not self._test(f): self._fail()
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def _consume_name(self, f=lambda _: True) -> str:
+        # identifiers and type names repeat heavily, share a single string per name
+        return sys.intern(self._consume(f).data)
 
     def build(self) -> ASTNode:
         root = self._parse_root()
@@ -40,66 +114,95 @@ class Parser:
         root = Root()
 
         while self._test():
+            pos = self.pos
             with self._preserving_state():
                 root.children.append(self._parse_statement())
             with self._preserving_state():
                 root.children.append(self._parse_declaration())
+            if self.pos == pos: raise self.err or ParseError.at(self.tokens[pos])
 
         return root
 
     # *************** expressions ***************
 
+    @memoize
     def _parse_expr(self) -> Expr:
 
-        root = Expr()
-
-        binops = {
-            TokType.PLUS: AddOp,
-        }
-
-        rterm = {TokType.SEMIC, TokType.RPAREN}
-
-        # single number expression: i.e. '4;'
-        def _parse_val() -> NumExpr | DeclRefExpr:
-            if self._test(lambda x: x.type == TokType.NUM):
-                return NumExpr(val=int(self._consume().data))
-            if self._test(lambda x: x.type == TokType.IDENT):
-                return DeclRefExpr(ident=self._consume().data)
-            raise ValueError()
-
-        # binary operation expression: i.e. '1 + 3'
-        def _parse_binary_operation() -> BinOp | NumExpr | DeclRefExpr:
-            op1 = _parse_val()
-            if self._test(lambda x: x.type in rterm): return op1
-            cls = binops[self._consume(lambda x: x.type in binops).type]
-            root = cls(op1=op1)
-            root.op2 = _parse_binary_operation()
-            return root
-
-        while self._test(lambda x: x.type not in rterm):
-            if self._test(lambda x: x.type in binops, i=1):
-                root = _parse_binary_operation()
-            elif self._test(lambda x: x.type in rterm, i=1):
-                root = _parse_val()
-            elif self._test(lambda x: x.type == TokType.LPAREN):
-                root = self._parse_paren_expr()
-
-        self._consume(lambda x: x.type in rterm)
-        return root
+        # iterative precedence climbing: operands and pending operators live on explicit stacks,
+        # so expression length and nesting depth are not bounded by the interpreter stack
+        operands: list[Expr] = []
+        ops: list[tuple[int, bool, type] | None] = []  # (precedence, unary, node), None marks '('
+        depth = 0
+
+        def _reduce():
+            _, unary, cls = ops.pop()  # type: ignore[misc]
+            if unary:
+                operands.append(cls(op=operands.pop()))
+            else:
+                op2, op1 = operands.pop(), operands.pop()
+                operands.append(cls(op1=op1, op2=op2))
+
+        while True:
+            # operand position: prefix operators and opening parentheses
+            while True:
+                if self._test(lambda x: x.type == TokType.LPAREN):
+                    self._consume()
+                    ops.append(None)
+                    depth += 1
+                elif self._test(lambda x: x.type in UNOPS):
+                    prec, unop = UNOPS[self._consume().type]
+                    ops.append((prec, True, unop))
+                else:
+                    break
+
+            operands.append(self._parse_val())
+
+            # operator position: closing parentheses and binary operators
+            while depth and self._test(lambda x: x.type == TokType.RPAREN):
+                self._consume()
+                while ops[-1] is not None: _reduce()
+                ops.pop()
+                depth -= 1
+                operands.append(ParenExpr(expr=operands.pop()))
 
-    def _parse_paren_expr(self) -> ParenExpr:
+            if not self._test(lambda x: x.type in BINOPS): break
+
+            prec, right, binop = BINOPS[self._consume().type]
+            while ops and (top := ops[-1]) is not None and (top[0] > prec or (top[0] == prec and not right)):
+                _reduce()
+            ops.append((prec, False, binop))
+
+        if depth: self._fail()
+        while ops: _reduce()
+
+        return operands.pop()
+
+    def _parse_val(self) -> NumExpr | DeclRefExpr | CallExpr:
+        if self._test(lambda x: x.type == TokType.NUM):
+            return NumExpr(val=int(self._consume().data))
+        if self._test(lambda x: x.type == TokType.IDENT) and self._test(lambda x: x.type == TokType.LPAREN, i=1):
+            return self._parse_call()
+        if self._test(lambda x: x.type == TokType.IDENT):
+            return DeclRefExpr(ident=self._consume_name())
+        self._fail()
+
+    def _parse_call(self) -> CallExpr:
+        root = CallExpr(ident=self._consume_name())
         self._consume(lambda x: x.type == TokType.LPAREN)
-        root = ParenExpr()
-        root.expr = self._parse_expr()
+        while not self._test(lambda x: x.type == TokType.RPAREN):
+            if root.args: self._consume(lambda x: x.type == TokType.COMMA)
+            root.args.append(self._parse_expr())
+        self._consume(lambda x: x.type == TokType.RPAREN)
         return root
 
     # *************** declarations ***************
 
+    @memoize
     def _parse_declaration(self) -> Decl:
         # function
         if self._test(lambda x: x.type == TokType.LPAREN, i=2):
             return self._parse_function()
-        raise ValueError()
+        self._fail()
 
     def _parse_function(self) -> FunctionDecl:
         root = FunctionDecl()
@@ -108,54 +211,97 @@ class Parser:
             res = []
             while self._test(lambda x: x.type != TokType.RPAREN):
                 arg = VarDecl()
-                arg.type = self._consume(lambda x: x.type in self.dtypes).data
-                arg.ident = self._consume(lambda x: x.type == TokType.IDENT).data
+                arg.type = self._consume_name(lambda x: x.type in self.dtypes)
+                arg.ident = self._consume_name(lambda x: x.type == TokType.IDENT)
                 res.append(arg)
                 if self._test(lambda x: x.type == TokType.COMMA): self._consume()
             return res
 
-        def _parse_body():
-            body = []
-            while self._test(lambda x: x.type != TokType.RBRACE):
-                if self._test(lambda x: x.type == TokType.ReturnStmt):
-                    body.append(self._parse_return())
-                    break
-                s = self._parse_statement()
-                body.append(s)
-                if isinstance(s, ReturnStmt): break
-            return body
-
-        root.rtype = self._consume(lambda x: x.type in self.dtypes)
-        root.ident = self._consume(lambda x: x.type == TokType.IDENT).data
+        root.rtype = self._consume_name(lambda x: x.type in self.dtypes)
+        root.ident = self._consume_name(lambda x: x.type == TokType.IDENT)
         self._consume(lambda x: x.type == TokType.LPAREN)
         root.args = _parse_args()
         self._consume(lambda x: x.type == TokType.RPAREN)
-        self._consume(lambda x: x.type == TokType.LBRACE)
-        root.body.stmts = _parse_body()
-        self._consume(lambda x: x.type == TokType.RBRACE)
+        root.body = self._parse_block()
         return root
 
     # *************** statements ***************
 
-    def _parse_statement(self):
+    @memoize
+    def _parse_statement(self) -> Stmt:
         # return statement
         if self._test(lambda x: x.type == TokType.ReturnStmt):
             return self._parse_return()
+        if self._test(lambda x: x.type == TokType.WHILE):
+            return self._parse_while()
+        if self._test(lambda x: x.type == TokType.FOR):
+            return self._parse_for()
+        if self._test(lambda x: x.type == TokType.LBRACE):
+            return self._parse_block()
         if self._test(lambda x: x.type == TokType.EQ, i=2):
             return self._parse_var_decl()
+        if self._test(lambda x: x.type == TokType.EQ, i=1):
+            return self._parse_assign()
+        self._fail()
+
+    def _parse_block(self) -> CompoundStmt:
+        root = CompoundStmt()
+        self._consume(lambda x: x.type == TokType.LBRACE)
+        while not self._test(lambda x: x.type == TokType.RBRACE):
+            root.stmts.append(self._parse_statement())
+        self._consume(lambda x: x.type == TokType.RBRACE)
+        return root
+
+    def _parse_body(self) -> CompoundStmt:
+        # loop bodies: a block or a single statement
+        s = self._parse_statement()
+        return s if isinstance(s, CompoundStmt) else CompoundStmt(stmts=[s])
+
+    def _parse_while(self) -> WhileStmt:
+        root = WhileStmt()
+        self._consume(lambda x: x.type == TokType.WHILE)
+        self._consume(lambda x: x.type == TokType.LPAREN)
+        root.cond = self._parse_expr()
+        self._consume(lambda x: x.type == TokType.RPAREN)
+        root.body = self._parse_body()
+        return root
 
-        raise ValueError()
+    def _parse_for(self) -> ForStmt:
+        # for (init; cond; step), each part optional, init is a declaration or an assignment
+        root = ForStmt()
+        self._consume(lambda x: x.type == TokType.FOR)
+        self._consume(lambda x: x.type == TokType.LPAREN)
+        if self._test(lambda x: x.type == TokType.EQ, i=2): root.init = self._parse_var_decl()
+        elif self._test(lambda x: x.type == TokType.EQ, i=1): root.init = self._parse_assign()
+        else: self._consume(lambda x: x.type == TokType.SEMIC)
+        if not self._test(lambda x: x.type == TokType.SEMIC): root.cond = self._parse_expr()
+        self._consume(lambda x: x.type == TokType.SEMIC)
+        if not self._test(lambda x: x.type == TokType.RPAREN): root.step = self._parse_assign(semicolon=False)
+        self._consume(lambda x: x.type == TokType.RPAREN)
+        root.body = self._parse_body()
+        return root
+
+    def _parse_assign(self, semicolon: bool = True) -> AssignStmt:
+        # the for step has no ';', the caller consumes the ')'
+        root = AssignStmt()
+        root.ident = self._consume_name(lambda x: x.type == TokType.IDENT)
+        self._consume(lambda x: x.type == TokType.EQ)
+        root.expr = self._parse_expr()
+        if semicolon: self._consume(lambda x: x.type == TokType.SEMIC)
+        return root
 
     def _parse_return(self) -> ReturnStmt:
         self._consume(lambda x: x.type == TokType.ReturnStmt)
         root = ReturnStmt()
         root.expr = self._parse_expr()
+        self._consume(lambda x: x.type == TokType.SEMIC)
         return root
 
     def _parse_var_decl(self) -> DeclStmt:
         root = DeclStmt()
-        root.var.type = self._consume(lambda x: x.type in self.dtypes).data
-        root.var.ident = self._consume(lambda x: x.type == TokType.IDENT).data
+        root.var.type = self._consume_name(lambda x: x.type in self.dtypes)
+        root.var.ident = self._consume_name(lambda x: x.type == TokType.IDENT)
         self._consume(lambda x: x.type == TokType.EQ)
         root.var.val = self._parse_expr()
+        self._consume(lambda x: x.type == TokType.SEMIC)
         return root
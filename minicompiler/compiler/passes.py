@@ -0,0 +1,403 @@
+from typing import Callable
+from collections import Counter
+from minicompiler.compiler.ir import Module, Function, Block, Ins, PURE, COMPARE
+from minicompiler.compiler.loops import Loop, find_loops, reachable
+
+
+# a pass rewrites one function in place and reports whether anything changed
+Pass = Callable[[Function], bool]
+
+PASSES: dict[str, Pass] = {}
+
+# passes run per optimization level, O2 and above iterate to a fixed point
+PIPELINES: dict[int, list[str]] = {
+    0: [],
+    1: ['copyprop', 'constfold', 'dce', 'cfg', 'coalesce', 'licm'],
+    2: ['copyprop', 'constfold', 'dce', 'cfg', 'coalesce', 'unroll', 'licm', 'ivsr'],
+}
+
+MAX_ITERS = 16
+
+# loops are fully unrolled up to this many iterations and IR instructions after unrolling
+UNROLL_TRIPS = 16
+UNROLL_COST = 128
+
+# callees costing at most this many instructions are inlined, per optimization level
+INLINE_COST: dict[int, int] = {
+    0: 0,
+    1: 8,
+    2: 32,
+}
+
+
+def register(name: str):
+    def wrapper(f: Pass) -> Pass:
+        PASSES[name] = f
+        return f
+    return wrapper
+
+
+def optimize(module: Module, opt: int = 1, passes: list[str] | None = None):
+    level = min(opt, max(PIPELINES))
+    names = PIPELINES[level] if passes is None else passes
+    budget = INLINE_COST[level] if passes is None else 0
+
+    # callees first, so what gets inlined is already optimized
+    fns = {fn.name: fn for fn in module.functions}
+    for fn in call_order(module):
+        if budget: inline(fn, fns, budget)
+        for _ in range(MAX_ITERS):
+            changed = [PASSES[x](fn) for x in names]
+            if opt < 2 or not any(changed): break
+
+
+# ***************************** arithmetic *****************************
+
+
+def wrap(x: int) -> int:
+    # two's complement, 64-bit
+    x &= (1 << 64) - 1
+    return x - (1 << 64) if x >> 63 else x
+
+
+def sdiv(a: int, b: int) -> int:
+    # AArch64 SDIV: truncates toward zero, division by zero yields 0
+    if b == 0: return 0
+    q = abs(a) // abs(b)
+    return wrap(q if (a < 0) == (b < 0) else -q)
+
+
+FOLD: dict[str, Callable[..., int]] = {
+    'add': lambda a, b: wrap(a + b),
+    'sub': lambda a, b: wrap(a - b),
+    'mul': lambda a, b: wrap(a * b),
+    'div': sdiv,
+    'neg': lambda a: wrap(-a),
+    'lt': lambda a, b: int(a < b),
+    'le': lambda a, b: int(a <= b),
+    'gt': lambda a, b: int(a > b),
+    'ge': lambda a, b: int(a >= b),
+    'eq': lambda a, b: int(a == b),
+    'ne': lambda a, b: int(a != b),
+}
+
+# ***************************** inlining *****************************
+
+
+def call_order(module: Module) -> list[Function]:
+    # post-order over the call graph (callees before callers), recursion cycles are cut anywhere
+    fns = {fn.name: fn for fn in module.functions}
+    seen: set[str] = set()
+    order: list[Function] = []
+    for root in module.functions:
+        if root.name in seen: continue
+        seen.add(root.name)
+        stack = [(root, iter(callees(root)))]
+        while stack:
+            fn, it = stack[-1]
+            name = next((x for x in it if x in fns and x not in seen), None)
+            if name is None:
+                order.append(stack.pop()[0])
+                continue
+            seen.add(name)
+            stack.append((fns[name], iter(callees(fns[name]))))
+    return order
+
+
+def callees(fn: Function) -> list[str]:
+    return [x.args[0] for b in fn.blocks for x in b.ins if x.op == 'call']
+
+
+def inline_cost(fn: Function) -> int | None:
+    # straight-line functions ending in their only return, None if not inlinable
+    if len(fn.blocks) != 1 or not fn.blocks[0].terminator(): return None
+    body = fn.blocks[0].ins
+    if any(x.op == 'ret' for x in body[:-1]): return None
+    return sum(x.op not in ('arg', 'ret') for x in body)
+
+
+def inline(fn: Function, fns: dict[str, Function], budget: int) -> bool:
+    # replaces calls to small callees with a renamed copy of their body, 'arg' and 'ret' become copies
+    changed = False
+    for b in fn.blocks:
+        out: list[Ins] = []
+        for x in b.ins:
+            callee = fns.get(x.args[0]) if x.op == 'call' else None
+            cost = inline_cost(callee) if callee and callee is not fn else None
+            if callee is None or cost is None or cost > budget or len(x.args) - 1 != len(callee.params):
+                out.append(x)
+                continue
+            # callees are straight-line: each definition gets a fresh caller temp, later uses see the latest
+            temps: dict[str, str] = {}
+            for y in callee.blocks[0].ins:
+                if y.op == 'ret':
+                    out.append(Ins('copy', x.dst, [temps[y.args[0]]]))
+                    continue
+                # operands are renamed before the definition, 'a = a + b' reads the previous a
+                if y.op == 'arg': args = [x.args[1 + y.args[0]]]
+                elif y.op == 'const': args = y.args
+                else: args = [temps.get(a, a) for a in y.args]
+                temps[str(y.dst)] = fn.new_temp()
+                out.append(Ins('copy' if y.op == 'arg' else y.op, temps[str(y.dst)], args))
+            changed = True
+        b.ins = out
+    return changed
+
+
+# ***************************** passes *****************************
+
+
+@register('copyprop')
+def copy_propagation(fn: Function) -> bool:
+    changed = False
+    for b in fn.blocks:
+        # dst -> src of live copies, and src -> dsts so redefinitions can kill them
+        copies: dict[str, str] = {}
+        rev: dict[str, set[str]] = {}
+        out: list[Ins] = []
+        for x in b.ins:
+            if x.uses():
+                args = [copies.get(a, a) for a in x.args]
+                changed |= args != x.args
+                x.args = args
+            # x = copy x (an assignment to itself) changes nothing
+            if x.op == 'copy' and x.args[0] == x.dst:
+                changed = True
+                continue
+            out.append(x)
+            if x.dst:
+                if x.dst in copies: rev[copies.pop(x.dst)].discard(x.dst)
+                for d in rev.pop(x.dst, ()): del copies[d]
+            if x.op == 'copy' and x.dst:
+                copies[x.dst] = x.args[0]
+                rev.setdefault(x.args[0], set()).add(x.dst)
+        b.ins = out
+    return changed
+
+
+@register('constfold')
+def constant_folding(fn: Function) -> bool:
+    changed = False
+    for b in fn.blocks:
+        known: dict[str, int] = {}
+        for x in b.ins:
+            if x.op == 'copy' and x.args[0] in known:
+                x.op, x.args = 'const', [known[x.args[0]]]
+                changed = True
+            elif x.op in FOLD and all(a in known for a in x.args):
+                x.op, x.args = 'const', [FOLD[x.op](*(known[a] for a in x.args))]
+                changed = True
+            elif x.op == 'br' and x.args[0] in known:
+                x.op, x.args = 'jmp', [x.args[1] if known[x.args[0]] else x.args[2]]
+                changed = True
+            if x.dst:
+                if x.op == 'const': known[x.dst] = wrap(x.args[0])
+                else: known.pop(x.dst, None)
+    return changed
+
+
+def live_out(fn: Function) -> list[set[str]]:
+    # backward dataflow over the CFG until the live-in sets settle
+    succ = fn.cfg()
+    live_in: list[set[str]] = [set() for _ in fn.blocks]
+    changed = True
+    while changed:
+        changed = False
+        for i in reversed(range(len(fn.blocks))):
+            live = set().union(*(live_in[s] for s in succ[i]))
+            for x in reversed(fn.blocks[i].ins):
+                if x.dst: live.discard(x.dst)
+                live.update(x.uses())
+            if live != live_in[i]:
+                live_in[i] = live
+                changed = True
+    return [set().union(*(live_in[s] for s in succ[i])) for i in range(len(fn.blocks))]
+
+
+@register('dce')
+def dead_code_elimination(fn: Function) -> bool:
+    changed = False
+    for b, live in zip(fn.blocks, live_out(fn)):
+        keep = []
+        for x in reversed(b.ins):
+            if x.op in PURE and x.dst not in live:
+                changed = True
+                continue
+            if x.dst: live.discard(x.dst)
+            live.update(x.uses())
+            keep.append(x)
+        b.ins = keep[::-1]
+    return changed
+
+
+@register('cfg')
+def simplify_cfg(fn: Function) -> bool:
+    # drops unreachable blocks and merges a block into the one before it when that is its only way in
+    changed = False
+    live = reachable(fn)
+    if len(live) < len(fn.blocks):
+        fn.blocks = [b for i, b in enumerate(fn.blocks) if i in live]
+        changed = True
+
+    i = 0
+    while i + 1 < len(fn.blocks):
+        a, b = fn.blocks[i], fn.blocks[i + 1]
+        if fn.successors(i) == [i + 1] and fn.predecessors()[i + 1] == [i]:
+            a.ins = (a.ins[:-1] if a.terminator() else a.ins) + b.ins
+            del fn.blocks[i + 1]
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+@register('coalesce')
+def coalesce_copies(fn: Function) -> bool:
+    # t = op ...; x = copy t  ->  x = op ...  when nothing else reads t (assignments, loop counters)
+    uses = Counter(a for b in fn.blocks for x in b.ins for a in x.uses())
+    defs = Counter(x.dst for b in fn.blocks for x in b.ins if x.dst)
+    changed = False
+    for b in fn.blocks:
+        out: list[Ins] = []
+        for x in b.ins:
+            p = out[-1] if out else None
+            if x.op == 'copy' and p is not None and p.dst and p.dst == x.args[0] and uses[p.dst] == 1 and defs[p.dst] == 1:
+                p.dst = x.dst
+                changed = True
+                continue
+            out.append(x)
+        b.ins = out
+    return changed
+
+
+# ***************************** loops *****************************
+
+
+def constants(fn: Function) -> dict[str, int]:
+    # temps whose only definition is a constant
+    defs = Counter(x.dst for b in fn.blocks for x in b.ins if x.dst)
+    return {x.dst: x.args[0] for b in fn.blocks for x in b.ins if x.op == 'const' and x.dst and defs[x.dst] == 1}
+
+
+def hoist(block: Block, x: Ins):
+    # appends to a preheader, ahead of its jump into the loop
+    block.ins.insert(len(block.ins) - 1 if block.terminator() else len(block.ins), x)
+
+
+def steps(fn: Function, lp: Loop, consts: dict[str, int]) -> dict[str, tuple[int, Ins]]:
+    # basic induction variables: temp -> (block, only definition in the loop: i = i +/- constant)
+    defs = [(i, x) for i in lp.blocks for x in fn.blocks[i].ins if x.dst]
+    count = Counter(x.dst for _, x in defs)
+    res = {}
+    for i, x in defs:
+        if not x.dst or count[x.dst] != 1 or x.op not in ('add', 'sub') or x.dst not in x.args: continue
+        other = x.args[1] if x.args[0] == x.dst else x.args[0]
+        if other in consts and (x.op == 'add' or x.args[0] == x.dst): res[x.dst] = (i, x)
+    return res
+
+
+def step_of(x: Ins, consts: dict[str, int]) -> int:
+    other = x.args[1] if x.args[0] == x.dst else x.args[0]
+    return consts[other] if x.op == 'add' else -consts[other]
+
+
+@register('licm')
+def hoist_invariants(fn: Function) -> bool:
+    # pure instructions whose operands aren't defined in the loop move to the preheader, innermost loops first;
+    # the target must have no other definition, the IR isn't SSA
+    defs = Counter(x.dst for b in fn.blocks for x in b.ins if x.dst)
+    changed = False
+    for lp in find_loops(fn):
+        if lp.preheader is None: continue
+        pre = fn.blocks[lp.preheader]
+        inside = {x.dst for i in lp.blocks for x in fn.blocks[i].ins if x.dst}
+        moved = True
+        while moved:
+            moved = False
+            for i in sorted(lp.blocks):
+                keep = []
+                for x in fn.blocks[i].ins:
+                    if x.op in PURE and x.op != 'arg' and x.dst and defs[x.dst] == 1 and not inside.intersection(x.uses()):
+                        hoist(pre, x)
+                        inside.discard(x.dst)
+                        moved = changed = True
+                    else:
+                        keep.append(x)
+                fn.blocks[i].ins = keep
+    return changed
+
+
+@register('ivsr')
+def strength_reduction(fn: Function) -> bool:
+    # j = mul i, k with i stepping by c  ->  s = i * k before the loop, s = s + c * k next to the step, j = copy s
+    consts = constants(fn)
+    changed = False
+    for lp in find_loops(fn):
+        if lp.preheader is None: continue
+        pre, ivs = fn.blocks[lp.preheader], steps(fn, lp, consts)
+        for i in sorted(lp.blocks):
+            for x in fn.blocks[i].ins:
+                if x.op != 'mul': continue
+                a, b = x.args
+                iv, k = (a, b) if a in ivs and b in consts else (b, a) if b in ivs and a in consts else (None, None)
+                if iv is None or k is None: continue
+                blk, inc = ivs[iv]
+                s, m, d = fn.new_temp(), fn.new_temp(), fn.new_temp()
+                hoist(pre, Ins('const', m, [consts[k]]))
+                hoist(pre, Ins('mul', s, [iv, m]))
+                hoist(pre, Ins('const', d, [wrap(step_of(inc, consts) * consts[k])]))
+                x.op, x.args = 'copy', [s]
+                ins = fn.blocks[blk].ins
+                ins.insert(next(j for j, y in enumerate(ins) if y is inc) + 1, Ins('add', s, [s, d]))
+                changed = True
+    return changed
+
+
+def trip_count(fn: Function, lp: Loop, consts: dict[str, int]) -> int | None:
+    # iterations of a loop testing 'i <cmp> bound' at the top, i constant on entry and stepped by a constant in the body
+    test = fn.blocks[lp.header]
+    br = test.terminator()
+    if br is None or br.op != 'br' or lp.preheader is None: return None
+    cmp = next((x for x in reversed(test.ins) if x.dst == br.args[0]), None)
+    if cmp is None or cmp.op not in COMPARE: return None
+
+    ivs = steps(fn, lp, consts)
+    a, b = cmp.args
+    iv, bound = (a, b) if a in ivs and b in consts else (b, a) if b in ivs and a in consts else (None, None)
+    if iv is None or bound is None or ivs[iv][0] == lp.header: return None
+
+    init = next((x for x in reversed(fn.blocks[lp.preheader].ins) if x.dst == iv), None)
+    if init is None or init.op != 'const': return None
+
+    v, step, n = init.args[0], step_of(ivs[iv][1], consts), 0
+    while FOLD[cmp.op](*((v, consts[bound]) if iv == a else (consts[bound], v))):
+        n += 1
+        v = wrap(v + step)
+        if n > UNROLL_TRIPS: return None
+    return n
+
+
+@register('unroll')
+def unroll_loops(fn: Function) -> bool:
+    # body falling into a test block with a constant trip count -> the test and body repeated in a straight line
+    changed = False
+    while True:
+        consts = constants(fn)
+        for lp in find_loops(fn):
+            if len(lp.blocks) != 2: continue
+            (i,) = lp.blocks - {lp.header}
+            test, body = fn.blocks[lp.header], fn.blocks[i]
+            br = test.terminator()
+            if br is None or br.op != 'br' or br.args[1] != body.label or fn.successors(i) != [lp.header]: continue
+            n = trip_count(fn, lp, consts)
+            if n is None: continue
+            head = test.ins[:-1]
+            tail = body.ins[:-1] if body.terminator() else body.ins
+            if (len(head) + len(tail)) * n + len(head) > UNROLL_COST: continue
+            code = (head + tail) * n + head + [Ins('jmp', None, [br.args[2]])]
+            test.ins = [Ins(x.op, x.dst, list(x.args)) for x in code]
+            del fn.blocks[i]
+            changed = True
+            break
+        else:
+            return changed
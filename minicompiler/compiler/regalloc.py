@@ -0,0 +1,281 @@
+from dataclasses import dataclass, field
+from collections import defaultdict
+
+
+# AArch64 register sets (AAPCS64), in allocation order
+TEMPORARY = [f'X{i}' for i in range(9, 16)]      # caller-saved scratch registers
+ARGUMENT = [f'X{i}' for i in range(0, 9)]        # caller-saved argument/result registers
+CALLEE_SAVED = [f'X{i}' for i in range(19, 29)]  # must be saved before use
+SCRATCH = ['X16', 'X17']                         # IP0/IP1, reserved for spill code
+
+# never handed out: spill scratch, platform register (X18), frame pointer (X29), link register (X30)
+RESERVED = {'X16', 'X17', 'X18', 'X29', 'X30', 'SP', 'XZR'}
+
+ALLOCATABLE = TEMPORARY + ARGUMENT + CALLEE_SAVED
+PHYSICAL = {f'X{i}' for i in range(31)}
+
+# instructions that only read their operands
+NO_DEF = {'STR', 'RET', 'SVC', 'CMP', 'CBZ', 'CBNZ'}
+
+# instructions that also read their destination
+READ_DEF = {'MOVK'}
+
+# registers read implicitly
+IMPLICIT_USES = {'RET': ['X0']}
+
+# a call clobbers every caller-saved register, values live across it end up callee-saved or spilled
+CALL_CLOBBERS = ARGUMENT + TEMPORARY
+
+# largest scaled offset for LDR/STR (unsigned imm12 * 8) and SP adjustment per ADD/SUB (imm12)
+MAX_FRAME = 4095 * 8
+MAX_SP_ADJUST = 4080
+
+
+def is_vreg(x: str) -> bool:
+    return x[0] == '%'
+
+
+def target(line: list[str]) -> str | None:
+    # label a branch goes to (B, B.cond, CBZ/CBNZ), calls come back and don't count
+    op = line[0]
+    if op == 'B' or op.startswith('B.'): return line[1]
+    if op in ('CBZ', 'CBNZ'): return line[2]
+    return None
+
+
+def operands(line: list[str]) -> tuple[list[str], list[str]]:
+    # (defs, uses) of registers in a lexed instruction line
+    op, args = line[0], line[1:]
+    if op.startswith('.') or op.endswith(':'): return [], []
+    regs = [x for x in args if is_vreg(x) or x in PHYSICAL]
+    if op == 'BL': return CALL_CLOBBERS, regs  # ['BL', target, *argument registers]
+    uses = IMPLICIT_USES.get(op, [])
+    if op in NO_DEF or not args or regs[:1] != args[:1]: return [], regs + uses
+    if op in READ_DEF: return regs[:1], regs + uses
+    return regs[:1], regs[1:] + uses
+
+
+@dataclass(slots=True)
+class Interval:
+    reg: str
+    start: int
+    end: int
+    # preferred physical register and move-related virtual register
+    hint: str | None = None
+    copy_of: str | None = None
+
+
+@dataclass
+class Allocation:
+    assigned: dict[str, str] = field(default_factory=dict)
+    spilled: list[str] = field(default_factory=list)
+
+
+class RegisterAllocator:
+    def __init__(self, n: int = 0):
+        # virtual registers %0..%n-1 are already in use
+        self.n = n
+
+        # result of the last allocate()
+        self.allocation = Allocation()
+
+    def new_reg(self) -> str:
+        # virtual register, mapped to a physical one by allocate()
+        self.n += 1
+        return f'%{self.n - 1}'
+
+    # *************** linear scan ***************
+
+    def allocate(self, code: list[list[str]]) -> list[list[str]]:
+        intervals, fixed = self._live_ranges(code)
+        self._hints(code, intervals)
+        self.allocation = self._scan(intervals, fixed)
+        return self._rewrite(code, self.allocation)
+
+    def _live_ranges(self, code: list[list[str]]):
+        intervals: dict[str, Interval] = {}
+        fixed: defaultdict[str, list[list[int]]] = defaultdict(list)
+
+        for i, line in enumerate(code):
+            defs, uses = operands(line)
+            for r in uses:
+                if is_vreg(r):
+                    intervals[r].end = i
+                elif fixed[r]:
+                    fixed[r][-1][1] = i
+                else:
+                    fixed[r].append([0, i])  # live on entry
+            for r in defs:
+                if is_vreg(r):
+                    if r not in intervals: intervals[r] = Interval(r, i, i)
+                    intervals[r].end = i
+                else:
+                    fixed[r].append([i, i])
+
+        if any(line[0].endswith(':') for line in code): self._extend(code, intervals)
+        return intervals, fixed
+
+    def _extend(self, code: list[list[str]], intervals: dict[str, Interval]):
+        # straight-line ranges miss values carried around a back edge: an interval covers every block it's live into
+        # or out of, from liveness over the blocks between labels and branches
+        cuts = {0}
+        for i, line in enumerate(code):
+            if line[0].endswith(':'): cuts.add(i)
+            elif line[0] == 'RET' or target(line) is not None: cuts.add(i + 1)
+        starts = sorted(x for x in cuts if x < len(code))
+        ends = starts[1:] + [len(code)]
+        labels = {code[x][0][:-1]: k for k, x in enumerate(starts) if code[x][0].endswith(':')}
+
+        succ, gen, kill = [], [], []
+        for k, (s, e) in enumerate(zip(starts, ends)):
+            last = code[e - 1]
+            t = target(last)
+            succ.append([labels[t]] if t in labels else [])
+            if last[0] not in ('B', 'RET') and k + 1 < len(starts): succ[-1].append(k + 1)
+            g: set[str] = set()
+            d: set[str] = set()
+            for line in code[s:e]:
+                defs, uses = operands(line)
+                g.update(r for r in uses if is_vreg(r) and r not in d)
+                d.update(r for r in defs if is_vreg(r))
+            gen.append(g)
+            kill.append(d)
+
+        live_in: list[set[str]] = [set() for _ in starts]
+        changed = True
+        while changed:
+            changed = False
+            for k in reversed(range(len(starts))):
+                live = gen[k] | (set().union(*(live_in[j] for j in succ[k])) - kill[k])
+                if live != live_in[k]:
+                    live_in[k] = live
+                    changed = True
+
+        for k, (s, e) in enumerate(zip(starts, ends)):
+            for r in live_in[k]:
+                iv = intervals[r]
+                iv.start, iv.end = min(iv.start, s), max(iv.end, s)
+            for r in set().union(*(live_in[j] for j in succ[k])):
+                iv = intervals[r]
+                iv.start, iv.end = min(iv.start, e - 1), max(iv.end, e - 1)
+
+    def _hints(self, code: list[list[str]], intervals: dict[str, Interval]):
+        # walk moves backwards so a physical destination propagates up copy chains
+        for i in reversed(range(len(code))):
+            line = code[i]
+            if line[0] != 'MOV' or len(line) != 3: continue
+            dst, src = line[1], line[2]
+            if is_vreg(src) and intervals[src].end == i:
+                if is_vreg(dst):
+                    intervals[dst].copy_of = src
+                    intervals[src].hint = intervals[dst].hint
+                elif dst in ALLOCATABLE:
+                    intervals[src].hint = dst
+            elif is_vreg(dst) and src in ALLOCATABLE:
+                intervals[dst].hint = src
+
+    def _scan(self, intervals: dict[str, Interval], fixed) -> Allocation:
+        res = Allocation()
+        free = set(ALLOCATABLE)
+        active: list[Interval] = []
+
+        def conflicts(reg: str, iv: Interval) -> bool:
+            return any(s < iv.end and iv.start < e for s, e in fixed.get(reg, ()))
+
+        for iv in sorted(intervals.values(), key=lambda x: x.start):
+
+            # expire intervals that end before this one starts
+            for a in [a for a in active if a.end <= iv.start]:
+                active.remove(a)
+                free.add(res.assigned[a.reg])
+
+            # coalesce with the copied value or the hinted register, else take the lowest free one
+            prefs = [res.assigned.get(iv.copy_of or ''), iv.hint] + ALLOCATABLE
+            reg = next((r for r in prefs if r in free and not conflicts(r, iv)), None)
+
+            if reg is None:
+                # spill whichever live interval ends last
+                victims = [a for a in active if not conflicts(res.assigned[a.reg], iv)]
+                v = max(victims, key=lambda a: a.end, default=None)
+                if v is None or v.end <= iv.end:
+                    res.spilled.append(iv.reg)
+                    continue
+                reg = res.assigned.pop(v.reg)
+                res.spilled.append(v.reg)
+                active.remove(v)
+                free.add(reg)
+
+            free.remove(reg)
+            res.assigned[iv.reg] = reg
+            active.append(iv)
+
+        return res
+
+    def _rewrite(self, code: list[list[str]], alloc: Allocation) -> list[list[str]]:
+        # frame: callee-saved registers in use (kept low, STP/LDP offsets are 7 bits), then spill slots;
+        # functions that call out also push a frame record (X29, X30) above it
+        saved = [r for r in CALLEE_SAVED if r in alloc.assigned.values()]
+        slots = {r: 8 * (len(saved) + i) for i, r in enumerate(alloc.spilled)}
+        offsets = {r: 8 * i for i, r in enumerate(saved)} | slots
+        frame = (8 * len(offsets) + 15) & ~15
+        calls = any(line[0] == 'BL' for line in code)
+
+        if frame > MAX_FRAME: raise ValueError(f'stack frame too large ({frame} bytes)')
+
+        def mem(r: str) -> str:
+            return f'[SP, #{offsets[r]}]'
+
+        def adjust_sp(op: str) -> list[list[str]]:
+            n, res = frame, []
+            while n > 0:
+                res.append([op, 'SP', 'SP', f'#{min(n, MAX_SP_ADJUST)}'])
+                n -= MAX_SP_ADJUST
+            return res
+
+        def save(pair: str, single: str) -> list[list[str]]:
+            # callee-saved registers in pairs, an odd one out on its own
+            chunks = [saved[i:i + 2] for i in range(0, len(saved), 2)]
+            return [[pair if len(x) == 2 else single, *x, mem(x[0])] for x in chunks]
+
+        # prologue
+        out = [['STP', 'X29', 'X30', '[SP, #-16]!'], ['ADD', 'X29', 'SP', '#0']] if calls else []
+        out += adjust_sp('SUB') + save('STP', 'STR')
+
+        for line in code:
+            if line[0] == 'RET':
+                # epilogue
+                out += save('LDP', 'LDR') + adjust_sp('ADD')
+                if calls: out.append(['LDP', 'X29', 'X30', '[SP]', '#16'])
+
+            if line[0] == 'BL':
+                out.append(line[:2])
+                continue
+
+            defs, uses = operands(line)
+
+            # copies to or from a stack slot become a single store or load
+            if line[0] == 'MOV' and len(line) == 3 and (line[1] in slots) != (line[2] in slots) and line[2][0] != '#':
+                dst, src = (alloc.assigned.get(x, x) for x in line[1:])
+                if line[1] in slots: out.append(['STR', src, mem(line[1])])
+                else: out.append(['LDR', dst, mem(line[2])])
+                continue
+
+            # reload spilled sources into scratch registers
+            loaded: dict[str, str] = {}
+            for r in uses:
+                if r in slots and r not in loaded:
+                    loaded[r] = SCRATCH[len(loaded)]
+                    out.append(['LDR', loaded[r], mem(r)])
+
+            spill = [r for r in defs if r in slots]
+            new = [line[0]]
+            for i, x in enumerate(line[1:]):
+                if i == 0 and spill: new.append(SCRATCH[0])
+                else: new.append(loaded.get(x) or alloc.assigned.get(x, x))
+
+            # coalesced copies vanish
+            if new[0] != 'MOV' or len(new) != 3 or new[1] != new[2]: out.append(new)
+
+            if spill: out.append(['STR', SCRATCH[0], mem(spill[0])])
+
+        return out
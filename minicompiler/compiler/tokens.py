@@ -1,5 +1,6 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from minicompiler.source import Text
 
 
 @dataclass(frozen=True)
@@ -14,6 +15,8 @@ class TokType(Enum):
     BOOL = TokTypeVal('BOOL', 'bool')
     VOID = TokTypeVal('VOID', 'void')
     ReturnStmt = TokTypeVal('ReturnStmt', 'return')
+    WHILE = TokTypeVal('WHILE', 'while')
+    FOR = TokTypeVal('FOR', 'for')
 
     # block separators
     LPAREN = TokTypeVal('LPAREN', r'\(')
@@ -27,6 +30,17 @@ class TokType(Enum):
     COMMA = TokTypeVal('COMMA', r',')
     SEMIC = TokTypeVal('SEMICOLON', r';')
     PLUS = TokTypeVal('PLUS', r'\+')
+    MINUS = TokTypeVal('MINUS', r'\-')
+    STAR = TokTypeVal('STAR', r'\*')
+    SLASH = TokTypeVal('SLASH', r'\/')
+
+    # comparisons, two character operators first so they win over their prefixes
+    EQEQ = TokTypeVal('EQEQ', r'==')
+    NE = TokTypeVal('NE', r'!=')
+    LE = TokTypeVal('LE', r'<=')
+    GE = TokTypeVal('GE', r'>=')
+    LT = TokTypeVal('LT', r'<')
+    GT = TokTypeVal('GT', r'>')
     EQ = TokTypeVal('EQ', r'\=')
 
     # atoms
@@ -36,10 +50,20 @@ class TokType(Enum):
     STR = TokTypeVal('STRING', r'"([^"\\]|\\.)*"')
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Tok:
     type: TokType
-    data: str | None
+    # the text stays in the source, tokens only keep their span
+    src: Text = field(repr=False, compare=False)
+    pos: int = 0
+    end: int = 0
+    line: int = field(default=0, compare=False)
+    col: int = field(default=0, compare=False)
+
+    @property
+    def data(self) -> str:
+        s = self.src[self.pos:self.end]
+        return s if isinstance(s, str) else s.decode()
 
     def __repr__(self):
         return f'T(type=<TokType.{self.type.value.repr}>, data=\'{self.data}\')'
@@ -1,35 +1,12 @@
-import random
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+from typing import ClassVar, Iterator
+from minicompiler.compiler.ir import IRBuilder, Module
+from minicompiler.compiler.passes import FOLD, wrap
 
 
-class RegisterAllocator:
-    def __init__(self):
-        self.regs = [f'X{i}' for i in range(31)]
-        self.free = set(self.regs)
-        self.h = {}
-
-    def get_free(self) -> str:
-        i = random.randint(0, len(self.regs) - 1)
-        reg = self.regs[i]
-        self.free.remove(reg)
-        self.regs[i], self.regs[-1] = self.regs[-1], self.regs[i]
-        self.regs.pop()
-        return reg
-
-    def alloc_var(self, var: str) -> str:
-        reg = self.get_free()
-        self.h[var] = reg
-        return reg
-
-    def get_reg(self, var: str) -> str:
-        return self.h.get(var, 'NA')
-
-
-@dataclass
+@dataclass(slots=True)
 class ASTNode:
 
-    is_leaf: bool = field(default=False, repr=False)
-
     def print(self, d: int = 0, v: bool = False):
 
         def is_node(n): return isinstance(n, ASTNode)
@@ -42,7 +19,7 @@ class ASTNode:
 
         # attrs
         p, d = p + '  ', d + 1
-        for k in self.__dict__:
+        for k in (f.name for f in fields(self)):
             n = getattr(self, k)
             if has_nodes(n):
                 if v: print(f'{p}{k}=(')
@@ -56,176 +33,434 @@ class ASTNode:
             else:
                 if v: print(f'{p}{k}={n}')
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        return [f'{self.__class__.__name__} -- NA']
+    def walk(self) -> Iterator['ASTNode']:
+        # every node in the tree, preorder
+        stack: list[ASTNode] = [self]
+        while stack:
+            n = stack.pop()
+            yield n
+            for f in fields(n):
+                x = getattr(n, f.name)
+                if isinstance(x, ASTNode): stack.append(x)
+                elif isinstance(x, list): stack.extend(reversed([y for y in x if isinstance(y, ASTNode)]))
+
+    def gen_ir(self, b: IRBuilder):
+        raise TypeError(f'{self.__class__.__name__} has no lowering')
 
+    # constant folding, returns the node to keep in its place (None drops it)
+    def fold(self, env: dict[str, int]) -> 'ASTNode | None':
+        return self
 
-@dataclass
+
+@dataclass(slots=True)
 class Root(ASTNode):
     children: list[ASTNode] = field(default_factory=list, repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        a = []
+    def gen_ir(self, b: IRBuilder):
         for x in self.children:
-            a += x.gen_asm(ra)
-        return a
+            x.gen_ir(b)
+
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        self.children = [y for y in (x.fold(env) for x in self.children) if y]
+        return self
 
 
-@dataclass
+@dataclass(slots=True)
 class Expr(ASTNode):
-    # outputs
-    out_reg: str | None = field(default=None, repr=False)
 
+    def operands(self) -> tuple['Expr', ...]:
+        return ()
 
-@dataclass
+    # lowered after its operands, receives the temps holding their values
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:  # type: ignore[override]
+        raise TypeError(f'{self.__class__.__name__} has no lowering')
+
+    # folded after its operands, receives their folded replacements
+    def fold(self, env: dict[str, int], *ops: 'Expr') -> 'Expr':
+        return self
+
+
+@dataclass(slots=True)
 class Stmt(ASTNode): pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Decl(ASTNode): pass
 
 
-@dataclass
+@dataclass(slots=True)
 class NumExpr(Expr):
-    # inputs
     val: int | None = None
-    # outputs
-    out_reg: str | None = field(default=None, repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        self.out_reg = ra.get_free()
-        return [f'MOV {self.out_reg}, #{self.val}']
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return b.emit('const', self.val)
+
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        if self.val is not None: self.val = wrap(self.val)
+        return self
 
 
-@dataclass
+@dataclass(slots=True)
 class BinOp(Expr):
-    is_leaf: bool = field(default=True, repr=False)
     op1: Expr = field(default_factory=Expr, repr=False)
     op2: Expr = field(default_factory=Expr, repr=False)
 
+    opcode: ClassVar[str] = ''
+
+    def operands(self) -> tuple[Expr, ...]:
+        return self.op1, self.op2
+
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return b.emit(self.opcode, *vals)
+
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        self.op1, self.op2 = ops
+        if isinstance(self.op1, NumExpr) and isinstance(self.op2, NumExpr):
+            return NumExpr(FOLD[self.opcode](self.op1.val, self.op2.val))
+        return self
+
 
-@dataclass
+@dataclass(slots=True)
+class UnaryOp(Expr):
+    op: Expr = field(default_factory=Expr, repr=False)
+
+    opcode: ClassVar[str] = ''
+
+    def operands(self) -> tuple[Expr, ...]:
+        return (self.op,)
+
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return b.emit(self.opcode, *vals)
+
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        self.op, = ops
+        if isinstance(self.op, NumExpr): return NumExpr(FOLD[self.opcode](self.op.val))
+        return self
+
+
+@dataclass(slots=True)
 class ParenExpr(Expr):
-    expr: Expr | None = field(default=None, repr=False)
+    expr: Expr = field(default_factory=Expr, repr=False)
+
+    def operands(self) -> tuple[Expr, ...]:
+        return (self.expr,)
+
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return vals[0]
 
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        self.expr, = ops
+        return self.expr if isinstance(self.expr, NumExpr) else self
 
-@dataclass
+
+@dataclass(slots=True)
 class DeclRefExpr(Expr):
-    # inputs
     ident: str = ''
-    # outputs
-    out_reg: str = field(default='NA', repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        self.out_reg = ra.get_reg(self.ident)
-        return []
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return b.lookup(self.ident)
+
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        return NumExpr(env[self.ident]) if self.ident in env else self
+
+
+@dataclass(slots=True)
+class CallExpr(Expr):
+    ident: str = ''
+    args: list[Expr] = field(default_factory=list, repr=False)
+
+    def operands(self) -> tuple[Expr, ...]:
+        return tuple(self.args)
+
+    def gen_ir(self, b: IRBuilder, *vals: str) -> str:
+        return b.emit('call', self.ident, *vals)
+
+    def fold(self, env: dict[str, int], *ops: Expr) -> Expr:
+        # the callee is opaque here, inlining happens on the IR
+        self.args = list(ops)
+        return self
 
 
-@dataclass
+@dataclass(slots=True)
 class AddOp(BinOp):
-    # outputs
-    out_reg: str | None = field(default=None, repr=False)
+    opcode: ClassVar[str] = 'add'
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
 
-        op1, op2 = self.op1, self.op2
+@dataclass(slots=True)
+class SubOp(BinOp):
+    opcode: ClassVar[str] = 'sub'
 
-        asm1, asm2 = op1.gen_asm(ra), op2.gen_asm(ra)
 
-        r1, r2 = op1.out_reg, op2.out_reg
+@dataclass(slots=True)
+class MulOp(BinOp):
+    opcode: ClassVar[str] = 'mul'
 
-        self.out_reg = ra.get_free()
 
-        a = []
-        a += asm1
-        a += asm2
-        a += [f'ADD {self.out_reg}, {r1}, {r2}']
-        return a
+@dataclass(slots=True)
+class DivOp(BinOp):
+    opcode: ClassVar[str] = 'div'
 
 
-@dataclass
+@dataclass(slots=True)
+class NegOp(UnaryOp):
+    opcode: ClassVar[str] = 'neg'
+
+
+# comparisons evaluate to 1 or 0
+@dataclass(slots=True)
+class LtOp(BinOp):
+    opcode: ClassVar[str] = 'lt'
+
+
+@dataclass(slots=True)
+class LeOp(BinOp):
+    opcode: ClassVar[str] = 'le'
+
+
+@dataclass(slots=True)
+class GtOp(BinOp):
+    opcode: ClassVar[str] = 'gt'
+
+
+@dataclass(slots=True)
+class GeOp(BinOp):
+    opcode: ClassVar[str] = 'ge'
+
+
+@dataclass(slots=True)
+class EqOp(BinOp):
+    opcode: ClassVar[str] = 'eq'
+
+
+@dataclass(slots=True)
+class NeOp(BinOp):
+    opcode: ClassVar[str] = 'ne'
+
+
+def lower(root: Expr, b: IRBuilder) -> str:
+    # post-order walk with an explicit stack, long operator chains are deeper than the recursion limit
+    stack: list[tuple[Expr, bool]] = [(root, False)]
+    vals: list[str] = []
+    while stack:
+        node, ready = stack.pop()
+        if ready:
+            n = len(node.operands())
+            args = vals[len(vals) - n:]
+            del vals[len(vals) - n:]
+            vals.append(node.gen_ir(b, *args))
+        else:
+            stack.append((node, True))
+            stack.extend((x, False) for x in reversed(node.operands()))
+    return vals.pop()
+
+
+def fold_expr(root: Expr, env: dict[str, int]) -> Expr:
+    # same walk as lower(), collapsing subtrees whose operands are all constants
+    stack: list[tuple[Expr, bool]] = [(root, False)]
+    vals: list[Expr] = []
+    while stack:
+        node, ready = stack.pop()
+        if ready:
+            n = len(node.operands())
+            args = vals[len(vals) - n:]
+            del vals[len(vals) - n:]
+            vals.append(node.fold(env, *args))
+        else:
+            stack.append((node, True))
+            stack.extend((x, False) for x in reversed(node.operands()))
+    return vals.pop()
+
+
+def assigned(node: ASTNode) -> set[str]:
+    # variables assigned anywhere under node, only statements are visited (expressions can't assign)
+    res: set[str] = set()
+    stack = [node]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, AssignStmt): res.add(x.ident)
+        elif isinstance(x, CompoundStmt): stack.extend(x.stmts)
+        elif isinstance(x, WhileStmt): stack.append(x.body)
+        elif isinstance(x, ForStmt): stack.extend(y for y in (x.init, x.step, x.body) if y)
+    return res
+
+
+@dataclass(slots=True)
 class CompoundStmt(Stmt):
     stmts: list[Stmt] = field(default_factory=list, repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        a = []
+    def gen_ir(self, b: IRBuilder):
+        # declarations are scoped to the block
+        scope = dict(b.vars)
         for x in self.stmts:
-            a += x.gen_asm(ra)
-        return a
+            x.gen_ir(b)
+        b.vars = scope
+
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        # constant declarations are dropped unless something assigns to them later
+        outer, mutable = dict(env), assigned(self)
+        declared = [x.var.ident for x in self.stmts if isinstance(x, DeclStmt)]
+        stmts: list[Stmt] = []
+        for x in self.stmts:
+            y = x.fold(env)
+            if isinstance(y, Stmt): stmts.append(y)
+            elif isinstance(x, DeclStmt) and x.var.ident in mutable: stmts.append(x)
+        self.stmts = stmts
+
+        # names declared here go out of scope
+        for k in declared:
+            if k in outer: env[k] = outer[k]
+            else: env.pop(k, None)
+        return self
 
 
-@dataclass
+@dataclass(slots=True)
 class VarDecl(Decl):
-    type: ASTNode | None = None
+    type: str | None = None
     ident: str = ''
     val: Expr = field(default_factory=Expr, repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
+    def gen_ir(self, b: IRBuilder):
+        b.bind(self.ident, lower(self.val, b))
 
-        # assign register to variable
-        reg = ra.alloc_var(self.ident)
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        # constant bindings are remembered and substituted into later references
+        self.val = fold_expr(self.val, env)
+        if isinstance(self.val, NumExpr) and self.val.val is not None: env[self.ident] = self.val.val
+        else: env.pop(self.ident, None)
+        return self
 
-        # codegen for associated value expression
-        asm = self.val.gen_asm(ra)
 
-        # output register for assigned expression
-        val = self.val.out_reg
-
-        a: list[str] = []
-        a += asm
-        a += [f'MOV {reg}, {val}']
-        return a
-
-
-@dataclass
+@dataclass(slots=True)
 class DeclStmt(Stmt):
     var: VarDecl = field(default_factory=VarDecl, repr=False)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        return self.var.gen_asm(ra)
+    def gen_ir(self, b: IRBuilder):
+        self.var.gen_ir(b)
 
+    def fold(self, env: dict[str, int]) -> ASTNode | None:
+        # every use of a constant declaration has been substituted
+        self.var.fold(env)
+        return None if self.var.ident in env else self
 
-@dataclass
-class ReturnStmt(Stmt):
-    # inputs
-    expr: Expr = field(default_factory=Expr, repr=False)
-    # outputs
-    out_reg: str = field(default='X0', repr=False)  # always place output in X0
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
+@dataclass(slots=True)
+class AssignStmt(Stmt):
+    ident: str = ''
+    expr: Expr = field(default_factory=Expr, repr=False)
 
-        expr = self.expr.gen_asm(ra)
+    def gen_ir(self, b: IRBuilder):
+        b.assign(self.ident, lower(self.expr, b))
+
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        # straight-line code sees the new value, loops drop what they assign before folding
+        self.expr = fold_expr(self.expr, env)
+        if isinstance(self.expr, NumExpr) and self.expr.val is not None: env[self.ident] = self.expr.val
+        else: env.pop(self.ident, None)
+        return self
+
+
+@dataclass(slots=True)
+class WhileStmt(Stmt):
+    cond: Expr = field(default_factory=Expr, repr=False)
+    body: CompoundStmt = field(default_factory=CompoundStmt, repr=False)
+
+    def gen_ir(self, b: IRBuilder):
+        loop(b, self.cond, self.body, None)
+
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        mutable = assigned(self)
+        for x in mutable: env.pop(x, None)
+        self.cond = fold_expr(self.cond, env)
+        self.body.fold(env)
+        for x in mutable: env.pop(x, None)
+        return self
+
+
+@dataclass(slots=True)
+class ForStmt(Stmt):
+    init: Stmt | None = field(default=None, repr=False)
+    cond: Expr | None = field(default=None, repr=False)
+    step: Stmt | None = field(default=None, repr=False)
+    body: CompoundStmt = field(default_factory=CompoundStmt, repr=False)
+
+    def gen_ir(self, b: IRBuilder):
+        # the init declaration is scoped to the loop
+        scope = dict(b.vars)
+        if self.init: self.init.gen_ir(b)
+        loop(b, self.cond, self.body, self.step)
+        b.vars = scope
+
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        # the init statement stays even if constant, the step assigns to it
+        outer, mutable = dict(env), assigned(self)
+        if self.init: self.init.fold(env)
+        for x in mutable: env.pop(x, None)
+        if self.cond: self.cond = fold_expr(self.cond, env)
+        self.body.fold(env)
+        if self.step: self.step.fold(env)
+        for x in mutable: env.pop(x, None)
+        if isinstance(self.init, DeclStmt):
+            name = self.init.var.ident
+            if name in outer: env[name] = outer[name]
+            else: env.pop(name, None)
+        return self
+
+
+def loop(b: IRBuilder, cond: Expr | None, body: CompoundStmt, step: Stmt | None):
+    # rotated: jump to the test at the bottom, so each iteration takes a single (conditional) branch
+    top, test, done = b.make_block(), b.make_block(), b.make_block()
+    b.emit_void('jmp', test.label)
+    b.place(top)
+    body.gen_ir(b)
+    if step: step.gen_ir(b)
+    b.place(test)
+    if cond is None: b.emit_void('jmp', top.label)
+    else: b.emit_void('br', lower(cond, b), top.label, done.label)
+    b.place(done)
+
+
+@dataclass(slots=True)
+class ReturnStmt(Stmt):
+    expr: Expr = field(default_factory=Expr, repr=False)
 
-        in_reg = self.expr.out_reg
+    def gen_ir(self, b: IRBuilder):
+        b.emit_void('ret', lower(self.expr, b))
 
-        a = []
-        a += expr
-        a += [f'MOV {self.out_reg}, {in_reg}']
-        a += ['RET']
-        return a
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        self.expr = fold_expr(self.expr, env)
+        return self
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionDecl(Decl):
-    rtype: ASTNode | None = None
+    rtype: str | None = None
     ident: str = ''
     args: list[VarDecl] = field(default_factory=list)
     body: CompoundStmt = field(default_factory=CompoundStmt)
 
-    def gen_asm(self, ra: RegisterAllocator, *args, **kwargs) -> list[str]:
-        body = self.body.gen_asm(ra)
+    def gen_ir(self, b: IRBuilder):
+        b.function(self.ident, [x.ident for x in self.args])
+        self.body.gen_ir(b)
+
+        # falling off the end returns 0
+        if not b.block.terminator(): b.emit_void('ret', b.emit('const', 0))
 
-        a = []
-        a += [f'.global {self.ident}']
-        a += [f'{self.ident}:']
-        a += body
-        return a
+    def fold(self, env: dict[str, int]) -> ASTNode:
+        # bindings are local to the function
+        self.body.fold({})
+        return self
 
     def __repr__(self):
-        return f'{self.__class__.__name__}(rtype={self.rtype}, ident={self.ident})'
+        return f'{self.__class__.__name__}(rtype={self.rtype!r}, ident={self.ident})'
+
+
+def fold(root: ASTNode) -> ASTNode:
+    # AST -> AST, in place
+    root.fold({})
+    return root
 
 
-def gen_asm(root: ASTNode) -> str:
-    ra = RegisterAllocator()
-    a = root.gen_asm(ra)
-    return '\n'.join(a)
+def gen_ir(root: ASTNode) -> Module:
+    b = IRBuilder()
+    root.gen_ir(b)
+    return b.module
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+import sys
+import struct
+import argparse
+from collections import Counter
+from typing import Callable
+from minicompiler.assembler.disasm import decode, decode_columns
+from minicompiler.assembler.batch import OPS
+from minicompiler.assembler.macho import N_TYPE, N_SECT, N_EXT
+from minicompiler.linker.main import read_object, relocate
+from minicompiler.source import mapped
+
+
+MASK = (1 << 64) - 1
+
+# register file slots: X0-X30, then XZR (always zero), SP, a sink for writes to XZR and the NZCV flags
+ZR, SP, SINK, FLAGS = 31, 32, 33, 34
+
+# return address of the entry point, the run ends when the pc gets here
+HALT = MASK & ~0x3
+
+# macOS syscall numbers (X16)
+SYS_EXIT = 1
+SYS_WRITE = 4
+
+WORD = struct.Struct('<I')
+QWORD = struct.Struct('<Q')
+
+# handler: (registers, pc) -> next pc
+Handler = Callable[[list[int], int], int]
+
+
+class EmulatorError(Exception): pass
+
+
+def _signed(x: int) -> int:
+    return x - (1 << 64) if x >> 63 else x
+
+
+def _src(r: int) -> int: return r
+def _dst(r: int) -> int: return SINK if r == ZR else r
+def _sp(r: int) -> int: return SP if r == ZR else r
+
+
+def _nzcv(a: int, b: int) -> int:
+    # flags of a - b (as SUBS sets them), N << 3 | Z << 2 | C << 1 | V
+    r = (a - b) & MASK
+    return (r >> 63) << 3 | (r == 0) << 2 | (a >= b) << 1 | ((a ^ b) & (a ^ r)) >> 63
+
+
+def _holds(cond: int, nzcv: int) -> bool:
+    # pairs of conditions share a test, the odd one of each pair is inverted (except NV, which is AL)
+    n, z, c, v = nzcv >> 3, nzcv >> 2 & 1, nzcv >> 1 & 1, nzcv & 1
+    res = [z, c, n, v, c and not z, n == v, n == v and not z, True][cond >> 1]
+    return bool(res) != (cond & 1 and cond != 0xF)
+
+
+# condition -> flags -> taken
+COND = [[_holds(c, f) for f in range(16)] for c in range(16)]
+
+
+# ***************************** semantics *****************************
+# op (the batch encoder's table) -> handler factory, fields as decode_columns returns them
+
+
+def _movz(_, rd, rn, rm, imm) -> Handler:
+    rd, v = _dst(rd), (imm & 0xFFFF) << 16 * (imm >> 16)
+    def f(x, pc):
+        x[rd] = v
+        return pc + 4
+    return f
+
+
+def _movn(_, rd, rn, rm, imm) -> Handler:
+    rd, v = _dst(rd), ~((imm & 0xFFFF) << 16 * (imm >> 16)) & MASK
+    def f(x, pc):
+        x[rd] = v
+        return pc + 4
+    return f
+
+
+def _movk(_, rd, rn, rm, imm) -> Handler:
+    rd, keep, v = _dst(rd), ~(0xFFFF << 16 * (imm >> 16)) & MASK, (imm & 0xFFFF) << 16 * (imm >> 16)
+    def f(x, pc):
+        x[rd] = x[rd] & keep | v
+        return pc + 4
+    return f
+
+
+def _orr(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        x[rd] = x[rn] | x[rm]
+        return pc + 4
+    return f
+
+
+def _add(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        x[rd] = (x[rn] + x[rm]) & MASK
+        return pc + 4
+    return f
+
+
+def _sub(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        x[rd] = (x[rn] - x[rm]) & MASK
+        return pc + 4
+    return f
+
+
+def _madd(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        x[rd] = (x[rn] * x[rm]) & MASK
+        return pc + 4
+    return f
+
+
+def _sdiv(_, rd, rn, rm, imm) -> Handler:
+    # rounds toward zero, division by zero gives zero
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        a, b = _signed(x[rn]), _signed(x[rm])
+        q = abs(a) // abs(b) if b else 0
+        x[rd] = (q if (a < 0) == (b < 0) else -q) & MASK
+        return pc + 4
+    return f
+
+
+def _subs(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm = _dst(rd), _src(rn), _src(rm)
+    def f(x, pc):
+        a, b = x[rn], x[rm]
+        x[rd] = (a - b) & MASK
+        x[FLAGS] = _nzcv(a, b)
+        return pc + 4
+    return f
+
+
+def _subsi(_, rd, rn, rm, imm) -> Handler:
+    rd, rn = _dst(rd), _sp(rn)
+    def f(x, pc):
+        a = x[rn]
+        x[rd] = (a - imm) & MASK
+        x[FLAGS] = _nzcv(a, imm)
+        return pc + 4
+    return f
+
+
+def _csinc(_, rd, rn, rm, imm) -> Handler:
+    rd, rn, rm, t = _dst(rd), _src(rn), _src(rm), COND[imm]
+    def f(x, pc):
+        x[rd] = x[rn] if t[x[FLAGS]] else (x[rm] + 1) & MASK
+        return pc + 4
+    return f
+
+
+def _addi(_, rd, rn, rm, imm) -> Handler:
+    rd, rn = _sp(rd), _sp(rn)
+    def f(x, pc):
+        x[rd] = (x[rn] + imm) & MASK
+        return pc + 4
+    return f
+
+
+def _subi(_, rd, rn, rm, imm) -> Handler:
+    rd, rn = _sp(rd), _sp(rn)
+    def f(x, pc):
+        x[rd] = (x[rn] - imm) & MASK
+        return pc + 4
+    return f
+
+
+def _str(m: 'Emulator', rd, rn, rm, imm) -> Handler:
+    rt, rn, off, mem = _src(rd), _sp(rn), imm << 3, m.mem
+    def f(x, pc):
+        QWORD.pack_into(mem, x[rn] + off, x[rt])
+        return pc + 4
+    return f
+
+
+def _ldr(m: 'Emulator', rd, rn, rm, imm) -> Handler:
+    rt, rn, off, mem = _dst(rd), _sp(rn), imm << 3, m.mem
+    def f(x, pc):
+        x[rt] = QWORD.unpack_from(mem, x[rn] + off)[0]
+        return pc + 4
+    return f
+
+
+def _pair(load: bool, pre: bool, post: bool):
+    # STP/LDP: address is base + offset unless post-indexed, pre/post-index write the new address back
+    def factory(m: 'Emulator', rd, rn, rm, imm) -> Handler:
+        rt, rt2, rn, off, mem = (_dst if load else _src)(rd), (_dst if load else _src)(rm), _sp(rn), imm << 3, m.mem
+        def f(x, pc):
+            a = x[rn] if post else x[rn] + off
+            if load:
+                x[rt] = QWORD.unpack_from(mem, a)[0]
+                x[rt2] = QWORD.unpack_from(mem, a + 8)[0]
+            else:
+                QWORD.pack_into(mem, a, x[rt])
+                QWORD.pack_into(mem, a + 8, x[rt2])
+            if pre or post: x[rn] = (x[rn] + off) & MASK
+            return pc + 4
+        return f
+    return factory
+
+
+def _adr(_, rd, rn, rm, imm) -> Handler:
+    rd = _dst(rd)
+    def f(x, pc):
+        x[rd] = (pc + imm) & MASK
+        return pc + 4
+    return f
+
+
+def _adrp(_, rd, rn, rm, imm) -> Handler:
+    rd, off = _dst(rd), imm << 12
+    def f(x, pc):
+        x[rd] = ((pc & ~0xFFF) + off) & MASK
+        return pc + 4
+    return f
+
+
+def _b(_, rd, rn, rm, imm) -> Handler:
+    def f(x, pc):
+        return pc + imm
+    return f
+
+
+def _bl(_, rd, rn, rm, imm) -> Handler:
+    def f(x, pc):
+        x[30] = pc + 4
+        return pc + imm
+    return f
+
+
+def _bcond(_, rd, rn, rm, imm) -> Handler:
+    t = COND[rd]
+    def f(x, pc):
+        return pc + imm if t[x[FLAGS]] else pc + 4
+    return f
+
+
+def _cbz(_, rd, rn, rm, imm) -> Handler:
+    rt = _src(rd)
+    def f(x, pc):
+        return pc + 4 if x[rt] else pc + imm
+    return f
+
+
+def _cbnz(_, rd, rn, rm, imm) -> Handler:
+    rt = _src(rd)
+    def f(x, pc):
+        return pc + imm if x[rt] else pc + 4
+    return f
+
+
+def _svc(m: 'Emulator', rd, rn, rm, imm) -> Handler:
+    def f(x, pc):
+        return m.syscall(x, pc)
+    return f
+
+
+def _ret(_, rd, rn, rm, imm) -> Handler:
+    def f(x, pc):
+        return x[30]
+    return f
+
+
+SEMANTICS: dict[str, Callable[..., Handler]] = {
+    'MOVZ': _movz,
+    'MOVN': _movn,
+    'MOVK': _movk,
+    'ORR': _orr,
+    'ADD': _add,
+    'SUB': _sub,
+    'MADD': _madd,
+    'SDIV': _sdiv,
+    'ADDI': _addi,
+    'SUBI': _subi,
+    'STR': _str,
+    'LDR': _ldr,
+    'ADR': _adr,
+    'SVC': _svc,
+    'RET': _ret,
+    'ADRP': _adrp,
+    'B': _b,
+    'BL': _bl,
+    'STP': _pair(load=False, pre=False, post=False),
+    'LDP': _pair(load=True, pre=False, post=False),
+    'STP_PRE': _pair(load=False, pre=True, post=False),
+    'LDP_PRE': _pair(load=True, pre=True, post=False),
+    'STP_POST': _pair(load=False, pre=False, post=True),
+    'LDP_POST': _pair(load=True, pre=False, post=True),
+    'BCOND': _bcond,
+    'CBZ': _cbz,
+    'CBNZ': _cbnz,
+    'SUBS': _subs,
+    'SUBSI': _subsi,
+    'CSINC': _csinc,
+}
+
+# indexed by the op column
+FACTORIES = [SEMANTICS[name] for name, _, _ in OPS]
+
+
+class ICache(dict):
+    # pc -> handler, aligned words are predecoded up front, anything else (code after .ascii) on first fetch
+    def __init__(self, m: 'Emulator'):
+        super().__init__()
+        self.m = m
+
+    def fill(self, pcs: range):
+        n = len(pcs)
+        cols = [c.tolist() for c in decode_columns(bytes(self.m.mem[pcs.start:pcs.start + 4 * n]))]
+        for pc, op, rd, rn, rm, imm in zip(pcs, *cols):
+            self[pc] = self.m.handler(pc, op, rd, rn, rm, imm)
+
+    def __missing__(self, pc: int) -> Handler:
+        if not 0 <= pc <= self.m.text - 4: raise EmulatorError(f'pc 0x{pc:x} outside of __text')
+        self.fill(range(pc, pc + 4))
+        return self[pc]
+
+
+class Emulator:
+    def __init__(self, text: bytes | bytearray, entry: int = 0, stack: int = 1 << 16, profile: bool = False,
+                 symbols: dict[str, int] | None = None):
+        # __text at address 0, followed by the stack
+        self.text = len(text)
+        self.image = bytes(text)
+        self.stack = stack
+        self.entry = entry
+        self.symbols = symbols or {}
+
+        # per pc execution counts, only kept when profiling
+        self.profile = profile
+
+        self.mem = bytearray()
+        self._reset()
+
+        # handlers hold on to mem, so the cache lives as long as the image does
+        self.icache = ICache(self)
+        self.icache.fill(range(0, self.text - self.text % 4, 4))
+
+    @classmethod
+    def from_object(cls, buf: bytes, entry: str = '_start', **kwargs) -> 'Emulator':
+        o = read_object(buf)
+        symbols = {s: x.n_value - o.addr for s, x in o.symbols if x.n_type & N_TYPE == N_SECT}
+        if entry not in symbols: raise EmulatorError(f'entry point {entry} undefined')
+        # the object is the whole program: its relocations resolve against its own symbols, __text at address 0
+        text = bytearray(o.text)
+        ext = {s: x.n_value - o.addr for s, x in o.symbols if x.n_type & N_TYPE == N_SECT and x.n_type & N_EXT}
+        errors = relocate(text, [o], [0], ext, ['object'], 0)
+        if errors: raise EmulatorError('\n'.join(errors))
+        return cls(text, symbols[entry], symbols=symbols, **kwargs)
+
+    def _reset(self):
+        # mem is updated in place, handlers keep a reference to it
+        size = (self.text + 15 & ~15) + self.stack
+        self.mem[:] = bytes(size)
+        self.mem[:self.text] = self.image
+        self.x = [0] * (FLAGS + 1)
+        self.x[SP] = size
+        self.x[30] = HALT
+        self.out: dict[int, bytearray] = {}
+        self.status: int | None = None
+        self.retired = 0
+        self.hist: Counter[int] = Counter()
+
+    def handler(self, pc: int, op: int, rd: int, rn: int, rm: int, imm: int) -> Handler:
+        if op < 0:
+            w = WORD.unpack_from(self.mem, pc)[0]
+            def undefined(x, pc):
+                raise EmulatorError(f'.text+0x{pc:x}: undefined instruction 0x{w:08x}')
+            return undefined
+        return FACTORIES[op](self, rd, rn, rm, imm)
+
+    def syscall(self, x: list[int], pc: int) -> int:
+        if x[16] == SYS_EXIT:
+            self.status = x[0] & 0xFF
+            return HALT
+        if x[16] == SYS_WRITE:
+            n = x[2]
+            self.out.setdefault(x[0], bytearray()).extend(self.mem[x[1]:x[1] + n])
+            x[0] = n
+            return pc + 4
+        raise EmulatorError(f'.text+0x{pc:x}: unsupported syscall {x[16]}')
+
+    def run(self, *args: int, limit: int = 10 ** 8) -> int:
+        # runs from the entry point until it returns or exits, returns the exit status
+        self._reset()
+        for i, v in enumerate(args): self.x[i] = v & MASK
+
+        code, x, pc, n = self.icache, self.x, self.entry, 0
+        try:
+            if self.profile:
+                hist = self.hist
+                for n in range(limit):
+                    if pc == HALT: break
+                    hist[pc] += 1
+                    pc = code[pc](x, pc)
+                else: raise EmulatorError(f'no exit after {limit} instructions')
+            else:
+                for n in range(limit):
+                    if pc == HALT: break
+                    pc = code[pc](x, pc)
+                else: raise EmulatorError(f'no exit after {limit} instructions')
+        except struct.error as e:
+            raise EmulatorError(f'.text+0x{pc:x}: bad memory access') from e
+
+        self.retired = n
+        if self.status is None: self.status = x[0] & 0xFF
+        return self.status
+
+    @property
+    def stdout(self) -> bytes:
+        return bytes(self.out.get(1, b''))
+
+    def where(self, pc: int) -> str:
+        # nearest symbol at or before pc
+        best = max(((v, s) for s, v in self.symbols.items() if v <= pc), default=None)
+        return f'{best[1]}+0x{pc - best[0]:x}' if best else f'.text+0x{pc:x}'
+
+    def report(self, top: int = 10) -> list[str]:
+        res = [f'{self.retired} instructions retired, exit status {self.status}']
+        for pc, n in self.hist.most_common(top):
+            ins = decode(WORD.unpack_from(self.mem, pc)[0])
+            res.append(f'{n:>10} {100 * n / max(self.retired, 1):5.1f}%  {self.where(pc):<24} {ins}')
+        return res
+
+
+def load(path: str, profile: bool = False) -> Emulator:
+    # .c, .s or .o -> emulator for its _start
+    # pylint: disable=import-outside-toplevel
+    if path.endswith('.o'):
+        with open(path, 'rb') as fp: return Emulator.from_object(fp.read(), profile=profile)
+    if path.endswith('.s'):
+        from minicompiler.assembler.tokenizer import tokenize
+        from minicompiler.assembler.main import Assembler
+        with mapped(path) as s: return Emulator.from_object(Assembler(tokenize(s)).assemble(), profile=profile)
+    from minicompiler.pipeline import build
+    with mapped(path) as s: return Emulator.from_object(build(s), profile=profile)
+
+
+if __name__ == '__main__':
+    '''
+    run generated code without an arm64 Mac
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('src', help='.c, .s or .o')
+    ap.add_argument('-p', dest='top', type=int, default=0, help='print the N hottest instructions')
+    args = ap.parse_args()
+
+    em = load(args.src, profile=bool(args.top))
+    status = em.run()
+    sys.stdout.buffer.write(em.stdout)
+    sys.stdout.flush()
+    if args.top: print('\n'.join(em.report(args.top)), file=sys.stderr)
+    sys.exit(status)
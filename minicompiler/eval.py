@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
+import os
+import sys
 import subprocess
-import random
 from minicompiler.compiler.main import compile  # pylint: disable=redefined-builtin
 from minicompiler.assembler.tokenizer import tokenize
 from minicompiler.assembler.main import Assembler
-
-random.seed(1331)
+from minicompiler.assembler.peephole import optimize, size
+from minicompiler.linker.main import link
+from minicompiler.emulator.main import Emulator
 
 
 def run_asserting_success(cmd: list[str], rcode: int = 0):
@@ -17,7 +19,6 @@ def run_asserting_success(cmd: list[str], rcode: int = 0):
 if __name__ == '__main__':
 
     # static metadata
-    obj_file = 'tmp.o'
     bin_file = 'out'
 
     print('*' * 80)
@@ -35,22 +36,37 @@ if __name__ == '__main__':
     print('*' * 80)
 
     # C program -> ARM assembly IR (compilation)
-    asm = compile(s, verbose=True)
+    asm = compile(s, verbose=True, opt=1)
     print(asm)
     print('*' * 80)
 
-    # TODO: condense tokenization + parsing (two steps below)
+    # (minicompiler/pipeline.py goes straight from IR to tokens, the text is shown here for reference)
     # ASM assembly -> ASM tokens
     tokens = tokenize(asm)
     for x in tokens: print(x)
     print('*' * 80)
 
+    # ASM tokens -> ASM tokens (peephole)
+    n = size(tokens)
+    tokens, hits = optimize(tokens)
+    for x in tokens: print(x)
+    print(f'{dict(hits)}, __text {n} -> {size(tokens)} bytes')
+    print('*' * 80)
+
     # ASM tokens -> binary
-    Assembler(tokens).dump(obj_file)
+    o = Assembler(tokens).assemble()
+
+    # binary -> emulated run, works anywhere
+    em = Emulator.from_object(o, profile=True)
+    assert em.run() == 7, f'ERROR! exit status {em.status}'
+    print('\n'.join(em.report()))
+    print('*' * 80)
 
-    # Assertions.
-    cmd = ["ld", "-o", bin_file, obj_file, "-platform_version", "macos", "14.0", "11.0", "-arch", "arm64", "-e", "_start"]
-    run_asserting_success(cmd, 0)
+    # binary -> executable (in process, no system ld)
+    with open(bin_file, 'wb') as fp: fp.write(link([o], name=bin_file))
+    os.chmod(bin_file, 0o755)
 
-    cmd = [f"./{bin_file}"]
-    run_asserting_success(cmd, 7)
+    # Assertions (native, arm64 macOS only).
+    if sys.platform == 'darwin':
+        cmd = [f"./{bin_file}"]
+        run_asserting_success(cmd, 7)
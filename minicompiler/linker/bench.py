@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import time
+import argparse
+from minicompiler.pipeline import build
+from minicompiler.linker.main import link
+
+
+def objects(n: int, size: int = 8) -> list[bytes]:
+    # _start plus n - 1 objects of size functions each, all names distinct
+    res = [build('int _start() { return 0; }')]
+    for i in range(1, n):
+        res.append(build('\n'.join(f'int f{i}_{j}() {{ int x = {j}; return x * {i}; }}' for j in range(size))))
+    return res
+
+
+if __name__ == '__main__':
+    '''
+    link time against object count
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('counts', nargs='*', type=int, default=[1, 10, 100, 1000])
+    ap.add_argument('-n', dest='size', type=int, default=8, help='functions per object')
+    ap.add_argument('-r', dest='repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    pool = objects(max(args.counts), args.size)
+
+    print(f'{"objects":>8} {"bytes in":>10} {"bytes out":>10} {"ms":>8} {"us/object":>10} {"MB/s":>8}')
+    for n in args.counts:
+        objs = pool[:n]
+        best = float('inf')
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            exe = link(objs)
+            best = min(best, time.perf_counter() - t)
+        size = sum(map(len, objs))
+        print(f'{n:>8} {size:>10} {len(exe):>10} {1e3 * best:>8.2f} {1e6 * best / n:>10.1f} {size / best / 1e6:>8.1f}')
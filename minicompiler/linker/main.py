@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+import os
+import struct
+import hashlib
+import argparse
+from dataclasses import dataclass
+from minicompiler.assembler.macho import Header, Segment, Section, SymtabCmd, DysymtabCmd, BuildCmd, Nlist64, RelocInfo
+from minicompiler.assembler.macho import DylinkerCmd, DylibCmd, EntryPointCmd, LinkeditDataCmd, Component, parse_reloc_info
+from minicompiler.assembler.macho import MH_MAGIC_64, CPU_TYPE_ARM64, CPU_SUBTYPE_ARM64_ALL, MH_OBJECT, MH_EXECUTE
+from minicompiler.assembler.macho import MH_NOUNDEFS, MH_DYLDLINK, MH_TWOLEVEL, MH_PIE, LC_SEGMENT_64, LC_SYMTAB
+from minicompiler.assembler.macho import VM_PROT_NONE, VM_PROT_READ, VM_PROT_EXECUTE, N_TYPE, N_SECT, N_EXT
+from minicompiler.assembler.macho import S_REGULAR, S_ATTR_PURE_INSTRUCTIONS, S_ATTR_SOME_INSTRUCTIONS
+from minicompiler.assembler.macho import ARM64_RELOC_BRANCH26, ARM64_RELOC_PAGE21, ARM64_RELOC_PAGEOFF12, ARM64_RELOC_ADDEND
+
+
+PAGE = 0x4000         # arm64 page size, segments start on a page
+BASE = 0x100000000    # __TEXT vmaddr, everything below is __PAGEZERO
+DYLD = '/usr/lib/dyld'
+LIBSYSTEM = '/usr/lib/libSystem.B.dylib'
+
+# ad-hoc code signature (arm64 won't run unsigned code), big-endian blobs hashing 4K pages
+CS_PAGE = 12
+CSMAGIC_EMBEDDED_SIGNATURE = 0xfade0cc0
+CSMAGIC_CODEDIRECTORY = 0xfade0c02
+CS_ADHOC = 0x2
+CS_LINKER_SIGNED = 0x20000
+CS_HASHTYPE_SHA256 = 2
+CS_EXECSEG_MAIN_BINARY = 0x1
+CODEDIRECTORY = struct.Struct('>9I4B4IQ3Q')
+
+
+class LinkerError(Exception): pass
+
+
+@dataclass(slots=True)
+class ObjectFile:
+    # what the linker needs out of one MH_OBJECT
+    text: bytes
+    addr: int
+    align: int
+    symbols: list[tuple[str, Nlist64]]
+    relocs: list[RelocInfo]
+
+
+def _align(x: int, n: int) -> int:
+    return (x + n - 1) & -n
+
+
+def _cstr(buf: bytes, i: int) -> str:
+    j = buf.find(b'\0', i)
+    return buf[i:j if j >= 0 else len(buf)].decode()
+
+
+def _padded(s: str, cmdsize: int) -> bytes:
+    # NUL terminated string after a load command, padded so the whole command is a multiple of 8 bytes
+    b = s.encode() + b'\0'
+    return b.ljust(_align(cmdsize + len(b), 8) - cmdsize, b'\0')
+
+
+def read_object(buf: bytes, name: str = '') -> ObjectFile:
+    h = Header.unpack_from(buf)
+    if h.magic != MH_MAGIC_64 or h.cputype != CPU_TYPE_ARM64 or h.filetype != MH_OBJECT:
+        raise LinkerError(f'{name}: not an arm64 Mach-O object')
+
+    text, addr, align, symbols, relocs = b'', 0, 0, [], []
+    off = h.bsize()
+    for _ in range(h.ncmds):
+        cmd, size = struct.unpack_from('<II', buf, off)
+        if cmd == LC_SEGMENT_64:
+            seg = Segment.unpack_from(buf, off)
+            for sec in Section.unpack_array(buf[off + seg.bsize():off + seg.bsize() + seg.nsects * Section.SIZE]):
+                if (sec.segname, sec.sectname) != ('__TEXT', '__text'):
+                    if sec.size: raise LinkerError(f'{name}: unsupported section {sec.segname},{sec.sectname}')
+                    continue
+                text = buf[sec.offset:sec.offset + sec.size]
+                addr, align = sec.addr, sec.align
+                relocs = RelocInfo.unpack_array(buf[sec.reloff:sec.reloff + sec.nreloc * RelocInfo.SIZE])
+        elif cmd == LC_SYMTAB:
+            st = SymtabCmd.unpack_from(buf, off)
+            strtab = buf[st.stroff:st.stroff + st.strsize]
+            nlist = Nlist64.unpack_array(buf[st.symoff:st.symoff + st.nsyms * Nlist64.SIZE])
+            symbols = [(_cstr(strtab, x.n_strx), x) for x in nlist]
+        off += size
+
+    return ObjectFile(text, addr, align, symbols, relocs)
+
+
+# ***************************** relocations *****************************
+
+
+def _patch(ins: int, kind: int, pc: int, target: int) -> int:
+    # instruction word with the target's address (or the part of it the instruction holds) filled in
+    if kind == ARM64_RELOC_BRANCH26:
+        d = target - pc
+        if d & 0x3 or not -(1 << 27) <= d < 1 << 27: raise LinkerError(f'branch offset {d} out of range')
+        return ins & 0xFC000000 | (d >> 2) & 0x3FFFFFF
+    if kind == ARM64_RELOC_PAGE21:
+        d = (target >> 12) - (pc >> 12)
+        if not -(1 << 20) <= d < 1 << 20: raise LinkerError(f'page offset {d} out of range')
+        return ins & 0x9F00001F | (d & 0x3) << 29 | ((d >> 2) & 0x7FFFF) << 5
+    if kind == ARM64_RELOC_PAGEOFF12:
+        off = target & 0xFFF
+        # loads and stores scale the offset by the access size
+        if ins & 0x3B000000 == 0x39000000:
+            scale = ins >> 30
+            if off & ((1 << scale) - 1): raise LinkerError(f'unaligned page offset 0x{off:x}')
+            off >>= scale
+        return ins & 0xFFC003FF | off << 10
+    raise LinkerError(f'unsupported relocation type {kind}')
+
+
+def relocate(text: bytearray, objs: list[ObjectFile], bases: list[int], ext: dict[str, int], names: list[str], addr: int) -> list[str]:
+    # patches every object's relocations into the merged __text loaded at addr, returns what couldn't be resolved
+    errors = []
+    for o, b, n in zip(objs, bases, names):
+        addend = 0
+        for r in o.relocs:
+            symnum, _, _, extern, kind = parse_reloc_info(r)
+            if kind == ARM64_RELOC_ADDEND:
+                addend = symnum - (1 << 24) if symnum >> 23 else symnum
+                continue
+            at = b + r.r_address
+            if not extern:
+                errors.append(f'{n}: .text+0x{r.r_address:x}: section relocations are not supported')
+                continue
+            s, x = o.symbols[symnum]
+            if x.n_type & N_TYPE == N_SECT and not x.n_type & N_EXT: target = b + x.n_value - o.addr
+            elif s in ext: target = ext[s]
+            else:
+                errors.append(f'{n}: .text+0x{r.r_address:x}: undefined symbol {s}')
+                continue
+            ins, = struct.unpack_from('<I', text, at)
+            try: struct.pack_into('<I', text, at, _patch(ins, kind, addr + at, addr + target + addend))
+            except LinkerError as e: errors.append(f'{n}: .text+0x{r.r_address:x}: {s}: {e}')
+            addend = 0
+    return errors
+
+
+class Linker:
+    def __init__(self, objects: list[bytes], entry: str = '_start', name: str = 'a.out', names: list[str] | None = None):
+        # input, object file bytes (names are only used in error messages)
+        self.objects = objects
+        self.names = names or [f'#{i}' for i in range(len(objects))]
+        self.entry = entry
+        self.name = name
+
+    def _load_commands(self, text_off: int, text_size: int, align: int, linkedit: tuple[int, int], symtab: tuple[int, int, int, int],
+                       nlocal: int, nextdef: int, entryoff: int, signature: tuple[int, int]) -> list[tuple[Component, bytes]]:
+        # (command, trailing bytes) in file order
+        text_vmsize = _align(text_off + text_size, PAGE)
+        text = Segment(cmdsize=Segment.SIZE + Section.SIZE, segname='__TEXT', vmaddr=BASE, vmsize=text_vmsize, fileoff=0,
+                       filesize=text_vmsize, maxprot=VM_PROT_READ | VM_PROT_EXECUTE, initprot=VM_PROT_READ | VM_PROT_EXECUTE, nsects=1)
+        sect = Section(sectname='__text', segname='__TEXT', addr=BASE + text_off, size=text_size, offset=text_off, align=align,
+                       flags=S_REGULAR | S_ATTR_PURE_INSTRUCTIONS | S_ATTR_SOME_INSTRUCTIONS)
+        symoff, nsyms, stroff, strsize = symtab
+        dyld, libsystem = _padded(DYLD, DylinkerCmd.SIZE), _padded(LIBSYSTEM, DylibCmd.SIZE)
+        return [
+            (Segment(cmdsize=Segment.SIZE, segname='__PAGEZERO', vmsize=BASE, maxprot=VM_PROT_NONE, initprot=VM_PROT_NONE), b''),
+            (text, sect.pack()),
+            (Segment(cmdsize=Segment.SIZE, segname='__LINKEDIT', vmaddr=BASE + text_vmsize, vmsize=_align(linkedit[1], PAGE),
+                     fileoff=linkedit[0], filesize=linkedit[1], maxprot=VM_PROT_READ, initprot=VM_PROT_READ), b''),
+            (SymtabCmd(cmdsize=SymtabCmd.SIZE, symoff=symoff, nsyms=nsyms, stroff=stroff, strsize=strsize), b''),
+            (DysymtabCmd(cmdsize=DysymtabCmd.SIZE, nlocalsym=nlocal, iextdefsym=nlocal, nextdefsym=nextdef, iundefsym=nsyms), b''),
+            (DylinkerCmd(cmdsize=DylinkerCmd.SIZE + len(dyld)), dyld),
+            (EntryPointCmd(entryoff=entryoff), b''),
+            (DylibCmd(cmdsize=DylibCmd.SIZE + len(libsystem)), libsystem),
+            (BuildCmd(cmdsize=BuildCmd.SIZE, platform=0x1, minos=0xe0000, sdk=0xb0000), b''),
+            (LinkeditDataCmd(dataoff=signature[0], datasize=signature[1]), b''),
+        ]
+
+    def _signature_size(self, limit: int) -> int:
+        # superblob + one index entry + code directory + identifier + one hash per page
+        return 12 + 8 + CODEDIRECTORY.size + len(self.name.encode()) + 1 + 32 * (-(-limit >> CS_PAGE))
+
+    def _sign(self, buf: bytearray, offset: int, text_limit: int):
+        # ad-hoc signature over everything before offset, written at offset
+        ident = self.name.encode() + b'\0'
+        npages = -(-offset >> CS_PAGE)
+        size = CODEDIRECTORY.size + len(ident) + 32 * npages
+        cd = CODEDIRECTORY.pack(
+            CSMAGIC_CODEDIRECTORY, size, 0x20400, CS_ADHOC | CS_LINKER_SIGNED,
+            CODEDIRECTORY.size + len(ident), CODEDIRECTORY.size, 0, npages, offset,
+            32, CS_HASHTYPE_SHA256, 0, CS_PAGE, 0, 0, 0, 0,
+            0, 0, text_limit, CS_EXECSEG_MAIN_BINARY,
+        )
+        view = memoryview(buf)
+        hashes = b''.join(hashlib.sha256(view[i:min(i + (1 << CS_PAGE), offset)]).digest() for i in range(0, offset, 1 << CS_PAGE))
+        blob = struct.pack('>III', CSMAGIC_EMBEDDED_SIGNATURE, 20 + size, 1) + struct.pack('>II', 0, 20) + cd + ident + hashes
+        buf[offset:offset + len(blob)] = blob
+
+    def link(self) -> bytes:
+        objs = [read_object(x, n) for x, n in zip(self.objects, self.names)]
+
+        # **************************** layout ****************************
+        # load commands don't depend on the input, so their size is known up front
+        hdr = Header.SIZE + sum(c.bsize() + len(t) for c, t in self._load_commands(0, 0, 0, (0, 0), (0, 0, 0, 0), 0, 0, 0, (0, 0)))
+
+        # __text sections back to back, each at its own alignment
+        align = max((o.align for o in objs), default=2)
+        text_off = _align(hdr, max(16, 1 << align))
+        bases, lc = [], 0
+        for o in objs:
+            lc = _align(lc, 1 << o.align)
+            bases.append(lc)
+            lc += len(o.text)
+        text = bytearray(lc)
+        for o, b in zip(objs, bases): text[b:b + len(o.text)] = o.text
+
+        # **************************** symbols ****************************
+        # section relative addresses in each object -> offsets in the merged __text
+        local: list[tuple[str, int]] = []
+        ext: dict[str, int] = {}
+        owner: dict[str, str] = {}
+        for o, b, n in zip(objs, bases, self.names):
+            for s, x in o.symbols:
+                if x.n_type & N_TYPE != N_SECT: continue
+                off = b + x.n_value - o.addr
+                if not x.n_type & N_EXT:
+                    local.append((s, off))
+                    continue
+                if s in ext: raise LinkerError(f'duplicate symbol {s} in {owner[s]} and {n}')
+                ext[s] = off
+                owner[s] = n
+
+        if self.entry not in ext: raise LinkerError(f'entry point {self.entry} undefined')
+
+        # **************************** relocations ****************************
+        errors = relocate(text, objs, bases, ext, self.names, BASE + text_off)
+        if errors: raise LinkerError('\n'.join(errors))
+
+        # **************************** __LINKEDIT ****************************
+        syms = local + list(ext.items())
+        strtab, strx = bytearray(b'\0'), []
+        for s, _ in syms:
+            strx.append(len(strtab))
+            strtab += s.encode() + b'\0'
+        strtab += bytes(_align(len(strtab), 8) - len(strtab))
+
+        linkedit_off = _align(text_off + len(text), PAGE)
+        symoff = linkedit_off
+        stroff = symoff + len(syms) * Nlist64.SIZE
+        sigoff = _align(stroff + len(strtab), 16)
+        sigsize = self._signature_size(sigoff)
+        end = sigoff + sigsize
+
+        # **************************** write ****************************
+        buf = bytearray(end)
+        cmds = self._load_commands(text_off, len(text), align, (linkedit_off, end - linkedit_off), (symoff, len(syms), stroff, len(strtab)),
+                                   len(local), len(ext), text_off + ext[self.entry], (sigoff, sigsize))
+        Header(MH_MAGIC_64, CPU_TYPE_ARM64, CPU_SUBTYPE_ARM64_ALL, MH_EXECUTE, len(cmds), hdr - Header.SIZE,
+               MH_NOUNDEFS | MH_DYLDLINK | MH_TWOLEVEL | MH_PIE).pack_into(buf, 0)
+        off = Header.SIZE
+        for c, t in cmds:
+            c.pack_into(buf, off)
+            buf[off + c.bsize():off + c.bsize() + len(t)] = t
+            off += c.bsize() + len(t)
+
+        buf[text_off:text_off + len(text)] = text
+        nlist = [Nlist64(i, N_SECT | (N_EXT if k >= len(local) else 0), 1, 0, BASE + text_off + x)
+                 for k, (i, (_, x)) in enumerate(zip(strx, syms))]
+        Nlist64.pack_array(nlist, buf, symoff)
+        buf[stroff:stroff + len(strtab)] = strtab
+
+        self._sign(buf, sigoff, linkedit_off)
+        return bytes(buf)
+
+
+def link(objects: list[bytes], entry: str = '_start', name: str = 'a.out') -> bytes:
+    return Linker(objects, entry, name).link()
+
+
+def link_files(paths: list[str], out: str, entry: str = '_start'):
+    objects = []
+    for p in paths:
+        with open(p, 'rb') as fp: objects.append(fp.read())
+    exe = Linker(objects, entry, os.path.basename(out), paths).link()
+    with open(out, 'wb') as fp: fp.write(exe)
+    os.chmod(out, 0o755)
+
+
+if __name__ == '__main__':
+    '''
+    Mach-O objects -> Mach-O executable (no system ld)
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('objects', nargs='+')
+    ap.add_argument('-o', dest='out', default='a.out')
+    ap.add_argument('-e', dest='entry', default='_start')
+    args = ap.parse_args()
+
+    link_files(args.objects, args.out, args.entry)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import argparse
+from typing import TextIO
+from minicompiler.compiler.main import lower
+from minicompiler.compiler.codegen import gen_tokens
+from minicompiler.assembler.main import Assembler, AssemblerError
+from minicompiler.assembler.peephole import optimize
+from minicompiler.cache import Cache, MAX_BYTES, CACHE_DIR
+from minicompiler.linker.main import link
+from minicompiler.stats import Stats, stage, add_arguments, from_args, report
+from minicompiler.source import Text, mapped
+
+
+def check(tokens: list, text: bytes | bytearray):
+    # disassemble __text and compare against the tokens it came from (needs numpy)
+    from minicompiler.assembler.disasm import verify_text  # pylint: disable=import-outside-toplevel
+    bad = verify_text(tokens, text)
+    if len(bad): raise AssemblerError(f'{len(bad)} instructions do not round-trip, first at instruction {bad[0]}')
+
+
+def build(s: Text, opt: int = 1, asm: TextIO | None = None, peephole: bool = False, verbose: bool = False, verify: bool = False,
+          cache: Cache | None = None, stats: Stats | None = None) -> bytes:
+    # C source -> Mach-O object in memory, assembly text is only produced if asm is given
+    key = cache.key(s, opt=opt, peephole=peephole) if cache else ''
+    if cache and not verbose:
+        o = cache.get(key, 'o')
+        text = cache.get(key, 's', count=False) if o is not None and asm else None
+        if o is not None and (asm is None or text is not None):
+            if asm and text is not None: asm.write(text.decode())
+            return o
+
+    # the text is kept for the cache only when it was asked for
+    sink = io.StringIO() if cache and asm else asm
+    ir = lower(s, verbose, opt, stats)
+    with stage(stats, 'codegen'): tokens = gen_tokens(ir, sink, stats)
+    if peephole:
+        with stage(stats, 'peephole'): tokens, _ = optimize(tokens)
+    a = Assembler(tokens)
+    o = a.assemble(stats)
+    if verify:
+        with stage(stats, 'verify'): check(tokens, a.dat)
+
+    if cache:
+        cache.put(key, 'o', o)
+        if asm and isinstance(sink, io.StringIO):
+            asm.write(sink.getvalue())
+            cache.put(key, 's', sink.getvalue().encode())
+    return o
+
+
+def build_file(src: str, out: str, opt: int = 1, asm: TextIO | None = None, peephole: bool = False, verify: bool = False,
+               cache: Cache | None = None, exe: bool = False, stats: Stats | None = None):
+    with mapped(src) as s: o = build(s, opt, asm, peephole, verify=verify, cache=cache, stats=stats)
+    # linked in memory, the object never touches the disk
+    if exe:
+        with stage(stats, 'link'): o = link([o], name=os.path.basename(out))
+    with stage(stats, 'write'):
+        with open(out, 'wb') as fp: fp.write(o)
+    if stats: stats.count('bytes_written', len(o))
+    if exe: os.chmod(out, 0o755)
+
+
+if __name__ == '__main__':
+    '''
+    str -> Mach-O object (or executable), without the assembly text round trip
+    '''
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('src')
+    ap.add_argument('out')
+    ap.add_argument('-O', dest='opt', type=int, default=1)
+    ap.add_argument('-S', dest='asm', default=None, help='also write the assembly text here')
+    ap.add_argument('-P', dest='peephole', action='store_true', help='run the peephole optimizer')
+    ap.add_argument('-x', dest='exe', action='store_true', help='link and write an executable instead of an object')
+    ap.add_argument('-V', dest='verify', action='store_true', help='disassemble the output and check it round-trips')
+    ap.add_argument('--cache', nargs='?', const=CACHE_DIR, default=None, help='reuse artifacts from this directory')
+    ap.add_argument('--cache-size', type=int, default=MAX_BYTES, help='cache size cap in bytes')
+    add_arguments(ap)
+    args = ap.parse_args()
+
+    c = Cache(args.cache, args.cache_size) if args.cache else None
+    st = from_args(args)
+
+    if args.asm:
+        with open(args.asm, 'w') as fp: build_file(args.src, args.out, args.opt, fp, args.peephole, args.verify, c, args.exe, st)
+    else:
+        build_file(args.src, args.out, args.opt, peephole=args.peephole, verify=args.verify, cache=c, exe=args.exe, stats=st)
+
+    if c: print(c.stats, file=sys.stderr)
+    report(st, args)
@@ -0,0 +1,20 @@
+import os
+import mmap
+from contextlib import contextmanager
+from typing import Iterator
+
+
+# what the lexers take: a str, or utf-8 bytes (usually a mapped file)
+Text = str | bytes | mmap.mmap
+
+
+@contextmanager
+def mapped(path: str) -> Iterator[bytes | mmap.mmap]:
+    # read-only view of a file without copying it into memory, only valid inside the with block
+    with open(path, 'rb') as fp:
+        # empty files can't be mapped
+        if os.fstat(fp.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
@@ -0,0 +1,120 @@
+import sys
+import json
+import time
+import cProfile
+import argparse
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, asdict
+from typing import ContextManager, Iterator
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    time: float = 0.0
+    # bytes allocated above the level at stage entry, at the highest point (only with memory=True)
+    peak: int = 0
+
+
+class Stats:
+    def __init__(self, memory: bool = False, profile: str | None = None):
+        # stage -> totals over every time it ran, counters are free form
+        self.stages: dict[str, StageStats] = {}
+        self.counters: Counter[str] = Counter()
+
+        # tracemalloc slows everything down a lot, so it's opt-in
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing(): tracemalloc.start()
+
+        # one stage can run under cProfile, calls accumulate across runs
+        self.profile = profile
+        self.profiler: cProfile.Profile | None = cProfile.Profile() if profile else None
+
+        # (memory at entry, highest absolute peak seen inside) per open stage
+        self._open: list[list[int]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        s = self.stages.setdefault(name, StageStats())
+        if self.memory:
+            cur, peak = tracemalloc.get_traced_memory()
+            if self._open: self._open[-1][1] = max(self._open[-1][1], peak)
+            self._open.append([cur, cur])
+            tracemalloc.reset_peak()
+        prof = self.profiler if name == self.profile else None
+
+        t = time.perf_counter()
+        if prof: prof.enable()
+        try:
+            yield
+        finally:
+            if prof: prof.disable()
+            s.time += time.perf_counter() - t
+            s.calls += 1
+            if self.memory:
+                start, inner = self._open.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], inner)
+                s.peak = max(s.peak, peak - start)
+                # the enclosing stage's peak includes this one
+                if self._open: self._open[-1][1] = max(self._open[-1][1], peak)
+                tracemalloc.reset_peak()
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def close(self):
+        if self.memory and tracemalloc.is_tracing(): tracemalloc.stop()
+
+    def to_dict(self) -> dict:
+        return {
+            'stages': {k: asdict(v) for k, v in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def to_json(self, indent: int | None = 2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def dump(self, path: str):
+        with open(path, 'w') as fp: fp.write(self.to_json() + '\n')
+
+    def dump_profile(self, path: str):
+        # pstats / snakeviz readable
+        if self.profiler: self.profiler.dump_stats(path)
+
+    def __str__(self):
+        lines = [f'{"stage":<16} {"calls":>6} {"ms":>10} {"peak KiB":>10}']
+        for k, v in self.stages.items():
+            peak = f'{v.peak / 1024:10.1f}' if self.memory else f'{"-":>10}'
+            lines.append(f'{k:<16} {v.calls:>6} {1e3 * v.time:>10.2f} {peak}')
+        lines += [f'{k:<16} {v:>17}' for k, v in self.counters.items()]
+        return '\n'.join(lines)
+
+
+def stage(stats: Stats | None, name: str) -> ContextManager:
+    # timing scope that does nothing without a Stats
+    return stats.stage(name) if stats else nullcontext()
+
+
+# ***************************** command line *****************************
+
+
+def add_arguments(ap: argparse.ArgumentParser):
+    ap.add_argument('--stats', nargs='?', const='-', default=None, help='per-stage times and counters, as JSON if a file is given')
+    ap.add_argument('--mem', action='store_true', help='also record peak allocation per stage (slow)')
+    ap.add_argument('--profile', default=None, metavar='STAGE', help='run this stage under cProfile')
+    ap.add_argument('--profile-out', default=None, help='cProfile output (default: STAGE.prof)')
+
+
+def from_args(args: argparse.Namespace) -> Stats | None:
+    if not (args.stats or args.mem or args.profile): return None
+    return Stats(memory=args.mem, profile=args.profile)
+
+
+def report(stats: Stats | None, args: argparse.Namespace):
+    if stats is None: return
+    stats.close()
+    if args.stats in (None, '-'): print(stats, file=sys.stderr)
+    else: stats.dump(args.stats)
+    if args.profile: stats.dump_profile(args.profile_out or f'{args.profile}.prof')
@@ -0,0 +1,104 @@
+import random
+from minicompiler.compiler.passes import wrap, sdiv
+
+
+# random programs (calls, assignments, loops, comparisons) against a reference evaluator built alongside the source
+
+ARITH = {'+': lambda a, b: wrap(a + b), '-': lambda a, b: wrap(a - b), '*': lambda a, b: wrap(a * b), '/': sdiv}
+CMPS = {'<': lambda a, b: int(a < b), '<=': lambda a, b: int(a <= b), '>': lambda a, b: int(a > b),
+        '>=': lambda a, b: int(a >= b), '==': lambda a, b: int(a == b), '!=': lambda a, b: int(a != b)}
+
+
+
+class Gen:
+    # every piece is (source, env -> value) or (source, env -> None) for statements
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.fns: list[tuple[str, int, object]] = []
+        self.n = 0
+
+    def fresh(self, prefix: str) -> str:
+        self.n += 1
+        return f'{prefix}{self.n}'
+
+    def expr(self, names: list[str], depth: int = 0):
+        rng = self.rng
+        if depth > 2 or rng.random() < 0.3:
+            if names and rng.random() < 0.7:
+                n = rng.choice(names)
+                return n, lambda env: env[n]
+            v = rng.randint(0, 100)
+            return str(v), lambda env: v
+        k = rng.random()
+        if k < 0.1:
+            s, f = self.expr(names, depth + 1)
+            return f'-({s})', lambda env: wrap(-f(env))
+        if k < 0.2 and self.fns:
+            name, nparams, g = rng.choice(self.fns)
+            args = [self.expr(names, depth + 1) for _ in range(nparams)]
+            return f'{name}({", ".join(s for s, _ in args)})', lambda env: g(*[f(env) for _, f in args])
+        op = rng.choice(list(ARITH) * 2 + list(CMPS))
+        (a, fa), (b, fb) = self.expr(names, depth + 1), self.expr(names, depth + 1)
+        o = ARITH.get(op) or CMPS[op]
+        return f'({a} {op} {b})', lambda env: o(fa(env), fb(env))
+
+    def stmts(self, names: list[str], mutable: list[str], depth: int):
+        rng, out = self.rng, []
+        names, mutable = list(names), list(mutable)
+        for _ in range(rng.randint(1, 4)):
+            k = rng.random()
+            if k < 0.35:
+                n = self.fresh('t')
+                s, f = self.expr(names)
+                out.append((f'int {n} = {s};', lambda env, n=n, f=f: env.__setitem__(n, f(env))))
+                names.append(n)
+                mutable.append(n)
+            elif k < 0.75 and mutable:
+                n = rng.choice(mutable)
+                s, f = self.expr(names)
+                out.append((f'{n} = {s};', lambda env, n=n, f=f: env.__setitem__(n, f(env))))
+            elif depth < 2:
+                out.append(self.loop(names, mutable, depth + 1))
+        return out
+
+    def loop(self, names: list[str], mutable: list[str], depth: int):
+        # counted loops with constant bounds, short enough to unroll or not
+        rng = self.rng
+        i, lo, hi, step = self.fresh('i'), rng.randint(-3, 3), rng.randint(0, 24), rng.randint(1, 3)
+        body = self.stmts(names + [i], mutable, depth)
+        src, fs = '\n'.join(s for s, _ in body), [f for _, f in body]
+
+        def run(env):
+            env[i] = lo
+            while env[i] < hi:
+                for f in fs: f(env)
+                env[i] = wrap(env[i] + step)
+
+        if rng.random() < 0.5: head = f'for (int {i} = {lo}; {i} < {hi}; {i} = {i} + {step}) {{\n{src}\n}}'
+        else: head = f'int {i} = {lo};\nwhile ({i} < {hi}) {{\n{src}\n{i} = {i} + {step};\n}}'
+        return head, run
+
+    def function(self, name: str, nparams: int):
+        params = [f'p{k}' for k in range(nparams)]
+        body = self.stmts(params, params, 0 if self.rng.random() < 0.5 else 2)
+        ret, f = self.expr(params)
+        fs = [g for _, g in body]
+
+        def model(*args):
+            env = dict(zip(params, args))
+            for g in fs: g(env)
+            return f(env)
+
+        lines = '\n'.join(s for s, _ in body)
+        return f'int {name}({", ".join("int " + p for p in params)}) {{\n{lines}\nreturn {ret};\n}}', model
+
+    def program(self) -> tuple[str, int]:
+        srcs = []
+        for k in range(self.rng.randint(0, 3)):
+            nparams = self.rng.randint(0, 3)
+            s, m = self.function(f'f{k}', nparams)
+            srcs.append(s)
+            self.fns.append((f'f{k}', nparams, m))
+        s, m = self.function('_start', 0)
+        return '\n'.join(srcs + [s]), m()
+
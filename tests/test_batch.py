@@ -0,0 +1,27 @@
+import struct
+import random
+import numpy as np
+from minicompiler.assembler.batch import encode_tokens, sample
+from minicompiler.assembler.main import Assembler
+from minicompiler.compiler.codegen import gen_tokens
+from minicompiler.compiler.main import lower
+from tests.programs import Gen
+
+
+def scalar(tokens) -> bytes:
+    return b''.join(struct.pack('<I', x.decode(b=False)) for x in tokens)
+
+
+def test_batch_matches_scalar():
+    # every encoding form, random operands
+    tokens = sample(np.random.default_rng(0), 20_000)
+    assert encode_tokens(tokens) == scalar(tokens)
+
+
+def test_backends_build_the_same_object():
+    # compiled code, labels and relocations included
+    for seed in range(20):
+        src, _ = Gen(random.Random(seed)).program()
+        for opt in (0, 2):
+            tokens = gen_tokens(lower(src, opt=opt))
+            assert Assembler(tokens, backend='batch').assemble() == Assembler(tokens).assemble(), f'O{opt}\n{src}'
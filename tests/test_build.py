@@ -0,0 +1,24 @@
+from minicompiler.build import build_all
+from minicompiler.compiler.parser import ParseError
+
+
+def units(tmp_path, sources: dict[str, str]) -> list[str]:
+    paths = []
+    for name, src in sources.items():
+        (tmp_path / name).write_text(src)
+        paths.append(str(tmp_path / name))
+    return paths
+
+
+def test_bad_unit_among_good(tmp_path):
+    good = {f'u{k}.c': f'int f{k}() {{ return {k}; }}\n' for k in range(4)}
+    paths = units(tmp_path, good | {'bad.c': 'int _start() { return ; }\n'})
+    for jobs in (1, 4):
+        res, errors = build_all(paths, jobs=jobs)
+        assert sorted(res) == sorted(p for p in paths if not p.endswith('bad.c'))
+        assert list(errors) == [paths[-1]]
+        e = errors[paths[-1]]
+        assert isinstance(e, ParseError)
+        # the mapping is closed by now, the error keeps its own copy of the token text
+        assert (e.line, e.col, e.text) == (1, 23, ';')
+        assert str(e) == "1:23: unexpected token ';'"
@@ -0,0 +1,81 @@
+import io
+import os
+import pytest
+from minicompiler import cache
+from minicompiler.pipeline import build
+from minicompiler.cache import Cache, fingerprint
+
+
+SRC = 'int _start() { return 7; }'
+
+
+def test_key_misses(monkeypatch):
+    key = Cache.key(SRC, opt=1, peephole=False)
+    # mapped files hash the same as their text
+    assert Cache.key(SRC.encode(), opt=1, peephole=False) == key
+    assert Cache.key(SRC.replace('7', '8'), opt=1, peephole=False) != key
+    assert Cache.key(SRC, opt=2, peephole=False) != key
+    assert Cache.key(SRC, opt=1, peephole=True) != key
+    monkeypatch.setattr(cache, 'VERSION', cache.VERSION + 'x')
+    assert Cache.key(SRC, opt=1, peephole=False) != key
+
+
+def test_fingerprint(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.py').write_text('x = 1\n')
+    (tmp_path / 'sub' / 'b.py').write_text('y = 2\n')
+    (tmp_path / 'notes.txt').write_text('')
+    before = fingerprint(str(tmp_path))
+
+    # only python sources count
+    (tmp_path / 'notes.txt').write_text('changed')
+    assert fingerprint(str(tmp_path)) == before
+    (tmp_path / 'sub' / 'b.py').write_text('y = 3\n')
+    assert fingerprint(str(tmp_path)) != before
+
+
+def test_overwrite_size(tmp_path):
+    c = Cache(str(tmp_path), 1000)
+    c.put('ab' * 32, 'o', bytes(100))
+    c.put('ab' * 32, 'o', bytes(60))
+    assert c.size == 60 and c.stats.evictions == 0
+
+
+def test_lru_eviction(tmp_path):
+    c = Cache(str(tmp_path), 250)
+    a, b, d = 'aa' * 32, 'bb' * 32, 'dd' * 32
+    c.put(a, 'o', bytes(100))
+    c.put(b, 'o', bytes(100))
+    # a is older on disk, but reading it makes b the least recently used
+    os.utime(c._path(a, 'o'), (1, 1))
+    os.utime(c._path(b, 'o'), (2, 2))
+    assert c.get(a, 'o') == bytes(100)
+    c.put(d, 'o', bytes(100))
+    assert c.get(b, 'o') is None
+    assert c.get(a, 'o') is not None and c.get(d, 'o') is not None
+    assert c.stats.evictions == 1 and c.size == 200
+
+
+def test_put_is_atomic(tmp_path, monkeypatch):
+    c = Cache(str(tmp_path))
+    key = 'cc' * 32
+    c.put(key, 'o', b'old')
+
+    def fail(*_): raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError): c.put(key, 'o', b'new')
+    # the previous artifact is intact and no temp file is left behind
+    assert c.get(key, 'o') == b'old'
+    assert os.listdir(os.path.dirname(c._path(key, 'o'))) == [f'{key}.o']
+
+
+def test_one_lookup_per_build(tmp_path):
+    c = Cache(str(tmp_path))
+    build(SRC, cache=c)
+    # the object is there but the text isn't, the probe for the text is no extra lookup
+    asm = io.StringIO()
+    build(SRC, asm=asm, cache=c)
+    asm2 = io.StringIO()
+    build(SRC, asm=asm2, cache=c)
+    assert asm2.getvalue() == asm.getvalue() != ''
+    assert (c.stats.hits, c.stats.misses, c.stats.writes) == (2, 1, 3)
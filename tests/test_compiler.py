@@ -0,0 +1,38 @@
+import pytest
+from minicompiler.pipeline import build
+from minicompiler.emulator.main import Emulator
+from minicompiler.compiler.parser import ParseError
+
+
+def run(src: str, opt: int, peephole: bool = False) -> int:
+    # exit status of _start, run in the emulator
+    return Emulator.from_object(build(src, opt, peephole=peephole, verify=True)).run()
+
+
+# source -> exit status
+PROGRAMS = {
+    # inlined callees that read the variable they assign
+    'int f(int a, int b) { a = a * b; for (int i = 0; i < 2; i = i + 1) { a = a + b; } return a; }\n'
+    'int _start() { return f(3, 4); }': 20,
+    'int f(int a) { a = a; return a; }\nint _start() { return f(5); }': 5,
+}
+
+
+@pytest.mark.parametrize('opt', [0, 1, 2])
+@pytest.mark.parametrize('src', list(PROGRAMS))
+def test_programs(src: str, opt: int):
+    assert run(src, opt) == PROGRAMS[src]
+    assert run(src, opt, peephole=True) == PROGRAMS[src]
+
+
+# source -> parse error
+ERRORS = {
+    'int f() { return 1; }\nint g() { return 2 +': 'unexpected end of input',
+    'int _start() { return ; }': "1:23: unexpected token ';'",
+}
+
+
+@pytest.mark.parametrize('src', list(ERRORS))
+def test_parse_errors(src: str):
+    with pytest.raises(ParseError) as e: build(src)
+    assert str(e.value) == ERRORS[src]
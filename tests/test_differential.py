@@ -0,0 +1,19 @@
+import random
+import pytest
+from minicompiler.pipeline import build
+from minicompiler.emulator.main import Emulator
+from minicompiler.compiler.passes import wrap
+from tests.programs import Gen
+
+
+PROGRAMS = 200
+
+
+@pytest.mark.parametrize('seed', range(PROGRAMS))
+def test_differential(seed: int):
+    src, want = Gen(random.Random(seed)).program()
+    for opt in (0, 1, 2):
+        for peephole in (False, True):
+            em = Emulator.from_object(build(src, opt, peephole=peephole, verify=True))
+            em.run(limit=10 ** 7)
+            assert wrap(em.x[0]) == want, f'O{opt} peephole={peephole}\n{src}'
@@ -0,0 +1,23 @@
+import numpy as np
+from minicompiler.assembler.batch import sample
+from minicompiler.assembler.disasm import verify, disassemble, decode_columns
+from minicompiler.assembler.tokens import Directive
+from tests.test_batch import scalar
+
+
+def test_disassembly_round_trip():
+    tokens = sample(np.random.default_rng(1), 20_000)
+    text = scalar(tokens)
+    assert not len(verify(tokens, text))
+    assert [x.decode(b=False) for x in disassemble(text)] == [x.decode(b=False) for x in tokens]
+
+
+def test_bulk_matches_scalar():
+    # every condition of B.cond and CSINC Xd, XZR, XZR, then random words
+    conds = [0x54000000 | 5 << 5 | c for c in range(16)] + [0x9A9F07E0 | c << 12 | 3 for c in range(16)]
+    rand = np.random.default_rng(2).integers(0, 1 << 32, 100_000, dtype=np.uint64)
+    w = np.concatenate([np.array(conds, dtype=np.uint32), rand.astype(np.uint32)])
+    op = decode_columns(w)[0]
+    # words the disassembler doesn't know are undefined in the bulk decoder (and so in the emulator) too
+    assert [isinstance(x, Directive) for x in disassemble(w)] == list(op < 0)
+    assert (op[:32] < 0).tolist() == [c == 0xF for c in range(16)] + [c >= 0xE for c in range(16)]
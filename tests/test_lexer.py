@@ -0,0 +1,59 @@
+from minicompiler.compiler.lexer import lex
+from minicompiler.compiler.tokens import TokType
+from minicompiler.assembler.tokenizer import tokenize
+from minicompiler.source import mapped
+
+
+SRC = 'int x1 = 10;\n  return"a\nb" integer;\nfor whilex'
+
+
+def test_spans():
+    # (type, pos, end, line, col, text)
+    want = [
+        (TokType.INT, 0, 3, 1, 1, 'int'),
+        (TokType.IDENT, 4, 6, 1, 5, 'x1'),
+        (TokType.EQ, 7, 8, 1, 8, '='),
+        (TokType.NUM, 9, 11, 1, 10, '10'),
+        (TokType.SEMIC, 11, 12, 1, 12, ';'),
+        (TokType.ReturnStmt, 15, 21, 2, 3, 'return'),
+        # string literals may span lines, the next token is on the line the literal ends on
+        (TokType.STR, 21, 26, 2, 9, '"a\nb"'),
+        (TokType.IDENT, 27, 34, 3, 4, 'integer'),
+        (TokType.SEMIC, 34, 35, 3, 11, ';'),
+        (TokType.FOR, 36, 39, 4, 1, 'for'),
+        (TokType.IDENT, 40, 46, 4, 5, 'whilex'),
+    ]
+    assert [(x.type, x.pos, x.end, x.line, x.col, x.data) for x in lex(SRC)] == want
+
+
+def test_keywords():
+    # whole identifiers only, a keyword prefix stays an identifier
+    words = 'int bool void return while for ints booleans returned _for For'
+    assert [x.type for x in lex(words)] == [TokType.INT, TokType.BOOL, TokType.VOID, TokType.ReturnStmt, TokType.WHILE,
+                                           TokType.FOR] + [TokType.IDENT] * 5
+
+
+def test_operators():
+    # two character operators win over their prefixes
+    assert [x.type for x in lex('<= < == = != >= >')] == [TokType.LE, TokType.LT, TokType.EQEQ, TokType.EQ, TokType.NE,
+                                                           TokType.GE, TokType.GT]
+
+
+def test_mapped(tmp_path):
+    # a mapped file lexes in place to the same tokens as its text
+    path = tmp_path / 'f.c'
+    path.write_text(SRC)
+    with mapped(str(path)) as s:
+        got = [(x.type, x.pos, x.end, x.line, x.col, x.data) for x in lex(s)]
+    assert got == [(x.type, x.pos, x.end, x.line, x.col, x.data) for x in lex(SRC)]
+
+    # empty files can't be mapped, they read as b''
+    (tmp_path / 'empty.c').write_text('')
+    with mapped(str(tmp_path / 'empty.c')) as s: assert not list(lex(s))
+
+
+def test_mapped_assembly(tmp_path):
+    asm = '.global _start\n_start:\n    MOV X0, #7\n\n    // done\n    RET\n'
+    path = tmp_path / 'f.s'
+    path.write_text(asm)
+    with mapped(str(path)) as s: assert tokenize(s) == tokenize(asm)
@@ -0,0 +1,79 @@
+import struct
+import pytest
+from minicompiler.assembler.tokenizer import tokenize
+from minicompiler.assembler.main import Assembler
+from minicompiler.assembler.macho import Header, Segment, Section, SymtabCmd, EntryPointCmd, Nlist64
+from minicompiler.assembler.macho import LC_SEGMENT_64, LC_SYMTAB, LC_MAIN, N_EXT
+from minicompiler.linker.main import Linker, LinkerError, BASE
+from minicompiler.emulator.main import Emulator
+
+
+# _start calls twice() in the other object, both define their own 'local'
+MAIN = '''
+.global _start
+_start:
+STP X29, X30, [SP, #-16]!
+MOV X0, #5
+BL twice
+BL local
+LDP X29, X30, [SP], #16
+RET
+local:
+ADD X0, X0, #1
+RET
+'''
+
+TWICE = '''
+.global twice
+twice:
+ADD X0, X0, X0
+B local
+local:
+RET
+'''
+
+
+def obj(src: str) -> bytes:
+    return Assembler(tokenize(src)).assemble()
+
+
+def load(exe: bytes) -> tuple[Section, int, list[tuple[str, Nlist64]]]:
+    # (__text section, entry offset, symbols) of an executable
+    h = Header.unpack_from(exe)
+    off = h.bsize()
+    for _ in range(h.ncmds):
+        cmd, size = struct.unpack_from('<II', exe, off)
+        if cmd == LC_SEGMENT_64 and Segment.unpack_from(exe, off).segname == '__TEXT':
+            sect = Section.unpack_from(exe, off + Segment.SIZE)
+        elif cmd == LC_MAIN:
+            entry = EntryPointCmd.unpack_from(exe, off).entryoff
+        elif cmd == LC_SYMTAB:
+            st = SymtabCmd.unpack_from(exe, off)
+            nlist = Nlist64.unpack_array(exe[st.symoff:st.symoff + st.nsyms * Nlist64.SIZE])
+            strtab = exe[st.stroff:st.stroff + st.strsize]
+            syms = [(strtab[x.n_strx:strtab.index(b'\0', x.n_strx)].decode(), x) for x in nlist]
+        off += size
+    return sect, entry, syms
+
+
+def test_link_and_run():
+    exe = Linker([obj(MAIN), obj(TWICE)]).link()
+    sect, entry, syms = load(exe)
+
+    # locals first, each object's 'local' at its own address, then the exported symbols
+    names = [(s, bool(x.n_type & N_EXT), x.n_value - sect.addr) for s, x in syms]
+    # MAIN is 8 instructions, TWICE follows it
+    assert names == [('local', False, 24), ('local', False, 40), ('_start', True, 0), ('twice', True, 32)]
+    assert sect.addr == BASE + sect.offset and entry == sect.offset
+
+    # branches are pc-relative, so __text runs at any address: (5 + 5) + 1
+    assert Emulator(exe[sect.offset:sect.offset + sect.size], entry - sect.offset).run() == 11
+
+
+def test_errors():
+    with pytest.raises(LinkerError, match='duplicate symbol twice in a.o and b.o'):
+        Linker([obj(TWICE), obj(TWICE)], names=['a.o', 'b.o']).link()
+    with pytest.raises(LinkerError, match=r'a.o: .text\+0x8: undefined symbol twice'):
+        Linker([obj(MAIN)], names=['a.o']).link()
+    with pytest.raises(LinkerError, match='entry point _start undefined'):
+        Linker([obj(TWICE)]).link()
@@ -0,0 +1,48 @@
+from dataclasses import fields
+import pytest
+from minicompiler.compiler.lexer import lex
+from minicompiler.compiler.parser import Parser, ParseError
+from minicompiler.compiler.tokens import Tok
+from minicompiler.compiler.tree import FunctionDecl, DeclStmt
+from minicompiler.source import mapped
+
+
+def test_backtracking():
+    # a top level item is tried as a statement first, the failed attempt must not consume anything
+    p = Parser(lex('int f() { return 1; } int x = 1;'))
+    root = p.build()
+    assert [type(x) for x in root.children] == [FunctionDecl, DeclStmt]
+    assert p.pos == len(p.tokens)
+
+    # failures are memoized with the position they leave the cursor at
+    err, pos = p.memo[('_parse_statement', 0)]
+    assert isinstance(err, ParseError) and pos == 0
+    assert isinstance(p.memo[('_parse_declaration', len(p.tokens))][0], ParseError)
+
+
+def test_memo():
+    # each (rule, position) is parsed at most once, a second attempt replays the result and the end position
+    p = Parser(lex('int f() { return 1 + 2; }'))
+    f = p._parse_declaration()
+    end = p.pos
+    p.pos = 0
+    assert p._parse_declaration() is f
+    assert p.pos == end
+
+    # a memoized failure is raised again without reparsing
+    p.pos = 0
+    err = ParseError(0)
+    p.memo[('_parse_statement', 0)] = (err, 0)
+    with pytest.raises(ParseError) as e: p._parse_statement()
+    assert e.value is err and p.pos == 0
+
+
+def test_ast_outlives_mapping(tmp_path):
+    path = tmp_path / 'f.c'
+    path.write_text('int f(int a) { return a; }\nint _start() { int x = f(2); return x; }\n')
+    with mapped(str(path)) as s: root = Parser(lex(s)).build()
+    # nothing in the tree points into the closed mapping
+    nodes = list(root.walk())
+    assert all(not isinstance(v, Tok) for x in nodes for v in (getattr(x, f.name) for f in fields(x)))
+    assert repr(nodes[1]) == "FunctionDecl(rtype='int', ident=f)"
+    assert all(repr(x) for x in nodes)
@@ -0,0 +1,28 @@
+import pytest
+from minicompiler.assembler.tokenizer import tokenize
+from minicompiler.assembler.peephole import optimize
+
+
+# input, expected output, rule hits
+CASES = [
+    ('MOV X1, X1\nMOV X0, #1\nRET', 'MOV X0, #1\nRET', {'self-move': 1}),
+    ('MOV X5, #3\nMOV X0, #1\nRET', 'MOV X0, #1\nRET', {'dead-move': 1}),
+    ('MOV X8, #5\nMOV X9, #6\nMOV X10, #7\nRET', 'RET', {'dead-move': 3}),
+    ('MOV X1, X2\nADD X0, X1, X3\nRET', 'ADD X0, X2, X3\nRET', {'forward-copy': 1}),
+    ('ADD X8, X1, X2\nMOV X0, X8\nRET', 'ADD X0, X1, X2\nRET', {'coalesce-copy': 1}),
+    ('MOV X8, #5\nADD X0, X1, X8\nRET', 'ADD X0, X1, #5\nRET', {'fold-imm': 1}),
+    # one rule's output feeds another in the next pass
+    ('MOV X8, #5\nMOV X9, X8\nADD X0, X1, X9\nRET', 'ADD X0, X1, #5\nRET', {'coalesce-copy': 1, 'fold-imm': 1}),
+    # X1 is read again, the copy stays
+    ('MOV X1, X2\nADD X0, X1, X3\nADD X0, X0, X1\nRET', 'MOV X1, X2\nADD X0, X1, X3\nADD X0, X0, X1\nRET', {}),
+]
+
+
+@pytest.mark.parametrize('src, want, hits', CASES)
+def test_rules(src: str, want: str, hits: dict[str, int]):
+    tokens = tokenize(src)
+    out, counts = optimize(tokens)
+    assert out == tokenize(want)
+    assert dict(counts) == hits
+    # input tokens are not modified
+    assert tokens == tokenize(src)
@@ -0,0 +1,61 @@
+from minicompiler.assembler.tokenizer import tokenize
+from minicompiler.assembler.main import Assembler
+from minicompiler.assembler.macho import parse_reloc_info, ARM64_RELOC_BRANCH26, ARM64_RELOC_PAGE21, ARM64_RELOC_PAGEOFF12
+from minicompiler.assembler.macho import N_SECT, N_UNDF, N_EXT
+from minicompiler.assembler.disasm import disassemble
+from minicompiler.linker.main import read_object, relocate
+
+
+SRC = '''
+.global _start
+_start:
+ADRP X1, data@PAGE
+ADD X1, X1, data@PAGEOFF
+LDR X2, [X1, data@PAGEOFF]
+STR X2, [X1, other@PAGEOFF]
+BL ext
+B _start
+B done
+done:
+RET
+'''
+
+
+def text(words) -> list[str]:
+    return [str(x).split('  ')[0] for x in disassemble(words)]
+
+
+def test_records():
+    o = read_object(Assembler(tokenize(SRC)).assemble())
+
+    # defined locals, defined externals, then the undefined symbols in order of first use
+    assert [(s, x.n_type) for s, x in o.symbols] == [
+        ('done', N_SECT), ('_start', N_SECT | N_EXT), ('data', N_UNDF | N_EXT), ('other', N_UNDF | N_EXT), ('ext', N_UNDF | N_EXT),
+    ]
+
+    # (address, symbol, pcrel, length, extern, type), branches to .global symbols are relocated too
+    relocs = [(r.r_address, *parse_reloc_info(r)) for r in o.relocs]
+    assert relocs == [
+        (0, 2, 1, 2, 1, ARM64_RELOC_PAGE21),
+        (4, 2, 0, 2, 1, ARM64_RELOC_PAGEOFF12),
+        (8, 2, 0, 2, 1, ARM64_RELOC_PAGEOFF12),
+        (12, 3, 0, 2, 1, ARM64_RELOC_PAGEOFF12),
+        (16, 4, 1, 2, 1, ARM64_RELOC_BRANCH26),
+        (20, 1, 1, 2, 1, ARM64_RELOC_BRANCH26),
+    ]
+
+    # relocated fields are left zero, the branch to a local label is resolved here
+    assert text(o.text) == ['ADRP(X1, #0, 0)', 'ADD(X1, X1, #0)', 'LDR(X2, [X1, #0])', 'STR(X2, [X1, #0])', 'BL(#0, 0)', 'B(#0, 0)',
+                            'B(#4, 4)', 'RET()']
+
+    # __text at 0x10000000, data two pages up, loads and stores scale the page offset
+    t = bytearray(o.text)
+    assert not relocate(t, [o], [0], {'_start': 0, 'data': 0x2008, 'other': 0x2010, 'ext': 0x100}, ['t.o'], 0x10000000)
+    assert text(t) == ['ADRP(X1, #2, 2)', 'ADD(X1, X1, #8)', 'LDR(X2, [X1, #8])', 'STR(X2, [X1, #16])', 'BL(#240, 240)', 'B(#-20, -20)',
+                       'B(#4, 4)', 'RET()']
+
+
+def test_unaligned_page_offset():
+    o = read_object(Assembler(tokenize(SRC)).assemble())
+    errors = relocate(bytearray(o.text), [o], [0], {'_start': 0, 'data': 0x2004, 'other': 0x2010, 'ext': 0x100}, ['t.o'], 0)
+    assert errors == ['t.o: .text+0x8: data: unaligned page offset 0x4']
@@ -0,0 +1,49 @@
+import json
+import argparse
+from minicompiler.stats import Stats, add_arguments, from_args, report
+from minicompiler.pipeline import build
+
+
+SRC = 'int _start() { int x = 3; return x + 4; }'
+
+
+def test_counters():
+    st = Stats()
+    o = build(SRC, stats=st)
+    assert list(st.stages) == ['lex', 'parse', 'fold', 'gen_ir', 'optimize', 'codegen', 'encode', 'macho']
+    assert all(x.calls == 1 and x.time > 0 and x.peak == 0 for x in st.stages.values())
+    # 'int _start ( ) { int x = 3 ; return x + 4 ; }', folded down to MOV X0, #7; RET
+    assert st.counters == {
+        'tokens': 16, 'ast_nodes': 10, 'ir_instructions': 2, 'instructions': 2, 'vregs': 1, 'registers': 1, 'spills': 0,
+        'encoded': 2, 'text_bytes': 8, 'symbols': 1, 'relocations': 0, 'object_bytes': len(o),
+    }
+
+    # totals accumulate over runs
+    build(SRC, stats=st)
+    assert st.stages['lex'].calls == 2 and st.counters['tokens'] == 32
+
+
+def test_nested_peaks():
+    st = Stats(memory=True)
+    with st.stage('outer'):
+        with st.stage('inner'): x = bytearray(1 << 20)
+        del x
+    st.close()
+    # the enclosing stage's peak includes the inner one
+    assert st.stages['inner'].peak >= 1 << 20
+    assert st.stages['outer'].peak >= st.stages['inner'].peak
+
+
+def test_report_json(tmp_path):
+    ap = argparse.ArgumentParser()
+    add_arguments(ap)
+    path = tmp_path / 'stats.json'
+    args = ap.parse_args(['--stats', str(path)])
+    st = from_args(args)
+    build(SRC, stats=st)
+    report(st, args)
+    d = json.loads(path.read_text())
+    assert d['counters']['encoded'] == 2 and d['stages']['parse']['calls'] == 1
+
+    # no flags, no Stats
+    assert from_args(ap.parse_args([])) is None